@@ -0,0 +1,10 @@
+# Mode ASGI : les routes qui attendent Gemini sont servies en asynchrone,
+# le reste de l'application Flask est inchangé (voir chatbot_app/asgi.py).
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 2
+from dotenv import load_dotenv
+load_dotenv()
+from chatbot_app import create_app
+from chatbot_app.asgi import AsyncRAGApp
+
+app = AsyncRAGApp(create_app())
@@ -0,0 +1,162 @@
+"""
+Qualité et coût de la recherche selon RAG_RETRIEVAL (voir
+chatbot_app/retrieval.py) : 'vector', 'hybrid' et 'lexical_first'.
+
+Les questions de retrieval_questions.json sont annotées avec le ou les
+fichiers de la base de connaissances qui contiennent la réponse. Pour
+chaque mode on mesure :
+- hit@1 et rappel@k : un chunk du bon fichier en tête / parmi les k retenus ;
+- MRR : moyenne de 1 / rang du premier chunk du bon fichier ;
+- le nombre d'appels à l'API d'embedding (évités par 'lexical_first') ;
+- la latence de la recherche, embedding compris (p50/p95) ;
+- la taille du contexte avant et après ContextAssembler (chevauchements,
+  doublons, budget RAG_CONTEXT_MAX_TOKENS, voir chatbot_app/context.py), et
+  le rappel une fois le contexte assemblé.
+
+    python benchmarks/retrieval.py
+    python benchmarks/retrieval.py --embeddings fake --embedding-latency lognormal:0.15,0.4
+    python benchmarks/retrieval.py --output retrieval.json
+
+Par défaut les embeddings sont ceux de l'application (Gemini : il faut une
+clé d'API). Avec --embeddings fake (hors ligne), les vecteurs sont des
+hachages de mots : la qualité du mode 'vector' n'est alors pas
+représentative, seuls le nombre d'appels et les latences le sont.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_questions.json")
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class CountingEmbeddings:
+    """Compte les appels à embed_query() de l'embedding enveloppé."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.embeddings.embed_query(text)
+
+
+def evaluate(vector_store, embeddings, questions, mode, k):
+    from chatbot_app.context import ContextAssembler
+    from chatbot_app.retrieval import HybridRetriever
+
+    assembler = ContextAssembler.from_env()
+    retriever = HybridRetriever.from_env(k=k)
+    retriever.mode = mode
+    counting = CountingEmbeddings(embeddings)
+    hits_at_1 = hits_at_k = reciprocal_ranks = context_hits = 0.0
+    latencies = []
+    misses = []
+    for item in questions:
+        start = time.perf_counter()
+        lexical = retriever.lexical(vector_store, item['question'])
+        query_vector = None if lexical and lexical.decisive else counting.embed_query(item['question'])
+        docs = retriever.search(vector_store, query_vector, lexical)
+        latencies.append(time.perf_counter() - start)
+        context, _ = assembler.assemble(item['question'], docs)
+        context_hits += any(os.path.basename(doc.metadata.get('source', '')) in item['sources'] for doc in context)
+
+        sources = [os.path.basename(doc.metadata.get('source', '')) for doc in docs]
+        rank = next((i for i, source in enumerate(sources, start=1) if source in item['sources']), None)
+        if rank is None:
+            misses.append(item['question'])
+            continue
+        hits_at_1 += rank == 1
+        hits_at_k += 1
+        reciprocal_ranks += 1.0 / rank
+
+    count = len(questions)
+    return {
+        'mode': mode,
+        'questions': count,
+        'hit_at_1': hits_at_1 / count,
+        f'recall_at_{k}': hits_at_k / count,
+        'mrr': reciprocal_ranks / count,
+        'embedding_calls': counting.calls,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'context_recall': context_hits / count,
+        'context_chars_in': assembler.stats['chars_in'] / count,
+        'context_chars_out': assembler.stats['chars_out'] / count,
+        'misses': misses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', default=QUESTIONS_FILE, help="questions annotées (JSON)")
+    parser.add_argument('--knowledge-base', default=os.path.join(ROOT, "chatbot_app", "knowledge_base"))
+    parser.add_argument('--modes', nargs='+', default=['vector', 'hybrid', 'lexical_first'],
+                        choices=['vector', 'hybrid', 'lexical_first'])
+    parser.add_argument('-k', type=int, default=4, help="chunks retenus par question (retriever_k)")
+    parser.add_argument('--chunk-size', type=int, default=1200)
+    parser.add_argument('--chunk-overlap', type=int, default=150)
+    parser.add_argument('--embeddings', choices=['google', 'fake'], help="backend (défaut : RAG_EMBEDDINGS)")
+    parser.add_argument('--embedding-latency', help="latence simulée des embeddings 'fake'")
+    parser.add_argument('--output', help="fichier JSON des résultats")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        os.environ['RAG_EMBEDDINGS'] = args.embeddings
+    if args.embedding_latency:
+        os.environ['RAG_FAKE_EMBEDDING_LATENCY'] = args.embedding_latency
+
+    from chatbot_app.backends import get_embeddings
+    from chatbot_app.indexer import KnowledgeBaseIndexer
+    from chatbot_app.store import load_store
+
+    with open(args.questions, encoding='utf-8') as f:
+        questions = json.load(f)
+
+    embeddings = get_embeddings()
+    index_dir = tempfile.mkdtemp(prefix='bench-retrieval-')
+    try:
+        # L'index est construit avant toute mesure : ses embeddings ne
+        # comptent pas dans les appels.
+        KnowledgeBaseIndexer(args.knowledge_base, index_dir, embeddings,
+                             chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap).update(full=True)
+        vector_store = load_store(index_dir, embeddings)
+        try:
+            results = [evaluate(vector_store, embeddings, questions, mode, args.k) for mode in args.modes]
+        finally:
+            vector_store.docstore.close()
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    print(f"{len(questions)} questions, {len(vector_store.index_to_docstore_id)} chunks, k={args.k}")
+    print(f"{'mode':<14} {'hit@1':>6} {'rappel@k':>9} {'MRR':>6} {'embeddings':>11} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'contexte (car.)':>17} {'rappel ctx':>11}")
+    for result in results:
+        print(f"{result['mode']:<14} {result['hit_at_1']:6.2f} {result[f'recall_at_{args.k}']:9.2f} "
+              f"{result['mrr']:6.2f} {result['embedding_calls']:11d} {result['p50_ms']:8.1f} {result['p95_ms']:8.1f} "
+              f"{result['context_chars_in']:8.0f} -> {result['context_chars_out']:5.0f} {result['context_recall']:11.2f}")
+    for result in results:
+        for question in result['misses']:
+            print(f"  manqué ({result['mode']}) : {question}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
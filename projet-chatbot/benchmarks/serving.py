@@ -0,0 +1,212 @@
+"""
+Compare le mode WSGI actuel (gunicorn, wsgi:app) et le mode ASGI (uvicorn,
+asgi:app) sur /api/ask, à nombre de processus égal.
+
+Tout est local : embeddings et LLM simulés (RAG_EMBEDDINGS=fake,
+RAG_LLM=fake), le LLM répondant après --latency secondes comme Gemini.
+Le cache de réponses est désactivé et chaque question est unique, chaque
+requête attend donc réellement le LLM.
+
+    python benchmarks/serving.py
+    python benchmarks/serving.py --concurrency 10 50 200 --latency 1.0 --workers 2
+    python benchmarks/serving.py --servers uvicorn --json resultats.json
+
+Pour chaque serveur et chaque niveau de concurrence : requêtes/seconde,
+latences p50/p95, erreurs, mémoire (RSS de tous les processus du serveur)
+au repos et en pointe, et mémoire supplémentaire par requête simultanée.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def build_index(index_dir):
+    """Construit une fois l'index avec les embeddings simulés, partagé par les serveurs."""
+    from chatbot_app.backends import get_embeddings
+    from chatbot_app.indexer import KnowledgeBaseIndexer
+    KnowledgeBaseIndexer(os.path.join(ROOT, "chatbot_app", "knowledge_base"), index_dir, get_embeddings()).update(full=True)
+
+
+def server_command(server, port, args):
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', 'wsgi:app', '-c', 'gunicorn.conf.py',
+                '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers), '--threads', str(args.threads)]
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(args.workers), '--log-level', 'warning']
+
+
+def tree_rss(process):
+    """RSS cumulée du processus et de ses enfants (workers), en Mo."""
+    total = 0
+    for proc in [process] + process.children(recursive=True):
+        try:
+            total += proc.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return total / (1024 * 1024)
+
+
+def wait_ready(url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"ERREUR: le serveur s'est arrêté (code {process.returncode}), relancer avec --verbose")
+        try:
+            if httpx.get(url + '/readyz', timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"ERREUR: le serveur {url} n'est pas prêt après {timeout} s")
+
+
+async def load(url, concurrency, total):
+    """Envoie 'total' questions avec 'concurrency' requêtes en vol. Renvoie (latences, erreurs, durée)."""
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=300) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                question = f"Question {i} {time.monotonic_ns()} : quels sont les frais d'inscription ?"
+                start = time.perf_counter()
+                try:
+                    response = await client.post('/api/ask', json={'question': question})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_server(server, args, env):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    process = subprocess.Popen(server_command(server, port, args), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+    results = []
+    try:
+        wait_ready(url, process)
+        ps_process = psutil.Process(process.pid)
+        # Quelques requêtes de chauffe : la mémoire "au repos" est mesurée
+        # une fois les workers initialisés.
+        asyncio.run(load(url, args.workers, args.workers * 4))
+        for concurrency in args.concurrency:
+            idle_mb = tree_rss(ps_process)
+
+            # Échantillonnage de la mémoire pendant la charge.
+            peak = [idle_mb]
+            stop = threading.Event()
+
+            def sample():
+                while not stop.wait(0.1):
+                    peak[0] = max(peak[0], tree_rss(ps_process))
+
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+            latencies, errors, elapsed = asyncio.run(load(url, concurrency, concurrency * args.rounds))
+            stop.set()
+            sampler.join()
+
+            result = {
+                'server': server,
+                'concurrency': concurrency,
+                'requests': len(latencies),
+                'errors': errors,
+                'rps': len(latencies) / elapsed if elapsed else 0.0,
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+                'idle_mb': idle_mb,
+                'peak_mb': peak[0],
+                'mb_per_concurrent_request': (peak[0] - idle_mb) / concurrency,
+            }
+            results.append(result)
+            print(f"{server:9} c={concurrency:<4} {result['rps']:8.1f} req/s  p50={result['p50']:6.2f}s  "
+                  f"p95={result['p95']:6.2f}s  erreurs={errors:<4} RSS {idle_mb:6.0f} -> {peak[0]:6.0f} Mo  "
+                  f"({result['mb_per_concurrent_request']:.2f} Mo/requête)")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gunicorn (WSGI) contre uvicorn (ASGI) sur /api/ask")
+    parser.add_argument('--servers', nargs='+', choices=['gunicorn', 'uvicorn'], default=['gunicorn', 'uvicorn'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[10, 50, 200])
+    parser.add_argument('--rounds', type=int, default=3, help="requêtes envoyées = concurrence x rounds")
+    parser.add_argument('--latency', default='1.0',
+                        help="latence simulée du LLM : secondes ou distribution ('lognormal:0.8,0.5'...)")
+    parser.add_argument('--workers', type=int, default=2, help="processus par serveur")
+    parser.add_argument('--threads', type=int, default=1, help="threads par worker gunicorn")
+    parser.add_argument('--json', help="écrit les résultats dans ce fichier")
+    parser.add_argument('--verbose', action='store_true', help="affiche la sortie d'erreur des serveurs")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench-serving-')
+    env = dict(
+        os.environ,
+        RAG_EMBEDDINGS='fake',
+        RAG_LLM='fake',
+        RAG_FAKE_LLM_LATENCY=args.latency,
+        RAG_INDEX_DIR=os.path.join(work_dir, 'db_faiss'),
+        RAG_CACHE_MAX_ENTRIES='0',
+        RAG_STARTUP='eager',
+        MAIL_OUTBOX_SENDER='off',
+        PYTHONUNBUFFERED='1',
+    )
+    env.pop('DATABASE_URL', None)
+    os.environ.update(RAG_EMBEDDINGS='fake', RAG_INDEX_DIR=env['RAG_INDEX_DIR'])
+
+    try:
+        build_index(env['RAG_INDEX_DIR'])
+        results = []
+        for server in args.servers:
+            results.extend(run_server(server, args, env))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'latency': args.latency, 'workers': args.workers, 'threads': args.threads,
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""
+Benchmarks hors ligne de l'application : aucun appel réseau, embeddings et
+LLM simulés (RAG_EMBEDDINGS=fake, RAG_LLM=fake) avec des latences tirées
+de distributions configurables (voir backends.LatencyDistribution).
+
+1. HTTP : /api/ask, /send_message, /chat/<id> et /main.profile sont appelés
+   à travers l'application Flask (client de test, un par thread), avec une
+   base SQLite temporaire pré-remplie. Débit et latences p50/p95/p99.
+2. Index : construction (KnowledgeBaseIndexer), chargement (store.load_store)
+   et première recherche pour des bases de connaissances synthétiques de 10,
+   10 000 et 100 000 chunks.
+
+    python benchmarks/suite.py --output resultats.json
+    python benchmarks/suite.py --quick
+    python benchmarks/suite.py --llm-latency lognormal:0.8,0.5 --concurrency 16
+    python benchmarks/suite.py --compare ancien.json --output nouveau.json
+
+Avec --compare, les résultats sont comparés à un fichier précédent : toute
+métrique dégradée de plus de --tolerance (10 % par défaut) est signalée et
+le script se termine avec le code 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = ("université inscription frais académiques faculté droit médecine économie théologie informatique "
+         "étudiant dossier diplôme session examen bibliothèque campus paiement tranche banque reçu "
+         "horaire cours auditoire secrétariat recteur doyen bourse logement transport stage mémoire").split()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(latencies, errors, elapsed):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+# --- Benchmarks HTTP ---
+
+def seed_database(app, conversations, messages_per_conversation):
+    """Un utilisateur avec son historique ; renvoie (user_id, [conversation_ids])."""
+    from sqlalchemy import insert
+    from chatbot_app import db
+    from chatbot_app.models import Conversation, Message, User
+
+    with app.app_context():
+        user = User(nom='Bench', postnom='Mark', prenom='Test', email='bench@example.com', email_confirmed=True)
+        user.set_password('benchmark')
+        db.session.add(user)
+        db.session.commit()
+        conversation_ids = []
+        for i in range(conversations):
+            conversation = Conversation(user_id=user.id, title=f"Conversation {i}")
+            db.session.add(conversation)
+            db.session.flush()
+            conversation_ids.append(conversation.id)
+            db.session.execute(insert(Message), [
+                {'conversation_id': conversation.id, 'is_user': n % 2 == 0,
+                 'content': ' '.join(random.choices(WORDS, k=40))}
+                for n in range(messages_per_conversation)
+            ])
+        db.session.commit()
+        return user.id, conversation_ids
+
+
+def succeeded(client, response):
+    # /send_message redirige vers la conversation, y compris après une erreur
+    # du LLM ou un refus (429) : seul le message flashé signale alors l'échec.
+    # Toute autre redirection (page de connexion, accueil) est un échec.
+    if response.status_code == 302:
+        with client.session_transaction() as session:
+            flashes = session.pop('_flashes', [])
+        return ('/chat/' in response.headers.get('Location', '')
+                and not any(category in ('error', 'warning') for category, _ in flashes))
+    return response.status_code < 300
+
+
+def run_scenario(app, user_id, make_request, concurrency, total):
+    """
+    Envoie 'total' requêtes depuis 'concurrency' threads, chacun avec son
+    client de test connecté. make_request(client, i) renvoie la réponse.
+    """
+    latencies = []
+    errors = [0]
+    counter = iter(range(total))
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            response = make_request(client, i)
+            elapsed = time.perf_counter() - start
+            ok = succeeded(client, response)
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - start)
+
+
+def http_benchmarks(args, work_dir):
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(work_dir, 'bench.sqlite3')}",
+        RAG_INDEX_DIR=os.path.join(work_dir, 'db_faiss'),
+        RAG_STARTUP='eager',
+        # Questions uniques et cache désactivé : chaque /api/ask va jusqu'au LLM.
+        RAG_CACHE_MAX_ENTRIES='0',
+        MAIL_OUTBOX_SENDER='off',
+        RAG_LOG_SAMPLE_RATE='0',
+        # Pas de mise à jour du résumé en arrière-plan : ses appels au LLM
+        # s'ajouteraient aux temps de /send_message, et ses threads
+        # écriraient encore dans la base après la suppression de work_dir.
+        RAG_HISTORY_SUMMARY='off',
+    )
+    from chatbot_app import create_app
+
+    app = create_app()
+    user_id, conversation_ids = seed_database(app, args.conversations, args.messages)
+
+    scenarios = {
+        'api_ask': lambda client, i: client.post('/api/ask', json={'question': f"Question {i} : quels sont les frais ?"}),
+        'send_message': lambda client, i: client.post('/send_message', data={
+            'conversation_id': conversation_ids[i % len(conversation_ids)], 'message': f"Message {i} sur les frais"}),
+        'chat': lambda client, i: client.get(f"/chat/{conversation_ids[i % len(conversation_ids)]}"),
+        'profile': lambda client, i: client.get('/main.profile'),
+    }
+    results = {}
+    for name in args.scenarios:
+        results[name] = run_scenario(app, user_id, scenarios[name], args.concurrency, args.requests)
+        r = results[name]
+        print(f"{name:13} {r['throughput']:8.1f} req/s  p50={r['p50'] * 1000:7.1f} ms  p95={r['p95'] * 1000:7.1f} ms  "
+              f"p99={r['p99'] * 1000:7.1f} ms  erreurs={r['errors']}")
+    return results
+
+
+# --- Benchmarks d'index ---
+
+def synthetic_knowledge_base(directory, chunks, files=10):
+    """
+    Écrit 'chunks' paragraphes d'environ 1 000 caractères, séparés par des
+    lignes vides : avec le découpage par défaut (1 200 caractères), chaque
+    paragraphe donne un chunk.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(chunks)
+    handles = [open(os.path.join(directory, f"doc_{n:03d}.txt"), 'w', encoding='utf-8') for n in range(files)]
+    try:
+        for i in range(chunks):
+            paragraph = f"Paragraphe {i}. " + ' '.join(rng.choices(WORDS, k=110))
+            handles[i % files].write(paragraph[:1000] + "\n\n")
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(dirpath, name))
+               for dirpath, _, names in os.walk(path) for name in names)
+
+
+def index_benchmarks(args, work_dir):
+    from chatbot_app.backends import get_embeddings
+    from chatbot_app.indexer import KnowledgeBaseIndexer
+    from chatbot_app.store import load_store
+
+    embeddings = get_embeddings()
+    results = []
+    for size in args.index_sizes:
+        kb_dir = os.path.join(work_dir, f"kb_{size}")
+        index_dir = os.path.join(work_dir, f"index_{size}")
+        synthetic_knowledge_base(kb_dir, size)
+
+        start = time.perf_counter()
+        report = KnowledgeBaseIndexer(kb_dir, index_dir, embeddings).update(full=True)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vector_store = load_store(index_dir, embeddings)
+        load = time.perf_counter() - start
+        # Le texte des chunks n'est lu qu'à la recherche : la première
+        # recherche fait donc partie du coût de démarrage.
+        start = time.perf_counter()
+        vector_store.similarity_search("frais d'inscription", k=4)
+        first_query = time.perf_counter() - start
+        vector_store.docstore.close()
+
+        result = {
+            'chunks': size,
+            'indexed': report['added'],
+            'build_seconds': build,
+            'load_seconds': load,
+            'first_query_seconds': first_query,
+            'index_mb': directory_size(index_dir) / (1024 * 1024),
+        }
+        results.append(result)
+        print(f"index {size:>7} chunks  construction {build:8.2f} s  chargement {load:7.3f} s  "
+              f"1re recherche {first_query:7.3f} s  "
+              f"{result['index_mb']:7.1f} Mo")
+        shutil.rmtree(kb_dir, ignore_errors=True)
+        shutil.rmtree(index_dir, ignore_errors=True)
+    return results
+
+
+# --- Comparaison ---
+
+# Pour chaque métrique : True si une valeur plus grande est meilleure.
+HTTP_METRICS = {'throughput': True, 'p50': False, 'p95': False, 'p99': False}
+INDEX_METRICS = {'build_seconds': False, 'load_seconds': False, 'first_query_seconds': False}
+
+
+def compare(baseline, current, tolerance):
+    """Affiche les écarts avec une exécution précédente ; renvoie la liste des régressions."""
+    regressions = []
+
+    def check(label, old, new, higher_is_better):
+        if not old:
+            return
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "  <-- RÉGRESSION" if worse > tolerance else ""
+        print(f"  {label:40} {old:12.4f} -> {new:12.4f}  ({change:+.1%}){flag}")
+        if flag:
+            regressions.append(label)
+
+    for name, result in current.get('http', {}).items():
+        old = baseline.get('http', {}).get(name)
+        if old:
+            for metric, higher_is_better in HTTP_METRICS.items():
+                check(f"http.{name}.{metric}", old[metric], result[metric], higher_is_better)
+    old_index = {entry['chunks']: entry for entry in baseline.get('index', [])}
+    for result in current.get('index', []):
+        old = old_index.get(result['chunks'])
+        if old:
+            for metric, higher_is_better in INDEX_METRICS.items():
+                check(f"index.{result['chunks']}.{metric}", old[metric], result[metric], higher_is_better)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks hors ligne (HTTP et index)")
+    parser.add_argument('--scenarios', nargs='+', choices=['api_ask', 'send_message', 'chat', 'profile'],
+                        default=['api_ask', 'send_message', 'chat', 'profile'])
+    parser.add_argument('--concurrency', type=int, default=8, help="threads clients")
+    parser.add_argument('--requests', type=int, default=200, help="requêtes par scénario")
+    parser.add_argument('--conversations', type=int, default=50, help="conversations pré-remplies")
+    parser.add_argument('--messages', type=int, default=60, help="messages par conversation")
+    parser.add_argument('--llm-latency', default='lognormal:0.05,0.5',
+                        help="latence simulée du LLM (secondes ou distribution, voir LatencyDistribution)")
+    parser.add_argument('--embedding-latency', default='0', help="latence simulée des embeddings")
+    parser.add_argument('--index-sizes', nargs='*', type=int, default=[10, 10000, 100000])
+    parser.add_argument('--quick', action='store_true', help="petite exécution : 50 requêtes, index de 10 et 1 000 chunks")
+    parser.add_argument('--skip-http', action='store_true')
+    parser.add_argument('--skip-index', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="fichier JSON des résultats")
+    parser.add_argument('--compare', help="fichier JSON d'une exécution précédente")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="dégradation tolérée (0.10 = 10 %%)")
+    args = parser.parse_args()
+    if args.quick:
+        args.requests = min(args.requests, 50)
+        args.index_sizes = [10, 1000]
+
+    random.seed(args.seed)
+    os.environ.update(
+        RAG_EMBEDDINGS='fake',
+        RAG_LLM='fake',
+        RAG_FAKE_LLM_LATENCY=args.llm_latency,
+        RAG_FAKE_EMBEDDING_LATENCY=args.embedding_latency,
+        RAG_FAKE_SEED=str(args.seed),
+    )
+
+    work_dir = tempfile.mkdtemp(prefix='bench-suite-')
+    results = {
+        'meta': {
+            'date': datetime.utcnow().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+    }
+    try:
+        if not args.skip_http:
+            results['http'] = http_benchmarks(args, work_dir)
+        if not args.skip_index:
+            results['index'] = index_benchmarks(args, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"Comparaison avec {args.compare} (révision {baseline.get('meta', {}).get('revision')}) :")
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} régression(s) au-delà de {args.tolerance:.0%}.")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,3 +3,9 @@ set -o errexit
 
 pip install --upgrade pip
 pip install -r requirements.txt
+python build_assets.py
+# Schéma de la base : db.create_all() crée les tables manquantes mais n'ajoute
+# jamais de colonne ni d'index à une table existante. Les migrations sont
+# idempotentes : sans effet sur une base déjà à jour ou créée par create_all().
+# RAG_STARTUP=lazy : pas de chargement de l'index pendant le build.
+RAG_STARTUP=lazy flask --app wsgi db upgrade
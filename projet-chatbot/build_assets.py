@@ -0,0 +1,35 @@
+"""
+Construit chatbot_app/static_build/ : copie des fichiers de chatbot_app/static
+sous des noms avec empreinte de contenu, avec leurs variantes précompressées
+(.gz, et .br si le paquet brotli est installé). Voir chatbot_app/assets.py.
+
+    python build_assets.py
+
+À relancer après toute modification de static/ (build.sh le fait au
+déploiement) ; les workers lisent le manifeste à leur démarrage.
+"""
+import os
+
+from chatbot_app.assets import BUILD_DIRNAME, build_assets
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot_app")
+
+
+def main():
+    static_dir = os.path.join(APP_DIR, "static")
+    build_dir = os.path.join(APP_DIR, BUILD_DIRNAME)
+    files = build_assets(static_dir, build_dir)
+    original = compressed = 0
+    for path, entry in sorted(files.items()):
+        size = os.path.getsize(os.path.join(build_dir, entry['path']))
+        variants = {encoding: os.path.getsize(os.path.join(build_dir, entry['path'] + suffix))
+                    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')) if encoding in entry['encodings']}
+        original += size
+        compressed += min(variants.values(), default=size)
+        detail = ', '.join(f"{encoding} {variant} o" for encoding, variant in variants.items())
+        print(f"{path} -> {entry['path']} ({size} o{', ' + detail if detail else ''})")
+    print(f"{len(files)} fichiers, {original} o ({compressed} o compressés) dans {build_dir}")
+
+
+if __name__ == '__main__':
+    main()
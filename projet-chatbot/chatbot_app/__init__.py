@@ -1,23 +1,86 @@
+import logging
 import os
+import threading
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_mail import Mail
+from flask_migrate import Migrate
 
 # On crée les objets d'extension ici. Ils sont "vides" et seront
 # liés à l'application dans la fonction factory.
 db = SQLAlchemy()
 mail = Mail()
-rag_service = None # Sera initialisé une seule fois
+migrate = Migrate()
+
+# Le RAGService (langchain, FAISS, Gemini) est lourd à importer et à charger :
+# il n'est construit qu'à la première utilisation, ou en tâche de fond au
+# démarrage, selon RAG_STARTUP :
+# - 'background' (défaut) : chargement dans un thread dès create_app() ;
+# - 'lazy' : chargement à la première question ;
+# - 'eager' : chargement bloquant dans create_app(). C'est le mode utilisé
+#   avec le preload de gunicorn (voir gunicorn.conf.py) : l'index est chargé
+#   une fois dans le master et partagé copy-on-write par les workers.
+# NB : la variable ne s'appelle pas 'rag_service' pour ne pas être écrasée
+# par l'import du sous-module chatbot_app.rag_service.
+_rag_service = None
+_rag_lock = threading.Lock()
+_rag_state = {'status': 'not_started', 'error': None}
+
+
+def get_rag_service():
+    """Renvoie le RAGService, en le construisant au premier appel (une seule fois par processus)."""
+    global _rag_service
+    if _rag_service is None:
+        with _rag_lock:
+            if _rag_service is None:
+                _rag_state['status'] = 'loading'
+                print("INFO: Initialisation du RAGService...")
+                try:
+                    from .rag_service import RAGService
+                    _rag_service = RAGService()
+                except Exception as e:
+                    _rag_state.update(status='error', error=str(e))
+                    raise
+                _rag_state.update(status='ready', error=None)
+                print("INFO: RAGService prêt.")
+    return _rag_service
+
+
+def rag_status():
+    """État du RAGService : 'not_started', 'loading', 'ready' ou 'error'."""
+    return dict(_rag_state)
+
+
+def after_fork():
+    """
+    Appelé par gunicorn dans chaque worker, juste après le fork (voir
+    post_fork dans gunicorn.conf.py). Les connexions SQLite ouvertes par le
+    master (docstore de l'index, store de coalescing) ne doivent pas être
+    réutilisées après fork() : le worker ouvre les siennes.
+    """
+    if _rag_service is not None:
+        _rag_service.after_fork()
+
+
+def _warm_up_rag_service():
+    try:
+        get_rag_service()
+    except Exception as e:
+        print(f"ERREUR: Échec de l'initialisation du RAGService : {e}")
+
 
 def create_app():
     """
     Crée et configure l'instance principale de l'application Flask.
     C'est le modèle "Application Factory".
     """
-    global rag_service
-    
     app = Flask(__name__, instance_relative_config=True)
+
+    # Logs : les autres bibliothèques restent en WARNING, ceux de l'application
+    # (dont les logs échantillonnés du RAGService, voir metrics.py) en INFO.
+    logging.basicConfig()
+    logging.getLogger(__name__).setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
     
     # --- 1. CONFIGURATION ---
     # On définit les configurations par défaut et on charge les secrets
@@ -25,13 +88,32 @@ def create_app():
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'une-cle-secrete-par-defaut-pour-le-developpement'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
-        # Configuration pour Flask-Mail
-        MAIL_SERVER='smtp.gmail.com',
-        MAIL_PORT=587,
-        MAIL_USE_TLS=True,
+        # Configuration pour Flask-Mail. En local, on peut pointer vers un
+        # serveur SMTP de test, par exemple :
+        #   python -m aiosmtpd -n -l localhost:1025
+        #   (ou python -m smtpd -n -c DebuggingServer localhost:1025 jusqu'à Python 3.11)
+        #   MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=0
+        MAIL_SERVER=os.environ.get('MAIL_SERVER', 'smtp.gmail.com'),
+        MAIL_PORT=int(os.environ.get('MAIL_PORT', 587)),
+        MAIL_USE_TLS=os.environ.get('MAIL_USE_TLS', '1') == '1',
         MAIL_USERNAME=os.environ.get('MAIL_USERNAME'),
         MAIL_PASSWORD=os.environ.get('MAIL_PASSWORD'),
-        MAIL_DEFAULT_SENDER=os.environ.get('MAIL_USERNAME')
+        MAIL_DEFAULT_SENDER=os.environ.get('MAIL_DEFAULT_SENDER', os.environ.get('MAIL_USERNAME')),
+        # File d'envoi des emails (voir mailer.py) : 'thread' = un sender en
+        # arrière-plan dans chaque worker ; 'off' = envoi par un processus
+        # dédié (flask --app wsgi outbox run).
+        MAIL_OUTBOX_SENDER=os.environ.get('MAIL_OUTBOX_SENDER', 'thread'),
+        MAIL_OUTBOX_BATCH_SIZE=int(os.environ.get('MAIL_OUTBOX_BATCH_SIZE', 20)),
+        MAIL_OUTBOX_POLL_INTERVAL=float(os.environ.get('MAIL_OUTBOX_POLL_INTERVAL', 5)),
+        MAIL_OUTBOX_MAX_ATTEMPTS=int(os.environ.get('MAIL_OUTBOX_MAX_ATTEMPTS', 5)),
+        MAIL_OUTBOX_RETRY_DELAY=float(os.environ.get('MAIL_OUTBOX_RETRY_DELAY', 30)),
+        # Jetons d'accès de l'API (voir auth.py) : signés avec JWT_SECRET_KEY,
+        # à défaut SECRET_KEY, et valables JWT_ACCESS_TOKEN_TTL secondes.
+        JWT_SECRET_KEY=os.environ.get('JWT_SECRET_KEY'),
+        JWT_ACCESS_TOKEN_TTL=int(os.environ.get('JWT_ACCESS_TOKEN_TTL', 3600)),
+        # Cache des identités des utilisateurs connectés (voir auth.py).
+        IDENTITY_CACHE_SIZE=int(os.environ.get('IDENTITY_CACHE_SIZE', 1024)),
+        IDENTITY_CACHE_TTL=float(os.environ.get('IDENTITY_CACHE_TTL', 60)),
     )
     
     # --- 2. CONFIGURATION DE LA BASE DE DONNÉES (Adaptative) ---
@@ -44,6 +126,18 @@ def create_app():
         if database_url.startswith("postgres://"):
             database_url = database_url.replace("postgres://", "postgresql://", 1)
         app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+        # Pool de connexions dimensionné explicitement. Les routes ne gardent
+        # aucune connexion pendant les appels au LLM (voir send_message), un
+        # petit pool suffit donc même avec beaucoup de requêtes simultanées.
+        # pool_pre_ping écarte les connexions coupées par PostgreSQL ou le
+        # réseau, pool_recycle les renouvelle avant les timeouts côté serveur.
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 300)),
+            'pool_pre_ping': True,
+        }
     else:
         # Environnement de développement (votre PC)
         print("INFO: Pas de DATABASE_URL. Utilisation de SQLite en local.")
@@ -54,30 +148,47 @@ def create_app():
     # --- 3. INITIALISATION DES EXTENSIONS ---
     # On lie les extensions (db, mail, etc.) à notre application configurée.
     db.init_app(app)
+    migrate.init_app(app, db)
     mail.init_app(app)
     CORS(app)
     
     # --- 4. INITIALISATION DU SERVICE RAG ---
-    # On ne l'initialise qu'une seule fois pour toute la durée de vie de l'application.
-    if rag_service is None:
-        print("INFO: Initialisation du RAGService...")
-        from .rag_service import RAGService
-        rag_service = RAGService()
-        print("INFO: RAGService prêt.")
+    # Les routes y accèdent via get_rag_service() ; voir RAG_STARTUP plus haut.
+    startup_mode = os.environ.get('RAG_STARTUP', 'background')
+    if startup_mode == 'eager':
+        get_rag_service()
+    elif startup_mode == 'background' and _rag_service is None:
+        threading.Thread(target=_warm_up_rag_service, name="rag-warmup", daemon=True).start()
     
     # --- 5. ENREGISTREMENT DES ROUTES ET CRÉATION DE LA DB ---
     with app.app_context():
         # On importe les routes et modèles ici pour éviter les imports circulaires.
         from . import routes
         from . import models
+        from . import auth
+        from . import assets
+        from . import archive
+        from . import mailer
+        from . import metrics
+        from . import reloader
 
         # On attache le Blueprint des routes à l'application.
         app.register_blueprint(routes.main_bp)
+        auth.init_app(app)
+        assets.init_app(app)
+        archive.init_app(app)
+        mailer.init_app(app)
+        metrics.init_app(app)
+        reloader.init_app(app)
         
         # Crée toutes les tables définies dans models.py si elles n'existent pas.
         print("INFO: Création des tables de la base de données si nécessaire...")
         db.create_all()
         print("INFO: Tables prêtes.")
+
+        # Avec le preload de gunicorn, create_app() tourne dans le master : on
+        # ferme ses connexions pour que les workers n'héritent pas des sockets.
+        db.engine.dispose()
         
     print("INFO: Application créée et configurée avec succès.")
     return app
@@ -0,0 +1,248 @@
+# Fichier: chatbot_app/admission.py
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+from .metrics import observe_stage
+
+
+class Overloaded(Exception):
+    """Requête refusée par le contrôle d'admission : à renvoyer en 429 avec Retry-After."""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(f"Service surchargé ({reason}), réessayer dans {retry_after} s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ('client', 'event', 'loop', 'future', 'granted')
+
+    def __init__(self, client, loop=None):
+        self.client = client
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Limite le nombre d'appels simultanés à Gemini (RAG_MAX_CONCURRENT) pour
+    rester sous les quotas de l'API pendant les pics d'inscription.
+
+    Au-delà, les requêtes attendent dans une file bornée, servie à tour de
+    rôle par client (utilisateur connecté, ou adresse IP pour l'API) : un
+    client qui envoie beaucoup de questions n'attend que derrière lui-même.
+    Une requête est refusée tout de suite (Overloaded -> 429 + Retry-After)
+    si la file est pleine, si son client a déjà RAG_QUEUE_PER_CLIENT
+    questions en attente, ou si l'attente estimée dépasse l'objectif de
+    latence RAG_QUEUE_SLO ; elle l'est aussi si elle attend plus longtemps.
+
+    L'attente estimée est (rang dans la file / nombre de places) x durée
+    moyenne d'un appel (moyenne mobile exponentielle des appels terminés).
+    Utilisable depuis des threads (slot) comme depuis asyncio (aslot).
+
+    Les limites passées au constructeur s'appliquent à un processus ; voir
+    from_env() pour leur répartition entre les workers.
+    """
+
+    def __init__(self, max_concurrent=8, max_queue=64, max_queue_per_client=4, slo=10.0, service_time=2.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.slo = slo
+        self.service_time = service_time
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queues = OrderedDict()      # client -> deque de _Waiter ; l'ordre est celui du tour de rôle
+        self._queued = 0
+        self.stats = {'admitted': 0, 'queued': 0, 'rejected': 0, 'timeouts': 0,
+                      'wait_total': 0.0, 'wait_max': 0.0}
+
+    @classmethod
+    def from_env(cls):
+        """
+        RAG_MAX_CONCURRENT et RAG_QUEUE_MAX sont des totaux pour le serveur :
+        chaque worker n'en reçoit qu'une part, WEB_CONCURRENCY étant le
+        nombre de workers (celui que lisent gunicorn et uvicorn). Avec
+        plusieurs serveurs (instances), le quota Gemini se partage aussi
+        entre eux : diviser RAG_MAX_CONCURRENT d'autant. RAG_QUEUE_PER_CLIENT
+        reste une limite par worker.
+        """
+        workers = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+        return cls(
+            max_concurrent=max(1, int(os.environ.get('RAG_MAX_CONCURRENT', 8)) // workers),
+            max_queue=int(os.environ.get('RAG_QUEUE_MAX', 64)) // workers,
+            max_queue_per_client=int(os.environ.get('RAG_QUEUE_PER_CLIENT', 4)),
+            slo=float(os.environ.get('RAG_QUEUE_SLO', 10)),
+            service_time=float(os.environ.get('RAG_SERVICE_TIME', 2)),
+        )
+
+    # --- Utilisation ---
+
+    @contextmanager
+    def slot(self, client=None):
+        """Attend une place (dans ce thread) pour la durée du bloc ; lève Overloaded."""
+        client = client or 'anonymous'
+        start = time.perf_counter()
+        with self._lock:
+            waiter = self._admit_or_enqueue(client, None)
+        if waiter is not None:
+            waiter.event.wait(self._remaining(start))
+            self._check_granted(waiter)
+        yield from self._hold(start)
+
+    @asynccontextmanager
+    async def aslot(self, client=None):
+        """Variante asynchrone de slot() : l'attente ne bloque pas la boucle d'évènements."""
+        client = client or 'anonymous'
+        start = time.perf_counter()
+        with self._lock:
+            waiter = self._admit_or_enqueue(client, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self._remaining(start))
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # Client déconnecté pendant l'attente : rendre la place si
+                # elle venait d'être attribuée.
+                with self._lock:
+                    granted = waiter.granted or not self._remove(waiter)
+                if granted:
+                    self._release(None)
+                raise
+            self._check_granted(waiter)
+        hold = self._hold(start)
+        next(hold)
+        try:
+            yield
+        finally:
+            hold.close()
+
+    def check(self, client=None):
+        """
+        Refus anticipé, sans réserver de place : pour les routes en streaming,
+        qui doivent répondre 429 avant d'envoyer le statut 200 du flux.
+        """
+        with self._lock:
+            if self._active < self.max_concurrent and not self._queued:
+                return
+            self._reject_if_needed(client or 'anonymous')
+
+    def snapshot(self):
+        with self._lock:
+            state = dict(self.stats, active=self._active, queue_depth=self._queued,
+                         clients_waiting=len(self._queues), service_time=self.service_time,
+                         max_concurrent=self.max_concurrent, max_queue=self.max_queue)
+        state['wait_avg'] = state['wait_total'] / state['admitted'] if state['admitted'] else 0.0
+        return state
+
+    # --- Interne ---
+
+    def _hold(self, start):
+        wait = time.perf_counter() - start
+        observe_stage('queue_wait', wait)
+        with self._lock:
+            self.stats['admitted'] += 1
+            self.stats['wait_total'] += wait
+            self.stats['wait_max'] = max(self.stats['wait_max'], wait)
+        held = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - held)
+
+    def _remaining(self, start):
+        return max(0.0, self.slo - (time.perf_counter() - start))
+
+    def _admit_or_enqueue(self, client, loop):
+        """Appelée avec le verrou. Renvoie None si une place est libre, sinon le _Waiter mis en file."""
+        if self._active < self.max_concurrent and not self._queued:
+            self._active += 1
+            return None
+        self._reject_if_needed(client)
+        waiter = _Waiter(client, loop)
+        self._queues.setdefault(client, deque()).append(waiter)
+        self._queued += 1
+        self.stats['queued'] += 1
+        return waiter
+
+    def _reject_if_needed(self, client):
+        own = len(self._queues.get(client, ()))
+        if self._queued >= self.max_queue:
+            reason = 'file pleine'
+        elif own >= self.max_queue_per_client:
+            reason = 'trop de questions en attente pour ce client'
+        else:
+            wait = self._estimated_wait(own + 1)
+            if wait <= self.slo:
+                return
+            reason = 'attente estimée trop longue'
+        self.stats['rejected'] += 1
+        raise Overloaded(self._retry_after(), reason)
+
+    def _estimated_wait(self, position):
+        # Au tour de rôle, passent avant nous au plus 'position' requêtes de
+        # chaque client en attente.
+        ahead = sum(min(len(queue), position) for queue in self._queues.values())
+        return (ahead + 1) / self.max_concurrent * self.service_time
+
+    def _retry_after(self):
+        return max(1, math.ceil(self._queued / self.max_concurrent * self.service_time))
+
+    def _check_granted(self, waiter):
+        with self._lock:
+            if waiter.granted:
+                return
+            self._remove(waiter)
+            self.stats['timeouts'] += 1
+            retry_after = self._retry_after()
+        raise Overloaded(retry_after, "délai d'attente dépassé")
+
+    def _remove(self, waiter):
+        """Retire un waiter de la file (avec le verrou). Faux s'il n'y était plus."""
+        queue = self._queues.get(waiter.client)
+        if queue is None or waiter not in queue:
+            return False
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[waiter.client]
+        self._queued -= 1
+        return True
+
+    def _release(self, duration):
+        with self._lock:
+            if duration is not None:
+                self.service_time += 0.2 * (duration - self.service_time)
+            waiter = None
+            if self._queues:
+                client, queue = next(iter(self._queues.items()))
+                waiter = queue.popleft()
+                self._queued -= 1
+                if queue:
+                    self._queues.move_to_end(client)
+                else:
+                    del self._queues[client]
+                # La place passe directement au suivant : _active ne change pas.
+                waiter.granted = True
+            else:
+                self._active -= 1
+        if waiter is not None:
+            waiter.wake()
@@ -0,0 +1,319 @@
+# Fichier: chatbot_app/ann.py
+import json
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+from .store import INDEX_FILE, index_lock, load_store
+
+# Fichiers de l'index approché, à côté de l'index exact. Il partage le
+# docstore de l'index exact : ses vecteurs sont dans le même ordre.
+ANN_FILE = "ann.faiss"
+ANN_INFO_NAME = "ann.json"
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivfpq')
+STORAGES = ('float32', 'float16')
+
+
+class IndexSpec:
+    """
+    Type d'index FAISS utilisé pour la recherche.
+
+    - flat : recherche exacte (index par défaut de LangChain). En float16,
+      les vecteurs occupent deux fois moins de mémoire.
+    - hnsw : graphe HNSW, recherche approchée en temps quasi logarithmique.
+      'ef_search' règle le compromis rappel / latence à la requête.
+    - ivfpq : partition en 'nlist' listes (IVF) et vecteurs compressés par
+      quantification produit (PQ, 'pq_m' octets par vecteur avec 8 bits).
+      La recherche ne parcourt que 'nprobe' listes. Demande un entraînement,
+      fait à la construction.
+
+    Les paramètres de recherche (ef_search, nprobe) s'appliquent au chargement
+    et ne demandent pas de reconstruire l'index.
+    """
+
+    BUILD_FIELDS = ('kind', 'storage', 'hnsw_m', 'ef_construction', 'nlist', 'pq_m', 'pq_nbits')
+
+    def __init__(self, kind='flat', storage='float32', hnsw_m=32, ef_construction=200, ef_search=64,
+                 nlist=0, nprobe=16, pq_m=0, pq_nbits=8):
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"ERREUR: type d'index inconnu '{kind}' (attendu : {', '.join(INDEX_TYPES)})")
+        if storage not in STORAGES:
+            raise ValueError(f"ERREUR: stockage inconnu '{storage}' (attendu : {', '.join(STORAGES)})")
+        self.kind = kind
+        self.storage = storage
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.nlist = nlist          # 0 : choisi selon la taille du corpus
+        self.nprobe = nprobe
+        self.pq_m = pq_m            # 0 : choisi selon la dimension
+        self.pq_nbits = pq_nbits
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            kind=os.environ.get('RAG_INDEX_TYPE', 'flat'),
+            storage=os.environ.get('RAG_INDEX_STORAGE', 'float32'),
+            hnsw_m=int(os.environ.get('RAG_HNSW_M', 32)),
+            ef_construction=int(os.environ.get('RAG_HNSW_EF_CONSTRUCTION', 200)),
+            ef_search=int(os.environ.get('RAG_HNSW_EF_SEARCH', 64)),
+            nlist=int(os.environ.get('RAG_IVF_NLIST', 0)),
+            nprobe=int(os.environ.get('RAG_IVF_NPROBE', 16)),
+            pq_m=int(os.environ.get('RAG_PQ_M', 0)),
+            pq_nbits=int(os.environ.get('RAG_PQ_NBITS', 8)),
+        )
+
+    @property
+    def exact(self):
+        """Vrai pour l'index par défaut de LangChain : aucun index approché à construire."""
+        return self.kind == 'flat' and self.storage == 'float32'
+
+    def build_params(self):
+        return {name: getattr(self, name) for name in self.BUILD_FIELDS}
+
+    def label(self):
+        if self.kind == 'hnsw':
+            return f"hnsw-{self.storage} M={self.hnsw_m} efSearch={self.ef_search}"
+        if self.kind == 'ivfpq':
+            return f"ivfpq nlist={self.nlist or 'auto'} m={self.pq_m or 'auto'} nprobe={self.nprobe}"
+        return f"flat-{self.storage}"
+
+
+def _default_nlist(count):
+    # Règle usuelle : ~4 * sqrt(n) listes, avec au moins 39 vecteurs
+    # d'entraînement par liste (sinon FAISS entraîne mal les centroïdes).
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def _default_pq_m(dimension):
+    # ~8 dimensions par sous-quantifieur ; pq_m doit diviser la dimension.
+    for m in range(max(1, dimension // 8), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def build_index(spec, vectors):
+    """
+    Construit (et entraîne si besoin) l'index décrit par 'spec' sur les
+    vecteurs, dans le même ordre : la position i correspond toujours au
+    i-ème identifiant du docstore. Renvoie None si le corpus est trop petit
+    pour entraîner un IVF-PQ.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimension = vectors.shape
+    fp16 = spec.storage == 'float16'
+
+    if spec.kind == 'flat':
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16) if fp16 \
+            else faiss.IndexFlatL2(dimension)
+    elif spec.kind == 'hnsw':
+        index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_fp16, spec.hnsw_m) if fp16 \
+            else faiss.IndexHNSWFlat(dimension, spec.hnsw_m)
+        index.hnsw.efConstruction = spec.ef_construction
+    else:
+        if count < 2 ** spec.pq_nbits:
+            return None
+        nlist = spec.nlist or _default_nlist(count)
+        pq_m = spec.pq_m or _default_pq_m(dimension)
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, pq_m, spec.pq_nbits)
+
+    if not index.is_trained:
+        # Un échantillon suffit pour les centroïdes ; au-delà l'entraînement
+        # coûte sans améliorer le rappel.
+        sample = vectors
+        limit = max(256 * 39, getattr(index, 'nlist', 1) * 64)
+        if count > limit:
+            sample = vectors[np.random.default_rng(0).choice(count, limit, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    configure_search(index, spec)
+    return index
+
+
+def configure_search(index, spec):
+    """Applique les paramètres de recherche (efSearch, nprobe) à un index chargé."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = spec.ef_search
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(spec.nprobe, index.nlist)
+
+
+def index_bytes(index):
+    """Taille de l'index sérialisé : une bonne approximation de sa mémoire."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+# --- Construction et chargement ---
+
+def _exact_version(index_dir):
+    """Version de l'index exact (date et taille de index.faiss), base de celle de load_vector_store()."""
+    stat = os.stat(os.path.join(index_dir, INDEX_FILE))
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _read_info(index_dir):
+    try:
+        with open(os.path.join(index_dir, ANN_INFO_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def remove_ann(index_dir):
+    # ann.pkl : docstore dupliqué des index construits avant le format SQLite.
+    for name in (ANN_INFO_NAME, ANN_FILE, "ann.pkl"):
+        try:
+            os.remove(os.path.join(index_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def update_ann(index_dir, vector_store, spec):
+    """
+    (Re)construit l'index approché à partir de l'index exact, si le type
+    demandé ou l'index exact ont changé. Renvoie les informations de l'index
+    approché, ou None si la recherche reste exacte.
+
+    L'index exact (index.faiss) reste la référence : les mises à jour
+    incrémentales s'y appliquent (HNSW ne sait pas retirer de vecteurs), puis
+    l'index approché est reconstruit à partir de ses vecteurs.
+    """
+    if spec.exact:
+        with index_lock(index_dir):
+            remove_ann(index_dir)
+        return None
+    version = _exact_version(index_dir)
+    info = _read_info(index_dir)
+    if info and info['build'] == spec.build_params() and info['exact_version'] == version:
+        return info
+
+    start = time.perf_counter()
+    vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+    index = build_index(spec, vectors)
+    if index is None:
+        print(f"WARNING: {len(vectors)} chunks ne suffisent pas pour entraîner un index {spec.kind} ; "
+              f"la recherche reste exacte.")
+        with index_lock(index_dir):
+            remove_ann(index_dir)
+        return None
+
+    info = {
+        'build': spec.build_params(),
+        'exact_version': version,
+        'ntotal': int(index.ntotal),
+        'bytes': index_bytes(index),
+        'build_seconds': round(time.perf_counter() - start, 3),
+    }
+    # ann.json est écrit en dernier : tant qu'il ne correspond pas, les
+    # workers chargent l'index exact.
+    index_tmp = os.path.join(index_dir, ANN_FILE + ".tmp")
+    info_tmp = os.path.join(index_dir, ANN_INFO_NAME + ".tmp")
+    faiss.write_index(index, index_tmp)
+    with open(info_tmp, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=1)
+    with index_lock(index_dir):
+        remove_ann(index_dir)
+        os.replace(index_tmp, os.path.join(index_dir, ANN_FILE))
+        os.replace(info_tmp, os.path.join(index_dir, ANN_INFO_NAME))
+    return info
+
+
+def load_vector_store(index_dir, embeddings, spec=None):
+    """
+    Charge l'index approché s'il correspond au type demandé et à l'index
+    exact sur disque, sinon l'index exact. Renvoie (vector_store, version) :
+    la version (date et taille de index.faiss, date de ann.json) change à
+    chaque reconstruction de l'un ou l'autre.
+    """
+    spec = spec or IndexSpec.from_env()
+    with index_lock(index_dir, shared=True):
+        version = _exact_version(index_dir)
+        try:
+            version += f"-{os.stat(os.path.join(index_dir, ANN_INFO_NAME)).st_mtime_ns}"
+        except FileNotFoundError:
+            pass
+        return _load_vector_store(index_dir, embeddings, spec), version
+
+
+def _load_vector_store(index_dir, embeddings, spec):
+    if not spec.exact:
+        info = _read_info(index_dir)
+        if info and info['build'] == spec.build_params() and info['exact_version'] == _exact_version(index_dir):
+            vector_store = load_store(index_dir, embeddings, index_file=ANN_FILE)
+            configure_search(vector_store.index, spec)
+            print(f"INFO: Index approché chargé ({spec.label()}, {info['bytes'] / (1024 * 1024):.1f} Mo).")
+            return vector_store
+        print(f"WARNING: Index {spec.kind} absent ou obsolète, recherche exacte. Lancer 'python index.py'.")
+    return load_store(index_dir, embeddings)
+
+
+# --- Rapport rappel / latence ---
+
+def default_specs(base=None):
+    """Configurations comparées par défaut par recall_report()."""
+    base = base or IndexSpec()
+    specs = [IndexSpec('flat', 'float16')]
+    for storage in STORAGES:
+        for ef_search in (16, 32, 64, 128, 256):
+            specs.append(IndexSpec('hnsw', storage, hnsw_m=base.hnsw_m, ef_construction=base.ef_construction,
+                                   ef_search=ef_search))
+    for nprobe in (1, 4, 16, 64):
+        specs.append(IndexSpec('ivfpq', nlist=base.nlist, nprobe=nprobe, pq_m=base.pq_m, pq_nbits=base.pq_nbits))
+    return specs
+
+
+def recall_report(vectors, queries, specs, k=4):
+    """
+    Compare chaque configuration à la recherche exacte sur les mêmes
+    requêtes. Pour chacune : rappel@k (part des k voisins exacts retrouvés),
+    latence par requête (p50, p95, une requête à la fois comme en
+    production), mémoire de l'index et temps de construction.
+
+    Les configurations qui ne diffèrent que par leurs paramètres de
+    recherche partagent le même index construit.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    rows = [_measure(IndexSpec(), exact, queries, truth, k, 0.0)]
+    built = {}
+    for spec in specs:
+        key = json.dumps(spec.build_params(), sort_keys=True)
+        if key not in built:
+            start = time.perf_counter()
+            built[key] = (build_index(spec, vectors), time.perf_counter() - start)
+        index, build_seconds = built[key]
+        if index is None:
+            continue
+        configure_search(index, spec)
+        rows.append(_measure(spec, index, queries, truth, k, build_seconds))
+    return rows
+
+
+def _measure(spec, index, queries, truth, k, build_seconds):
+    latencies = []
+    found = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found += len(set(ids[0]) & set(expected))
+    latencies.sort()
+    size = index_bytes(index)
+    return {
+        'index': spec.label(),
+        'recall': found / truth.size,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] * 1000,
+        'mb': size / (1024 * 1024),
+        'bytes_per_vector': size / max(1, index.ntotal),
+        'build_seconds': build_seconds,
+    }
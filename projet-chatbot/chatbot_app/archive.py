@@ -0,0 +1,198 @@
+# Fichier: chatbot_app/archive.py
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert
+
+from . import db
+from .models import ArchivedConversation, Conversation, Message
+
+# Archivage des conversations inactives :
+#
+#   flask --app wsgi archive run        (tâche planifiée, par exemple chaque nuit)
+#
+# Les conversations sans activité depuis ARCHIVE_AFTER_DAYS jours sont
+# déplacées, par lots de ARCHIVE_BATCH_SIZE, vers la table
+# conversation_archive : une ligne par conversation, avec tous ses messages
+# en JSON compressé. Les tables conversations et messages ne gardent ainsi
+# que l'historique récent, et leurs index restent assez petits pour tenir en
+# mémoire. Une conversation archivée reste consultable (page de chat en
+# lecture seule, /api/archive/...), mais n'apparaît plus dans la recherche.
+# Si un message y est enregistré alors qu'elle vient d'être archivée (la
+# page était ouverte pendant l'archivage), elle est restaurée : voir
+# restore_conversation().
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 200))
+
+
+class ArchivedMessage:
+    """Message lu dans une archive ; mêmes attributs que Message pour les templates."""
+
+    __slots__ = ('id', 'is_user', 'timestamp', 'content')
+
+    def __init__(self, id, is_user, timestamp, content):
+        self.id = id
+        self.is_user = is_user
+        self.timestamp = datetime.fromisoformat(timestamp) if timestamp else None
+        self.content = content
+
+
+def _pack(summary, summary_message_id, messages):
+    rows = [[m.id, m.is_user, m.timestamp.isoformat() if m.timestamp else None, m.content] for m in messages]
+    raw = json.dumps({'summary': summary, 'summary_message_id': summary_message_id, 'messages': rows},
+                     ensure_ascii=False, separators=(',', ':'))
+    return zlib.compress(raw.encode('utf-8'), 6)
+
+
+def _unpack(payload):
+    """Renvoie (données de la conversation, messages)."""
+    data = json.loads(zlib.decompress(payload).decode('utf-8'))
+    return data, [ArchivedMessage(*row) for row in data.pop('messages')]
+
+
+def archive_batch(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Archive au plus 'batch_size' conversations inactives depuis 'cutoff', en
+    une transaction : une lecture des messages du lot, puis un INSERT
+    multi-lignes dans l'archive et deux DELETE ensemblistes. Renvoie
+    (conversations, messages) archivés.
+    """
+    # Sous PostgreSQL, les conversations du lot sont verrouillées jusqu'à la
+    # fin de la transaction (SKIP LOCKED : deux tâches simultanées se
+    # partagent les lots, et une conversation en cours d'enregistrement, déjà
+    # verrouillée par son UPDATE, est laissée pour le lot suivant). Un
+    # échange dont l'appel au LLM a commencé avant l'archivage est enregistré
+    # après : _save_exchange() restaure alors la conversation.
+    conversations = (
+        db.session.query(Conversation.id, Conversation.user_id, Conversation.title, Conversation.created_at,
+                         Conversation.updated_at, Conversation.summary, Conversation.summary_message_id)
+        .filter(Conversation.updated_at < cutoff)
+        .order_by(Conversation.updated_at, Conversation.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not conversations:
+        db.session.rollback()
+        return 0, 0
+    ids = [conversation.id for conversation in conversations]
+
+    by_conversation = {conversation_id: [] for conversation_id in ids}
+    messages = (
+        db.session.query(Message.id, Message.conversation_id, Message.is_user, Message.timestamp, Message.content)
+        .filter(Message.conversation_id.in_(ids))
+        .order_by(Message.conversation_id, Message.timestamp, Message.id)
+    )
+    for message in messages:
+        by_conversation[message.conversation_id].append(message)
+
+    now = datetime.utcnow()
+    db.session.execute(insert(ArchivedConversation), [
+        {'id': conversation.id, 'user_id': conversation.user_id, 'title': conversation.title,
+         'created_at': conversation.created_at, 'updated_at': conversation.updated_at, 'archived_at': now,
+         'message_count': len(by_conversation[conversation.id]),
+         'payload': _pack(conversation.summary, conversation.summary_message_id, by_conversation[conversation.id])}
+        for conversation in conversations
+    ])
+    deleted = db.session.execute(delete(Message).where(Message.conversation_id.in_(ids))).rowcount
+    db.session.execute(delete(Conversation).where(Conversation.id.in_(ids)))
+    db.session.commit()
+    return len(ids), deleted
+
+
+def archive_conversations(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+    """Archive les conversations inactives, lot par lot, jusqu'à épuisement. Renvoie les totaux."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    totals = {'conversations': 0, 'messages': 0, 'batches': 0}
+    while max_batches is None or totals['batches'] < max_batches:
+        conversations, messages = archive_batch(cutoff, batch_size)
+        if not conversations:
+            break
+        totals['conversations'] += conversations
+        totals['messages'] += messages
+        totals['batches'] += 1
+    return totals
+
+
+def restore_conversation(conversation_id, user_id):
+    """
+    Remet une conversation archivée de l'utilisateur dans les tables
+    actives, avec les identifiants d'origine de ses messages, et supprime
+    son archive. Ne valide pas la transaction. Renvoie False si elle n'est
+    pas (ou plus) archivée.
+    """
+    archived = (ArchivedConversation.query.filter_by(id=conversation_id, user_id=user_id)
+                .with_for_update().first())
+    if archived is None:
+        return False
+    data, messages = _unpack(archived.payload)
+    # Les archives écrites avant l'ajout de summary_message_id ne disent pas
+    # quels messages le résumé couvre : il sera refait.
+    summary_message_id = data.get('summary_message_id')
+    db.session.execute(insert(Conversation), [{
+        'id': archived.id, 'user_id': archived.user_id, 'title': archived.title,
+        'created_at': archived.created_at, 'updated_at': archived.updated_at,
+        'summary': data['summary'] if summary_message_id is not None else None,
+        'summary_message_id': summary_message_id,
+    }])
+    if messages:
+        db.session.execute(insert(Message), [
+            {'id': m.id, 'conversation_id': archived.id, 'is_user': m.is_user, 'timestamp': m.timestamp,
+             'content': m.content}
+            for m in messages
+        ])
+    db.session.execute(delete(ArchivedConversation).where(ArchivedConversation.id == archived.id))
+    return True
+
+
+# --- Lecture ---
+
+def load_archived_conversation(conversation_id, user_id):
+    """Renvoie (conversation archivée, messages dans l'ordre chronologique), ou (None, [])."""
+    archived = ArchivedConversation.query.filter_by(id=conversation_id, user_id=user_id).first()
+    if archived is None:
+        return None, []
+    _, messages = _unpack(archived.payload)
+    return archived, messages
+
+
+def archive_stats():
+    count, messages, size = db.session.query(
+        func.count(ArchivedConversation.id),
+        func.coalesce(func.sum(ArchivedConversation.message_count), 0),
+        func.coalesce(func.sum(func.length(ArchivedConversation.payload)), 0),
+    ).one()
+    return {'conversations': count, 'messages': messages, 'payload_bytes': size,
+            'hot_conversations': db.session.query(func.count(Conversation.id)).scalar(),
+            'hot_messages': db.session.query(func.count(Message.id)).scalar()}
+
+
+# --- Intégration Flask ---
+
+archive_cli = AppGroup('archive', help="Archivage des conversations inactives.")
+
+
+@archive_cli.command('run')
+@click.option('--days', default=ARCHIVE_AFTER_DAYS, show_default=True, help="Inactivité minimale (jours).")
+@click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True, help="Conversations par transaction.")
+@click.option('--max-batches', type=int, default=None, help="Arrêt après ce nombre de lots.")
+def run_command(days, batch_size, max_batches):
+    """Archive les conversations sans activité depuis --days jours."""
+    totals = archive_conversations(days, batch_size, max_batches)
+    click.echo(f"Conversations archivées : {totals['conversations']} ({totals['messages']} messages, "
+               f"{totals['batches']} lots)")
+
+
+@archive_cli.command('stats')
+def stats_command():
+    """Affiche la taille de l'archive et des tables actives."""
+    for key, value in archive_stats().items():
+        click.echo(f"{key}: {value}")
+
+
+def init_app(app):
+    app.cli.add_command(archive_cli)
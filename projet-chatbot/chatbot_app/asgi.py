@@ -0,0 +1,355 @@
+# Fichier: chatbot_app/asgi.py
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+import warnings
+from datetime import datetime
+
+from itsdangerous import BadSignature
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_cookie, parse_options_header
+
+from . import get_rag_service, rag_status
+from .admission import Overloaded
+from .auth import InvalidToken, bearer_token, decode_token
+from .metrics import HTTP_REQUEST_SECONDS, end_trace, server_timing, start_trace, trace_requested
+from .routes import (CONVERSATION_GONE_MESSAGE, OVERLOADED_MESSAGE, ConversationGone,
+                     _load_conversation_for_exchange, _save_exchange, _sse)
+
+MAX_BODY_SIZE = 1024 * 1024
+
+JSON_HEADERS = [(b'content-type', b'application/json'), (b'access-control-allow-origin', b'*')]
+# 'X-Accel-Buffering' empêche un éventuel proxy nginx de bufferiser le flux.
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+    (b'access-control-allow-origin', b'*'),
+]
+
+
+class AsyncRAGApp:
+    """
+    Application ASGI (à lancer avec uvicorn, voir asgi.py à la racine).
+
+    Les routes qui attendent Gemini (/api/ask, /api/ask/stream et
+    /send_message/stream, utilisée par la page de chat) sont servies en
+    asynchrone avec RAGService.aask()/astream() : une question en attente
+    du LLM ne coûte qu'une coroutine, et un seul processus peut en garder
+    des centaines en vol. Tout le reste (pages HTML, authentification,
+    historique...) est transmis tel quel à l'application Flask, exécutée
+    dans un pool de threads.
+
+    Les accès à la base restent synchrones (Flask-SQLAlchemy) : ils sont
+    courts et passent par asyncio.to_thread().
+    """
+
+    def __init__(self, flask_app, wsgi_threads=None):
+        self.flask_app = flask_app
+        with warnings.catch_warnings():
+            # uvicorn utilise a2wsgi s'il est installé, sinon sa propre
+            # implémentation (dépréciée mais suffisante ici).
+            warnings.simplefilter('ignore', DeprecationWarning)
+            from uvicorn.middleware.wsgi import WSGIMiddleware
+            self.wsgi_app = WSGIMiddleware(
+                flask_app, workers=wsgi_threads or int(os.environ.get('ASGI_WSGI_THREADS', 10)))
+        self.routes = {
+            ('POST', '/api/ask'): self.api_ask,
+            ('POST', '/api/ask/stream'): self.api_ask_stream,
+            ('POST', '/send_message/stream'): self.send_message_stream,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        handler = self.routes.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if handler is None:
+            await self.wsgi_app(scope, receive, send)
+            return
+        await self._timed(handler, scope, receive, send)
+
+    async def _timed(self, handler, scope, receive, send):
+        """Même instrumentation que metrics.init_app() pour les routes Flask."""
+        start = time.perf_counter()
+        trace_header = next((value for name, value in scope['headers'] if name == b'x-trace'), b'')
+        token = start_trace() if trace_requested(trace_header.decode('latin-1')) else None
+
+        async def timed_send(message):
+            nonlocal token
+            if message['type'] == 'http.response.start' and message['headers'] is not SSE_HEADERS:
+                elapsed = time.perf_counter() - start
+                HTTP_REQUEST_SECONDS.observe(elapsed, f"main.{handler.__name__}", scope['method'], str(message['status']))
+                if token is not None:
+                    spans = end_trace(token) + [('request', elapsed)]
+                    token = None
+                    message = dict(message, headers=message['headers'] + [
+                        (b'server-timing', server_timing(spans).encode('latin-1'))])
+            await send(message)
+
+        try:
+            await handler(scope, receive, timed_send)
+        finally:
+            if token is not None:
+                end_trace(token)
+
+    # --- Routes asynchrones ---
+
+    async def api_ask(self, scope, receive, send):
+        """Équivalent asynchrone de la route Flask /api/ask."""
+        data = await self._read_json(receive)
+        if data is None:
+            await self._send_json(send, {'error': 'Requête trop volumineuse ou JSON invalide'}, status=400)
+            return
+        if not isinstance(data.get('question'), str) or not data['question'].strip():
+            await self._send_json(send, {'error': 'La question est manquante ou vide'}, status=400)
+            return
+
+        client = await self._api_client(scope, send)
+        if client is None:
+            return
+        rag_service = await self._rag_service()
+        try:
+            response_text = await rag_service.aask(data['question'], client=client)
+        except Overloaded as e:
+            await self._send_overloaded(send, e)
+            return
+        await self._send_json(send, {'answer': response_text})
+
+    async def api_ask_stream(self, scope, receive, send):
+        """Équivalent asynchrone de /api/ask/stream (Server-Sent Events)."""
+        data = await self._read_json(receive)
+        if not data or not isinstance(data.get('question'), str) or not data['question'].strip():
+            await self._send_json(send, {'error': 'La question est manquante ou vide'}, status=400)
+            return
+
+        user_question = data['question']
+        client = await self._api_client(scope, send)
+        if client is None:
+            return
+        rag_service = await self._rag_service()
+        try:
+            rag_service.admission.check(client)
+        except Overloaded as e:
+            await self._send_overloaded(send, e)
+            return
+
+        async def events():
+            yield ": stream ouvert\n\n"
+            chunks = []
+            try:
+                async for chunk in rag_service.astream(user_question, client=client):
+                    chunks.append(chunk)
+                    yield _sse({'token': chunk})
+            except Overloaded as e:
+                yield _sse({'error': OVERLOADED_MESSAGE, 'retry_after': e.retry_after}, event='error')
+                return
+            except Exception as e:
+                logging.error(f"Error streaming answer: {e}")
+                yield _sse({'error': 'Erreur lors de la génération de la réponse'}, event='error')
+                return
+            yield _sse({'answer': ''.join(chunks)}, event='done')
+
+        await self._send_sse(receive, send, events())
+
+    async def send_message_stream(self, scope, receive, send):
+        """
+        Équivalent asynchrone de /send_message/stream : même session Flask
+        (cookie signé), mêmes vérifications, mêmes évènements SSE. Les
+        messages sont enregistrés une fois le flux terminé.
+        """
+        user_id = self._session_user_id(scope)
+        if user_id is None:
+            await self._send_json(send, {'error': 'Non autorisé'}, status=401)
+            return
+
+        form = await self._read_form(scope, receive)
+        conversation_id = form.get('conversation_id') if form is not None else None
+        message_content = form.get('message') if form is not None else None
+        if not conversation_id or not message_content or not message_content.strip():
+            await self._send_json(send, {'error': 'Message ou conversation manquant'}, status=400)
+            return
+
+        conversation, history = await self._in_app_context(_load_conversation_for_exchange, conversation_id, user_id)
+        if not conversation:
+            await self._send_json(send, {'error': 'Conversation non trouvée'}, status=404)
+            return
+        sent_at = datetime.utcnow()
+
+        rag_service = await self._rag_service()
+        client = f"user:{user_id}"
+        try:
+            rag_service.admission.check(client)
+        except Overloaded as e:
+            await self._send_overloaded(send, e)
+            return
+
+        async def events():
+            yield ": stream ouvert\n\n"
+            chunks = []
+            try:
+                question = await rag_service.arewrite(message_content, history, client=client)
+                async for chunk in rag_service.astream(question, client=client):
+                    chunks.append(chunk)
+                    yield _sse({'token': chunk})
+            except Overloaded as e:
+                yield _sse({'error': OVERLOADED_MESSAGE, 'retry_after': e.retry_after}, event='error')
+                return
+            except Exception as e:
+                logging.error(f"Error streaming message: {e}")
+                yield _sse({'error': 'Une erreur est survenue lors de la communication avec le chatbot.'}, event='error')
+                return
+
+            try:
+                title = await self._in_app_context(_save_exchange, conversation, message_content, ''.join(chunks),
+                                                   sent_at, history)
+            except ConversationGone:
+                yield _sse({'error': CONVERSATION_GONE_MESSAGE}, event='error')
+                return
+            except Exception as e:
+                logging.error(f"Error saving streamed message: {e}")
+                yield _sse({'error': "La réponse n'a pas pu être enregistrée."}, event='error')
+                return
+            yield _sse({'title': title}, event='done')
+
+        await self._send_sse(receive, send, events())
+
+    # --- Outils ---
+
+    async def _rag_service(self):
+        # Tant que le RAGService n'est pas prêt, sa construction (ou l'attente
+        # du thread de préchargement) bloquerait la boucle d'évènements.
+        if rag_status()['status'] != 'ready':
+            await asyncio.to_thread(get_rag_service)
+        rag_service = get_rag_service()
+        rag_service.reloader.ensure_watching()
+        return rag_service
+
+    async def _in_app_context(self, func, *args):
+        """Exécute une fonction utilisant la base dans un thread, avec le contexte Flask."""
+        def call():
+            with self.flask_app.app_context():
+                return func(*args)
+        return await asyncio.to_thread(call)
+
+    async def _api_client(self, scope, send):
+        """
+        Clé client d'une route /api/* ; comme auth.init_app() pour Flask, un
+        jeton Bearer invalide ou expiré donne 401 (renvoie alors None).
+        """
+        try:
+            return self._client_key(scope)
+        except InvalidToken:
+            await self._send_json(send, {'error': 'Jeton invalide ou expiré'}, status=401)
+            return None
+
+    def _client_key(self, scope):
+        """
+        Même clé que routes._client_key() : l'utilisateur du jeton Bearer ou
+        de la session, sinon l'adresse IP. Lève InvalidToken.
+        """
+        authorization = next((value for name, value in scope['headers'] if name == b'authorization'), b'')
+        token = bearer_token(authorization.decode('latin-1'))
+        user_id = decode_token(token, self.flask_app) if token else self._session_user_id(scope)
+        if user_id is not None:
+            return f"user:{user_id}"
+        client = scope.get('client')
+        return f"ip:{client[0] if client else None}"
+
+    def _session_user_id(self, scope):
+        """Lit user_id dans le cookie de session Flask (même signature que Flask)."""
+        app = self.flask_app
+        cookie_header = b'; '.join(value for name, value in scope['headers'] if name == b'cookie')
+        cookie = parse_cookie(cookie_header.decode('latin-1')).get(app.config['SESSION_COOKIE_NAME'])
+        serializer = app.session_interface.get_signing_serializer(app)
+        if not cookie or serializer is None:
+            return None
+        try:
+            data = serializer.loads(cookie, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return None
+        return data.get('user_id')
+
+    async def _read_body(self, receive):
+        """Lit le corps de la requête. Renvoie None s'il dépasse MAX_BODY_SIZE."""
+        body = bytearray()
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            body += message.get('body', b'')
+            if len(body) > MAX_BODY_SIZE:
+                return None
+            more_body = message.get('more_body', False)
+        return bytes(body)
+
+    async def _read_json(self, receive):
+        body = await self._read_body(receive)
+        if body is None:
+            return None
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    async def _read_form(self, scope, receive):
+        """Formulaire urlencoded ou multipart (FormData du navigateur)."""
+        body = await self._read_body(receive)
+        if body is None:
+            return None
+        content_type = next((value for name, value in scope['headers'] if name == b'content-type'), b'')
+        mimetype, options = parse_options_header(content_type.decode('latin-1'))
+        _, form, _ = FormDataParser().parse(io.BytesIO(body), mimetype, len(body), options)
+        return form
+
+    async def _send_json(self, send, data, status=200, headers=()):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status, 'headers': JSON_HEADERS + list(headers)})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _send_overloaded(self, send, error):
+        """Même réponse 429 que routes._overloaded_response()."""
+        await self._send_json(send, {'error': OVERLOADED_MESSAGE, 'retry_after': error.retry_after}, status=429,
+                              headers=[(b'retry-after', str(error.retry_after).encode('ascii'))])
+
+    async def _send_sse(self, receive, send, events):
+        """
+        Envoie un flux SSE. Si le client se déconnecte, l'envoi est annulé :
+        l'annulation remonte jusqu'au flux du LLM, qui est fermé.
+        """
+        async def pump():
+            await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+            async for event in events:
+                await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def wait_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        pump_task = asyncio.ensure_future(pump())
+        disconnect_task = asyncio.ensure_future(wait_disconnect())
+        try:
+            await asyncio.wait({pump_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (pump_task, disconnect_task):
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(pump_task, disconnect_task, return_exceptions=True)
+            await events.aclose()
+        if not pump_task.cancelled() and pump_task.exception() is not None:
+            raise pump_task.exception()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
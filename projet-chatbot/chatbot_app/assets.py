@@ -0,0 +1,173 @@
+# Fichier: chatbot_app/assets.py
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import abort, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # variantes .br non générées ; les navigateurs reçoivent la version gzip
+    brotli = None
+
+# Pipeline des fichiers statiques (CSS, JS, images, manifest PWA) :
+#
+#   python build_assets.py      (lancé par build.sh au déploiement)
+#
+# copie chaque fichier de static/ dans static_build/ sous un nom contenant
+# l'empreinte de son contenu (css/style.css -> css/style.3f2a9c1b40.css),
+# avec ses variantes précompressées .gz et .br, et écrit la correspondance
+# dans static_build/assets.json. Ces fichiers sont servis sous /assets/ avec
+# "Cache-Control: immutable" : un nom donné ne change jamais de contenu, le
+# navigateur ne les redemande donc plus, et un fichier modifié change de nom.
+#
+# Dans les templates, url_for('static', filename=...) renvoie
+# automatiquement le nom avec empreinte (voir init_app). Sans build (en
+# développement), les fichiers sont servis normalement depuis /static/.
+BUILD_DIRNAME = 'static_build'
+MANIFEST_NAME = 'assets.json'
+URL_PREFIX = '/assets'
+MAX_AGE = 365 * 24 * 3600
+
+# Fichiers texte : compressés, et leurs références à d'autres fichiers
+# statiques ("/static/images/logo.svg") réécrites vers les noms avec empreinte.
+TEXT_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.txt', '.html', '.map')
+# Encodages proposés, par ordre de préférence.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_STATIC_REFERENCE = re.compile(r"/static/([\w./-]+)")
+
+
+def _fingerprint(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    root, extension = os.path.splitext(path)
+    return f"{root}.{digest}{extension}"
+
+
+def _compress(content):
+    """Variantes compressées {encodage: octets}, seulement si elles sont plus petites."""
+    variants = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content, quality=11)
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(content)}
+
+
+def build_assets(static_dir, build_dir):
+    """
+    Construit static_build/ à partir de static/ et renvoie le manifeste
+    {chemin d'origine: {'path': chemin avec empreinte, 'encodings': [...]}}.
+    """
+    sources = []
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            path = os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, '/')
+            sources.append(path)
+    # Les fichiers binaires d'abord : les fichiers texte qui les citent
+    # reçoivent ainsi leur nom avec empreinte.
+    sources.sort(key=lambda path: (path.endswith(TEXT_EXTENSIONS), path))
+
+    tmp_dir = build_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    files = {}
+    for path in sources:
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            content = f.read()
+        encodings = {}
+        if path.endswith(TEXT_EXTENSIONS):
+            content = _STATIC_REFERENCE.sub(
+                lambda m: f"{URL_PREFIX}/{files[m.group(1)]['path']}" if m.group(1) in files else m.group(0),
+                content.decode('utf-8')).encode('utf-8')
+            encodings = _compress(content)
+        hashed = _fingerprint(path, content)
+        target = os.path.join(tmp_dir, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content)
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings:
+                with open(target + suffix, 'wb') as f:
+                    f.write(encodings[encoding])
+        files[path] = {'path': hashed, 'encodings': [encoding for encoding, _ in ENCODINGS if encoding in encodings]}
+
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump({'files': files}, f, indent=2, sort_keys=True)
+    # Remplacement en bloc : un worker ne voit jamais un build à moitié écrit.
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.replace(tmp_dir, build_dir)
+    return files
+
+
+class AssetManifest:
+    """Manifeste d'un build : noms avec empreinte et encodages disponibles."""
+
+    def __init__(self, build_dir, files):
+        self.build_dir = build_dir
+        self.files = files
+        self.by_hashed = {entry['path']: entry for entry in files.values()}
+
+    @classmethod
+    def load(cls, build_dir):
+        """Renvoie None s'il n'y a pas de build (développement)."""
+        try:
+            with open(os.path.join(build_dir, MANIFEST_NAME), encoding='utf-8') as f:
+                return cls(build_dir, json.load(f)['files'])
+        except FileNotFoundError:
+            return None
+
+    def hashed(self, filename):
+        entry = self.files.get(filename)
+        return entry['path'] if entry else None
+
+
+def _accepted(encoding):
+    return request.accept_encodings[encoding] > 0
+
+
+def init_app(app):
+    """
+    Route /assets/<nom avec empreinte> et url_for('static', ...) tenant
+    compte du manifeste, si static_build/ existe.
+    """
+    build_dir = os.path.join(app.root_path, BUILD_DIRNAME)
+    manifest = AssetManifest.load(build_dir)
+    if manifest is None:
+        print("INFO: Pas de static_build/ : fichiers statiques servis sans empreinte (python build_assets.py).")
+        return
+    print(f"INFO: {len(manifest.files)} fichiers statiques avec empreinte (static_build/).")
+
+    def serve_asset(filename):
+        entry = manifest.by_hashed.get(filename)
+        if entry is None:
+            abort(404)
+        encoding = next((encoding for encoding, _ in ENCODINGS
+                         if encoding in entry['encodings'] and _accepted(encoding)), None)
+        suffix = dict(ENCODINGS)[encoding] if encoding else ''
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(build_dir, filename + suffix, mimetype=mimetype, max_age=MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if entry['encodings']:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.add_url_rule(f"{URL_PREFIX}/<path:filename>", 'assets', serve_asset)
+
+    flask_url_for = app.jinja_env.globals['url_for']
+
+    def asset_url_for(endpoint, **values):
+        if endpoint == 'static':
+            hashed = manifest.hashed(values.get('filename'))
+            if hashed is not None:
+                values['filename'] = hashed
+                return flask_url_for('assets', **values)
+        return flask_url_for(endpoint, **values)
+
+    app.jinja_env.globals['url_for'] = asset_url_for
+    app.extensions['assets'] = manifest
+
@@ -0,0 +1,152 @@
+# Fichier: chatbot_app/auth.py
+import threading
+import time
+
+import jwt
+from cachetools import TTLCache
+from flask import current_app, g, jsonify, request, session
+
+from . import db
+from .models import User
+
+# --- Jetons d'accès pour l'API (/api/*) ---
+# Jetons JWT signés (HS256) et à durée de vie courte : /api/login en délivre
+# un, les appels suivants l'envoient dans l'en-tête
+# "Authorization: Bearer <jeton>". La vérification ne fait que contrôler la
+# signature et l'expiration, sans lecture de la base. Contrepartie : un
+# jeton reste valable jusqu'à son expiration (JWT_ACCESS_TOKEN_TTL), même
+# après un changement de mot de passe.
+JWT_ALGORITHM = 'HS256'
+
+
+class InvalidToken(Exception):
+    """Jeton absent du bon format, mal signé ou expiré : à renvoyer en 401."""
+
+
+def _secret(app):
+    return app.config.get('JWT_SECRET_KEY') or app.config['SECRET_KEY']
+
+
+def issue_token(user):
+    """Renvoie (jeton, durée de validité en secondes) pour l'utilisateur."""
+    app = current_app
+    ttl = app.config['JWT_ACCESS_TOKEN_TTL']
+    now = int(time.time())
+    claims = {'sub': str(user.id), 'name': user.get_full_name(), 'iat': now, 'exp': now + ttl}
+    return jwt.encode(claims, _secret(app), algorithm=JWT_ALGORITHM), ttl
+
+
+def decode_token(token, app):
+    """Vérifie le jeton et renvoie l'id de l'utilisateur ; lève InvalidToken."""
+    try:
+        claims = jwt.decode(token, _secret(app), algorithms=[JWT_ALGORITHM], options={'require': ['sub', 'exp']})
+        return int(claims['sub'])
+    except (jwt.InvalidTokenError, ValueError) as e:
+        raise InvalidToken(str(e)) from e
+
+
+def bearer_token(header):
+    """Jeton de l'en-tête Authorization, ou None s'il n'y en a pas."""
+    scheme, _, token = (header or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+def request_user_id():
+    """
+    Utilisateur de la requête en cours : celui du jeton Bearer s'il y en a
+    un (vérifié avant la route, voir init_app), sinon celui de la session.
+    """
+    if 'token_user_id' in g:
+        return g.token_user_id
+    return session.get('user_id')
+
+
+# --- Identité de l'utilisateur connecté ---
+# Les pages n'affichent que quelques champs de l'utilisateur (nom, email...) :
+# au lieu de relire la ligne users à chaque page, on garde un instantané de
+# ces champs dans un cache à durée de vie courte (IDENTITY_CACHE_TTL), vidé
+# pour l'utilisateur concerné quand il modifie son profil ou son mot de
+# passe. Le cache est propre à chaque worker : les autres workers voient la
+# modification au plus tard à l'expiration de leur entrée.
+
+class Identity:
+    """Instantané des champs affichés d'un utilisateur, indépendant de la session SQLAlchemy."""
+
+    FIELDS = ('id', 'nom', 'postnom', 'prenom', 'email', 'created_at', 'email_confirmed')
+    __slots__ = FIELDS
+
+    def __init__(self, row):
+        for name, value in zip(self.FIELDS, row):
+            setattr(self, name, value)
+
+    def get_full_name(self):
+        return f"{self.prenom} {self.nom} {self.postnom}"
+
+
+_identities = None
+_identities_lock = threading.Lock()          # TTLCache n'est pas thread-safe
+_identity_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def load_identity(user_id):
+    """Identity de l'utilisateur (cache, sinon une requête), ou None s'il n'existe pas."""
+    if user_id is None:
+        return None
+    with _identities_lock:
+        identity = _identities.get(user_id)
+        _identity_stats['hits' if identity is not None else 'misses'] += 1
+    if identity is not None:
+        return identity
+    row = db.session.query(*(getattr(User, name) for name in Identity.FIELDS)).filter(User.id == user_id).first()
+    if row is None:
+        return None
+    identity = Identity(row)
+    with _identities_lock:
+        _identities[user_id] = identity
+    return identity
+
+
+def current_identity():
+    """Identity de l'utilisateur de la requête, lue une seule fois par requête."""
+    if '_identity' not in g:
+        g._identity = load_identity(request_user_id())
+    return g._identity
+
+
+def forget_identity(user_id):
+    """À appeler après toute modification de l'utilisateur (profil, mot de passe)."""
+    with _identities_lock:
+        _identities.pop(user_id, None)
+        _identity_stats['invalidations'] += 1
+    g.pop('_identity', None)
+
+
+def identity_cache_stats():
+    with _identities_lock:
+        return dict(_identity_stats, size=len(_identities))
+
+
+def init_app(app):
+    """
+    Cache des identités, et vérification du jeton Bearer avant chaque route
+    /api/* : un jeton invalide ou expiré donne 401, sans atteindre la route.
+    """
+    global _identities
+    with _identities_lock:
+        if _identities is None:
+            _identities = TTLCache(maxsize=app.config['IDENTITY_CACHE_SIZE'], ttl=app.config['IDENTITY_CACHE_TTL'])
+
+    @app.before_request
+    def _authenticate_bearer():
+        if not request.path.startswith('/api/'):
+            return None
+        token = bearer_token(request.headers.get('Authorization'))
+        if token is None:
+            return None
+        try:
+            g.token_user_id = decode_token(token, app)
+        except InvalidToken:
+            return jsonify({'error': 'Jeton invalide ou expiré'}), 401
+        return None
@@ -0,0 +1,195 @@
+# Fichier: chatbot_app/backends.py
+import asyncio
+import hashlib
+import os
+import random
+import re
+import sys
+import time
+import unicodedata
+from typing import Any
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+EMBEDDING_MODEL = "models/embedding-001"
+LLM_MODEL = "gemini-1.5-flash-latest"
+
+
+class LatencyDistribution:
+    """
+    Latence simulée des backends factices, décrite par une chaîne :
+    '0.8' ou 'fixed:0.8', 'uniform:0.5,1.5', 'normal:1.0,0.2',
+    'lognormal:0.8,0.5' (médiane, sigma), 'exp:1.0' (moyenne).
+    Les tirages négatifs sont ramenés à 0.
+    """
+
+    KINDS = {
+        'fixed': lambda rng, value: value,
+        'uniform': lambda rng, low, high: rng.uniform(low, high),
+        'normal': lambda rng, mean, std: rng.gauss(mean, std),
+        'lognormal': lambda rng, median, sigma: median * rng.lognormvariate(0.0, sigma),
+        'exp': lambda rng, mean: rng.expovariate(1.0 / mean) if mean > 0 else 0.0,
+    }
+
+    def __init__(self, kind='fixed', params=(0.0,), seed=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"ERREUR: Distribution de latence inconnue : {kind}")
+        self.kind = kind
+        self.params = tuple(params)
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec, seed=None):
+        spec = str(spec).strip()
+        kind, _, params = spec.rpartition(':')
+        return cls(kind or 'fixed', [float(value) for value in params.split(',')], seed=seed)
+
+    def sample(self):
+        return max(0.0, self.KINDS[self.kind](self._rng, *self.params))
+
+    def __repr__(self):
+        return f"{self.kind}:{','.join(str(value) for value in self.params)}"
+
+
+def _sample(latency):
+    return latency.sample() if isinstance(latency, LatencyDistribution) else float(latency or 0.0)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embeddings locaux et déterministes, sans réseau : chaque mot (minuscule,
+    sans accents) est haché vers une dimension du vecteur ("hashing trick").
+    Deux textes qui partagent des mots ont donc des vecteurs proches, ce qui
+    suffit pour les tests et benchmarks hors ligne.
+
+    'latency' (secondes ou LatencyDistribution) simule la durée d'un appel
+    à l'API d'embeddings.
+    """
+
+    def __init__(self, size=256, latency=None):
+        self.size = size
+        self.latency = latency
+
+    def _embed(self, text):
+        text = unicodedata.normalize('NFKD', text.casefold())
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in re.findall(r'\w+', text):
+            digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+            value = int.from_bytes(digest, 'little')
+            vector[value % self.size] += 1.0 if (value >> 63) else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(_sample(self.latency))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        if self.latency:
+            time.sleep(_sample(self.latency))
+        return self._embed(text)
+
+    async def aembed_query(self, text):
+        if self.latency:
+            await asyncio.sleep(_sample(self.latency))
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    LLM local pour les benchmarks : renvoie toujours la même réponse après
+    'latency' secondes (nombre ou LatencyDistribution, tirée à chaque appel),
+    comme un appel à Gemini. Les variantes asynchrones attendent avec
+    asyncio.sleep et ne bloquent donc aucun thread.
+    """
+
+    answer: str = "Les frais académiques sont payables en deux tranches auprès de la comptabilité."
+    latency: Any = 1.0
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _words(self):
+        words = self.answer.split(' ')
+        return [word if i == 0 else ' ' + word for i, word in enumerate(words)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(_sample(self.latency))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(_sample(self.latency))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._words()
+        latency = _sample(self.latency)
+        for word in words:
+            time.sleep(latency / len(words))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._words()
+        latency = _sample(self.latency)
+        for word in words:
+            await asyncio.sleep(latency / len(words))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+
+def get_embeddings():
+    """
+    Backend d'embeddings choisi par la variable RAG_EMBEDDINGS :
+    'google' (défaut, API Gemini) ou 'fake' (HashingEmbeddings, hors ligne,
+    latence RAG_FAKE_EMBEDDING_LATENCY, voir LatencyDistribution).
+    """
+    backend = os.environ.get('RAG_EMBEDDINGS', 'google')
+    if backend == 'fake':
+        return HashingEmbeddings(
+            size=int(os.environ.get('RAG_FAKE_EMBEDDING_SIZE', 256)),
+            latency=_latency_from_env('RAG_FAKE_EMBEDDING_LATENCY', '0'),
+        )
+    if backend == 'google':
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
+    raise ValueError(f"ERREUR: Backend d'embeddings inconnu : {backend}")
+
+
+def embed_queries(embeddings, texts):
+    """
+    Embeddings de plusieurs questions en un seul appel (embed_documents).
+    Gemini distingue les textes à indexer des questions : il faut donc
+    demander le même task_type que embed_query(), sinon les vecteurs ne
+    sont pas comparables à ceux des questions posées une par une.
+    """
+    google = sys.modules.get('langchain_google_genai')
+    if google is not None and isinstance(embeddings, google.GoogleGenerativeAIEmbeddings):
+        return embeddings.embed_documents(texts, task_type=embeddings.task_type or "RETRIEVAL_QUERY")
+    return embeddings.embed_documents(texts)
+
+
+def get_llm():
+    """
+    LLM choisi par la variable RAG_LLM : 'google' (défaut, Gemini) ou 'fake'
+    (FakeChatModel, latence RAG_FAKE_LLM_LATENCY, par exemple '1.0' ou
+    'lognormal:0.8,0.5').
+    """
+    backend = os.environ.get('RAG_LLM', 'google')
+    if backend == 'fake':
+        return FakeChatModel(latency=_latency_from_env('RAG_FAKE_LLM_LATENCY', '1.0'))
+    if backend == 'google':
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=LLM_MODEL, temperature=0.2, convert_system_message_to_human=True)
+    raise ValueError(f"ERREUR: Backend LLM inconnu : {backend}")
+
+
+def _latency_from_env(name, default):
+    # RAG_FAKE_SEED rend les tirages reproductibles d'un benchmark à l'autre.
+    seed = os.environ.get('RAG_FAKE_SEED')
+    return LatencyDistribution.parse(os.environ.get(name, default), seed=int(seed) if seed else None)
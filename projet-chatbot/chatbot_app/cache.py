@@ -0,0 +1,202 @@
+# Fichier: chatbot_app/cache.py
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(query):
+    """
+    Normalise une question pour servir de clé de cache : minuscules,
+    sans accents, espaces compactés et ponctuation finale retirée.
+    "Quels sont les FRAIS ?" et "quels sont les frais" donnent la même clé.
+    """
+    text = unicodedata.normalize('NFKD', query.casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = ' '.join(text.split())
+    return text.rstrip(' ?!.;,')
+
+
+class _Entry:
+    __slots__ = ('answer', 'slot', 'expires_at', 'size')
+
+    def __init__(self, answer, slot, expires_at, size):
+        self.answer = answer
+        self.slot = slot
+        self.expires_at = expires_at
+        self.size = size
+
+
+class AnswerCache:
+    """
+    Cache des réponses du RAGService, placé devant la chaîne complète
+    (embedding distant + FAISS + Gemini).
+
+    - Correspondance exacte sur la question normalisée (aucun appel distant).
+    - Correspondance sémantique : si l'embedding d'une nouvelle question est
+      assez proche (cosinus >= similarity_threshold) d'une question déjà
+      servie, on renvoie la même réponse.
+    - Éviction LRU, expiration TTL, et double borne mémoire : nombre
+      d'entrées ET taille totale des réponses en octets.
+    - Invalidation automatique quand la version de l'index FAISS change.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, similarity_threshold=0.95, max_bytes=8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # clé normalisée -> _Entry, du plus ancien au plus récent
+        self._bytes = 0
+        self._index_version = None
+
+        # Les vecteurs sont rangés dans une matrice pré-allouée (une ligne par
+        # entrée) : la recherche sémantique est un seul produit matriciel.
+        self._vectors = None
+        self._slot_keys = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # --- Lecture ---
+
+    def get(self, query):
+        """Recherche exacte sur la question normalisée. Renvoie None si absent."""
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(key, entry):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.answer
+        return None
+
+    def get_similar(self, vector):
+        """
+        Recherche sémantique à partir de l'embedding de la question.
+        Compte un "miss" si rien n'est trouvé : c'est le dernier niveau du cache.
+        """
+        query_vector = self._normalize_vector(vector)
+        with self._lock:
+            if self._vectors is not None and self._entries and query_vector.shape[0] == self._vectors.shape[1]:
+                scores = self._vectors @ query_vector
+                # Les emplacements libres contiennent des zéros : ils ne peuvent
+                # pas dépasser un seuil strictement positif.
+                for slot in np.argsort(scores)[::-1]:
+                    if scores[slot] < self.similarity_threshold:
+                        break
+                    key = self._slot_keys[slot]
+                    entry = self._entries.get(key) if key is not None else None
+                    if entry is not None and self._is_fresh(key, entry):
+                        self._entries.move_to_end(key)
+                        self.semantic_hits += 1
+                        return entry.answer
+            self.misses += 1
+        return None
+
+    def record_miss(self):
+        """
+        Miss d'une question dont la recherche s'arrête avant get_similar()
+        (résultat BM25 net, sans embedding) : le cache sémantique n'est pas
+        consulté, mais la question n'a pas été trouvée dans le cache.
+        """
+        with self._lock:
+            self.misses += 1
+
+    # --- Écriture ---
+
+    def put(self, query, vector, answer, index_version=None):
+        """
+        'index_version' : version de l'index utilisé pour la réponse. Si
+        l'index a été rechargé entre-temps, la réponse n'est pas mise en cache.
+        """
+        key = normalize_query(query)
+        size = len(answer.encode('utf-8')) + len(key)
+        if size > self.max_bytes or not self.max_entries:
+            return
+        query_vector = self._normalize_vector(vector) if vector is not None else None
+
+        with self._lock:
+            if index_version is not None and index_version != self._index_version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and (not self._free_slots or self._bytes + size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+            slot = self._free_slots.pop()
+            if query_vector is not None:
+                if self._vectors is None or self._vectors.shape[1] != query_vector.shape[0]:
+                    self._vectors = np.zeros((self.max_entries, query_vector.shape[0]), dtype=np.float32)
+                self._vectors[slot] = query_vector
+            self._slot_keys[slot] = key
+            self._entries[key] = _Entry(answer, slot, time.monotonic() + self.ttl, size)
+            self._bytes += size
+
+    # --- Invalidation ---
+
+    def set_index_version(self, version):
+        """
+        À appeler à chaque chargement/reconstruction de l'index FAISS. Si la
+        version change, toutes les réponses mises en cache sont obsolètes.
+        """
+        with self._lock:
+            if self._index_version is not None and version != self._index_version:
+                self._clear()
+                self.invalidations += 1
+            self._index_version = version
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'index_version': self._index_version,
+            }
+
+    # --- Interne (appelé avec le verrou) ---
+
+    def _is_fresh(self, key, entry):
+        if entry.expires_at < time.monotonic():
+            self._remove(key)
+            return False
+        return True
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        if self._vectors is not None:
+            self._vectors[entry.slot] = 0.0
+        self._slot_keys[entry.slot] = None
+        self._free_slots.append(entry.slot)
+
+    def _clear(self):
+        for key in list(self._entries):
+            self._remove(key)
+
+    @staticmethod
+    def _normalize_vector(vector):
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
@@ -0,0 +1,349 @@
+# Fichier: chatbot_app/coalescing.py
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+from .admission import Overloaded
+
+
+class Flight:
+    """
+    Un calcul en cours pour une clé. Les threads suiveurs attendent l'Event ;
+    les coroutines suiveuses attendent un Future de leur propre boucle.
+    """
+
+    def __init__(self):
+        self.result = None
+        self.error = None
+        self.abandoned = False
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._async_waiters = []
+
+    def complete(self, result=None, error=None, abandoned=False):
+        with self._lock:
+            self.result, self.error, self.abandoned = result, error, abandoned
+            self._event.set()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def wait(self, timeout):
+        """Vrai si le calcul s'est terminé avant le timeout."""
+        return self._event.wait(timeout)
+
+    async def wait_async(self, timeout):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._event.is_set():
+                return True
+            self._async_waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class FlightHandle:
+    """
+    Ce que reçoit l'appelant de SingleFlight.flight() :
+    - done=True : un autre appel identique a déjà produit 'result' ;
+    - done=False : c'est à l'appelant de calculer, puis de fixer 'result'.
+    """
+
+    def __init__(self, done=False, result=None):
+        self.done = done
+        self.result = result
+
+
+class SQLiteFlightStore:
+    """
+    Coordination entre workers (processus) d'une même machine via un fichier
+    SQLite : une ligne par question en cours, réclamée par un seul worker.
+    Les autres workers interrogent la ligne jusqu'à ce que la réponse y soit
+    publiée. Une réclamation plus vieille que 'lease' secondes (worker mort)
+    est ignorée ; une réponse publiée reste lisible 'result_ttl' secondes.
+    """
+
+    def __init__(self, path, lease=60.0, result_ttl=5.0, poll_interval=0.05):
+        self.path = path
+        self.lease = lease
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._pid = None
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS flights ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, started_at REAL NOT NULL, "
+                "finished_at REAL, result TEXT)"
+            )
+
+    def _connection(self):
+        # Une connexion par thread (les connexions sqlite3 ne se partagent pas)
+        # et par processus : avec le preload de gunicorn, le store est créé
+        # dans le master, et une connexion SQLite ne doit pas être réutilisée
+        # après fork(). Chaque worker ouvre donc les siennes, sous son propre
+        # identifiant de propriétaire.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.owner = uuid.uuid4().hex
+            self._local = threading.local()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key):
+        """
+        Renvoie (True, None) si ce worker devient responsable du calcul,
+        sinon (False, état de la clé) comme poll().
+        """
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM flights WHERE finished_at < ? OR (finished_at IS NULL AND started_at < ?)",
+                         (now - self.result_ttl, now - self.lease))
+            inserted = conn.execute("INSERT OR IGNORE INTO flights (key, owner, started_at) VALUES (?, ?, ?)",
+                                    (key, self.owner, now)).rowcount
+        if inserted:
+            return True, None
+        return False, self.poll(key)
+
+    def poll(self, key):
+        """Renvoie ('done', réponse), ('pending', None) ou ('missing', None)."""
+        row = self._connection().execute("SELECT finished_at, result FROM flights WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return 'missing', None
+        return ('done', row[1]) if row[0] is not None else ('pending', None)
+
+    def publish(self, key, result):
+        with self._connection() as conn:
+            conn.execute("UPDATE flights SET result = ?, finished_at = ? WHERE key = ? AND owner = ?",
+                         (result, time.time(), key, self.owner))
+
+    def release(self, key):
+        """Abandon ou erreur : un autre worker pourra réclamer la clé."""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM flights WHERE key = ? AND owner = ?", (key, self.owner))
+
+
+class SingleFlight:
+    """
+    Regroupement des requêtes identiques en cours ("single flight").
+
+    Quand plusieurs appels avec la même clé (question normalisée) arrivent
+    en même temps, seul le premier (le "leader") fait la recherche et l'appel
+    à Gemini ; les autres attendent sa réponse au lieu de refaire le même
+    travail. Fonctionne entre threads et coroutines d'un même worker, et
+    entre workers si un SQLiteFlightStore est fourni.
+
+    Si le leader échoue, ses suiveurs reçoivent la même exception. S'il
+    abandonne (client déconnecté pendant un streaming) ou s'il est refusé
+    par le contrôle d'admission (Overloaded : la limite de son client, pas
+    celle des suiveurs), un suiveur prend le relais. Un suiveur qui attend
+    plus de 'timeout' secondes calcule lui-même sa réponse.
+    """
+
+    def __init__(self, store=None, timeout=60.0):
+        self.store = store
+        self.timeout = timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {'leaders': 0, 'followers': 0, 'shared_followers': 0, 'abandoned': 0, 'timeouts': 0}
+
+    @classmethod
+    def from_env(cls):
+        """
+        RAG_COALESCE_TIMEOUT : attente maximale d'un suiveur (secondes).
+        RAG_COALESCE_STORE : fichier SQLite partagé entre workers (optionnel).
+        """
+        timeout = float(os.environ.get('RAG_COALESCE_TIMEOUT', 60))
+        store_path = os.environ.get('RAG_COALESCE_STORE')
+        store = SQLiteFlightStore(store_path, lease=timeout) if store_path else None
+        return cls(store=store, timeout=timeout)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._flights)
+        stats['saved_calls'] = stats['followers'] + stats['shared_followers']
+        stats['shared_store'] = self.store is not None
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _join(self, key):
+        """Renvoie (flight, leader)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def _finish(self, key, flight, **outcome):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.complete(**outcome)
+
+    def _follow(self, flight):
+        """Issue d'une attente terminée : FlightHandle, exception levée, ou None pour réessayer."""
+        if flight.abandoned:
+            return None
+        if flight.error is not None:
+            raise flight.error
+        self._count('followers')
+        return FlightHandle(done=True, result=flight.result)
+
+    def _close(self, key, flight, handle, error):
+        """Fin du calcul du leader : publie la réponse, ou signale l'échec/l'abandon."""
+        if handle.result is not None:
+            self._store_call(self.store and self.store.publish, key, handle.result)
+            self._finish(key, flight, result=handle.result)
+            return
+        self._store_call(self.store and self.store.release, key)
+        if isinstance(error, Exception) and not isinstance(error, Overloaded):
+            self._finish(key, flight, error=error)
+        else:
+            # GeneratorExit, annulation, refus d'admission du leader, ou
+            # sortie sans réponse : un suiveur devient leader.
+            self._count('abandoned')
+            self._finish(key, flight, abandoned=True)
+
+    @contextmanager
+    def flight(self, key):
+        """
+        with single_flight.flight(cle) as handle:
+            if handle.done:
+                return handle.result
+            handle.result = calcul()
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                break
+            if not flight.wait(max(0.0, deadline - time.monotonic())):
+                self._count('timeouts')
+                yield FlightHandle()
+                return
+            handle = self._follow(flight)
+            if handle is not None:
+                yield handle
+                return
+
+        try:
+            handle = self._claim_shared(key, deadline)
+        except BaseException:
+            self._finish(key, flight, abandoned=True)
+            raise
+        if handle.done:
+            self._finish(key, flight, result=handle.result)
+            yield handle
+            return
+        self._count('leaders')
+        try:
+            yield handle
+        except BaseException as e:
+            self._close(key, flight, handle, e)
+            raise
+        self._close(key, flight, handle, None)
+
+    @asynccontextmanager
+    async def aflight(self, key):
+        """Variante de flight() pour les coroutines (async with)."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                break
+            if not await flight.wait_async(max(0.0, deadline - time.monotonic())):
+                self._count('timeouts')
+                yield FlightHandle()
+                return
+            handle = self._follow(flight)
+            if handle is not None:
+                yield handle
+                return
+
+        try:
+            handle = await self._aclaim_shared(key, deadline)
+        except BaseException:
+            self._finish(key, flight, abandoned=True)
+            raise
+        if handle.done:
+            self._finish(key, flight, result=handle.result)
+            yield handle
+            return
+        self._count('leaders')
+        try:
+            yield handle
+        except BaseException as e:
+            self._close(key, flight, handle, e)
+            raise
+        self._close(key, flight, handle, None)
+
+    def _claim_shared(self, key, deadline):
+        """Leader local : devient leader global, ou attend la réponse d'un autre worker."""
+        while self.store is not None:
+            claimed, (state, result) = self._try_claim(key)
+            if claimed:
+                break
+            if state == 'done':
+                self._count('shared_followers')
+                return FlightHandle(done=True, result=result)
+            if time.monotonic() >= deadline:
+                self._count('timeouts')
+                break
+            time.sleep(self.store.poll_interval)
+        return FlightHandle()
+
+    async def _aclaim_shared(self, key, deadline):
+        while self.store is not None:
+            claimed, (state, result) = self._try_claim(key)
+            if claimed:
+                break
+            if state == 'done':
+                self._count('shared_followers')
+                return FlightHandle(done=True, result=result)
+            if time.monotonic() >= deadline:
+                self._count('timeouts')
+                break
+            await asyncio.sleep(self.store.poll_interval)
+        return FlightHandle()
+
+    def _try_claim(self, key):
+        # Le store partagé n'est qu'une optimisation : en cas d'erreur SQLite,
+        # le worker calcule lui-même la réponse.
+        try:
+            claimed, poll = self.store.claim(key)
+        except sqlite3.Error as e:
+            logging.error(f"Error claiming shared flight: {e}")
+            return True, (None, None)
+        return claimed, poll or (None, None)
+
+    @staticmethod
+    def _store_call(method, *args):
+        if not method:
+            return
+        try:
+            method(*args)
+        except sqlite3.Error as e:
+            logging.error(f"Error updating shared flight store: {e}")
@@ -0,0 +1,188 @@
+# Fichier: chatbot_app/context.py
+import os
+import re
+import threading
+
+from langchain_core.documents import Document
+
+from .cache import normalize_query
+from .retrieval import query_terms
+
+# Estimation grossière, sans tokenizer : environ 4 caractères par token
+# pour du français chez Gemini.
+CHARS_PER_TOKEN = 4
+
+# Longueur minimale d'un chevauchement pour fusionner deux chunks.
+MIN_OVERLAP = 40
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _overlap(first, second):
+    """
+    Longueur du chevauchement entre la fin de 'first' et le début de
+    'second' (le chunk_overlap du découpage), 0 s'il n'y en a pas.
+    """
+    head = second[:MIN_OVERLAP]
+    if len(head) < MIN_OVERLAP:
+        return 0
+    start = first.find(head, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(head, start + 1)
+    return 0
+
+
+def _shingles(text):
+    words = re.findall(r"\w+", normalize_query(text))
+    return {tuple(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+class _Candidate:
+    __slots__ = ('text', 'metadata', 'rank', 'shingles')
+
+    def __init__(self, doc, rank):
+        self.text = doc.page_content
+        self.metadata = doc.metadata
+        self.rank = rank
+        self.shingles = None
+
+    def same_part(self, other):
+        # Même fichier et même page : seuls ces chunks peuvent se chevaucher.
+        return (self.metadata.get('source') == other.metadata.get('source')
+                and self.metadata.get('page') == other.metadata.get('page'))
+
+
+class ContextAssembler:
+    """
+    Prépare le contexte du prompt à partir des chunks retrouvés, au lieu de
+    les concaténer tels quels :
+    1. fusion des chunks voisins d'un même fichier (le chevauchement de
+       150 caractères n'est envoyé qu'une fois) ;
+    2. suppression des quasi-doublons (même texte dans deux fichiers,
+       Jaccard des trigrammes de mots >= dedup_threshold) ;
+    3. reclassement local : part des termes de la question présents dans le
+       chunk, plus 1 / (rang de la recherche + 1) ;
+    4. budget de tokens (max_tokens, 0 = pas de limite) : les chunks sont
+       pris dans l'ordre jusqu'au budget ; le premier est tronqué s'il le
+       dépasse à lui seul.
+    """
+
+    def __init__(self, max_tokens=1000, dedup_threshold=0.8, merge=True, rerank=True):
+        self.max_tokens = max_tokens
+        self.dedup_threshold = dedup_threshold
+        self.merge = merge
+        self.rerank = rerank
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'chars_in': 0, 'chars_out': 0, 'merged': 0, 'duplicates': 0, 'dropped': 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_tokens=int(os.environ.get('RAG_CONTEXT_MAX_TOKENS', 1000)),
+            dedup_threshold=float(os.environ.get('RAG_CONTEXT_DEDUP', 0.8)),
+            merge=os.environ.get('RAG_CONTEXT_MERGE', '1') != '0',
+            rerank=os.environ.get('RAG_CONTEXT_RERANK', '1') != '0',
+        )
+
+    def assemble(self, query, docs):
+        """Renvoie (documents à mettre dans le prompt, rapport)."""
+        candidates = [_Candidate(doc, rank) for rank, doc in enumerate(docs)]
+        report = {'chunks_in': len(docs), 'chars_in': len("\n\n".join(doc.page_content for doc in docs)),
+                  'merged': 0, 'duplicates': 0, 'dropped': 0, 'truncated': False}
+        if self.merge:
+            candidates = self._merge(candidates, report)
+        if self.dedup_threshold < 1:
+            candidates = self._deduplicate(candidates, report)
+        if self.rerank:
+            terms = query_terms(query)
+            if terms:
+                candidates.sort(key=lambda candidate: self._score(candidate, terms), reverse=True)
+        selected = self._fit_budget(candidates, report)
+
+        result = [Document(page_content=candidate.text, metadata=candidate.metadata) for candidate in selected]
+        report['chunks_out'] = len(result)
+        report['chars_out'] = len("\n\n".join(doc.page_content for doc in result))
+        with self._lock:
+            self.stats['requests'] += 1
+            for key in ('chars_in', 'chars_out', 'merged', 'duplicates', 'dropped'):
+                self.stats[key] += report[key]
+        return result, report
+
+    # --- Étapes ---
+
+    def _merge(self, candidates, report):
+        merged = []
+        for candidate in sorted(candidates, key=lambda c: c.rank):
+            for kept in merged:
+                if not kept.same_part(candidate):
+                    continue
+                if candidate.text in kept.text:
+                    break
+                overlap = _overlap(kept.text, candidate.text)
+                if overlap:
+                    kept.text += candidate.text[overlap:]
+                    break
+                overlap = _overlap(candidate.text, kept.text)
+                if overlap:
+                    kept.text = candidate.text + kept.text[overlap:]
+                    break
+            else:
+                merged.append(candidate)
+                continue
+            report['merged'] += 1
+        return merged
+
+    def _deduplicate(self, candidates, report):
+        kept = []
+        for candidate in candidates:
+            candidate.shingles = _shingles(candidate.text)
+            if any(self._similar(candidate.shingles, other.shingles) for other in kept):
+                report['duplicates'] += 1
+                continue
+            kept.append(candidate)
+        return kept
+
+    def _similar(self, first, second):
+        union = len(first | second)
+        return bool(union) and len(first & second) / union >= self.dedup_threshold
+
+    @staticmethod
+    def _score(candidate, terms):
+        words = set(re.findall(r"\w+", normalize_query(candidate.text)))
+        matched = sum(1 for term in terms if any(word.startswith(term) for word in words))
+        return matched / len(terms) + 1.0 / (candidate.rank + 1)
+
+    def _fit_budget(self, candidates, report):
+        if not self.max_tokens:
+            return candidates
+        selected = []
+        used = 0
+        for candidate in candidates:
+            # "\n\n" entre deux chunks : compté comme un token.
+            cost = estimate_tokens(candidate.text) + (1 if selected else 0)
+            if used + cost <= self.max_tokens:
+                selected.append(candidate)
+                used += cost
+            elif not selected:
+                candidate.text = _truncate(candidate.text, self.max_tokens * CHARS_PER_TOKEN)
+                report['truncated'] = True
+                selected.append(candidate)
+                used = self.max_tokens
+            else:
+                report['dropped'] += 1
+        return selected
+
+
+def _truncate(text, max_chars):
+    """Coupe à la dernière fin de phrase (ou de mot) avant max_chars."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    end = max(cut.rfind('. '), cut.rfind('\n'))
+    if end < max_chars // 2:
+        end = cut.rfind(' ')
+    return cut[:end + 1].rstrip() if end > 0 else cut
@@ -0,0 +1,238 @@
+# Fichier: chatbot_app/history.py
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import update
+
+from . import db
+from .cache import normalize_query
+from .models import Conversation, Message
+from .retrieval import query_terms
+
+# Historique d'une conversation pour les questions de suivi ("et pour la L2 ?") :
+# - les RAG_HISTORY_RECENT derniers messages sont gardés tels quels ;
+# - les plus anciens sont repliés dans un résumé (Conversation.summary),
+#   mis à jour par incréments en arrière-plan après chaque échange.
+# Le prompt de reformulation a donc une taille bornée, quelle que soit la
+# longueur de la conversation.
+HISTORY_RECENT = int(os.environ.get('RAG_HISTORY_RECENT', 4))
+# Taille maximale d'un message cité dans les prompts, et du résumé.
+HISTORY_MESSAGE_CHARS = int(os.environ.get('RAG_HISTORY_MESSAGE_CHARS', 400))
+SUMMARY_MAX_CHARS = int(os.environ.get('RAG_SUMMARY_MAX_CHARS', 1000))
+# Nombre maximal de messages repliés en une fois (conversations anciennes,
+# antérieures au résumé : seuls les plus récents sont pris en compte).
+SUMMARY_MAX_FOLD = int(os.environ.get('RAG_SUMMARY_MAX_FOLD', 20))
+# 'off' : pas de mise à jour du résumé (ni de l'appel au LLM qu'elle coûte) ;
+# les questions de suivi ne s'appuient alors que sur les messages récents.
+SUMMARY_MODE = os.environ.get('RAG_HISTORY_SUMMARY', 'on')
+
+# Indices d'une question qui dépend de la précédente.
+FOLLOW_UP_STARTS = ('et ', 'mais ', 'ou ', 'alors ', 'sinon ', 'pour ', 'aussi ', 'meme ')
+FOLLOW_UP_WORDS = frozenset("""
+    il elle ils elles ca cela ceci celui celle ceux celles cette ces lui leur leurs y dernier derniere
+    precedent precedente autre autres pareil idem meme
+""".split())
+
+REWRITE_PROMPT = """Reformule la dernière question de l'utilisateur en une question autonome,
+compréhensible sans la conversation (sigles, faculté, promotion et sujet explicites).
+Réponds uniquement par la question reformulée, sans commentaire.
+
+RÉSUMÉ DE LA CONVERSATION:
+{summary}
+
+DERNIERS MESSAGES:
+{messages}
+
+DERNIÈRE QUESTION:
+{question}
+
+QUESTION AUTONOME:"""
+
+SUMMARY_PROMPT = """Mets à jour le résumé d'une conversation entre un étudiant et UPL-Bot,
+l'assistant de l'Université Protestante de Lubumbashi. Garde les sujets abordés, la faculté,
+la promotion et les informations données ; au plus {max_chars} caractères, sans préambule.
+
+RÉSUMÉ ACTUEL:
+{summary}
+
+NOUVEAUX MESSAGES:
+{messages}
+
+RÉSUMÉ MIS À JOUR:"""
+
+
+class ConversationHistory:
+    """Résumé et derniers messages d'une conversation, lus avant l'appel au LLM."""
+
+    __slots__ = ('summary', 'messages')
+
+    def __init__(self, summary, messages):
+        self.summary = summary or ''
+        self.messages = messages      # [(is_user, content)], du plus ancien au plus récent
+
+    def __bool__(self):
+        return bool(self.summary or self.messages)
+
+
+def load_history(conversation_id, summary, summary_message_id):
+    """
+    Derniers messages non résumés de la conversation (au plus HISTORY_RECENT,
+    via l'index (conversation_id, timestamp, id)). 'summary' et
+    'summary_message_id' viennent de la ligne Conversation déjà lue.
+    """
+    query = db.session.query(Message.is_user, Message.content).filter(Message.conversation_id == conversation_id)
+    if summary_message_id is not None:
+        query = query.filter(Message.id > summary_message_id)
+    rows = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(HISTORY_RECENT).all()
+    return ConversationHistory(summary, [(is_user, content) for is_user, content in reversed(rows)])
+
+
+def _format_messages(messages):
+    lines = []
+    for is_user, content in messages:
+        content = ' '.join(content.split())
+        if len(content) > HISTORY_MESSAGE_CHARS:
+            content = content[:HISTORY_MESSAGE_CHARS].rsplit(' ', 1)[0] + '…'
+        lines.append(f"{'Utilisateur' if is_user else 'UPL-Bot'} : {content}")
+    return "\n".join(lines) or "(aucun)"
+
+
+class QueryRewriter:
+    """
+    Reformulation des questions de suivi en questions autonomes, pour la
+    recherche et le cache (la même question reformulée donne la même clé).
+
+    RAG_REWRITE :
+    - 'auto' (défaut) : seulement si la question semble dépendre de la
+      conversation (commence par "et", "pour"..., contient un pronom, ou a
+      au plus 'max_terms' termes significatifs) ; une question complète
+      n'ajoute donc pas d'appel au LLM ;
+    - 'always' : dès qu'il y a un historique ;
+    - 'off' : jamais (comportement d'origine).
+    """
+
+    def __init__(self, mode='auto', max_terms=1):
+        if mode not in ('auto', 'always', 'off'):
+            raise ValueError(f"ERREUR: RAG_REWRITE inconnu '{mode}' (attendu : auto, always, off)")
+        self.mode = mode
+        self.max_terms = max_terms
+        self._lock = threading.Lock()
+        self.stats = {'rewritten': 0, 'skipped': 0, 'summaries': 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(mode=os.environ.get('RAG_REWRITE', 'auto'),
+                   max_terms=int(os.environ.get('RAG_REWRITE_MAX_TERMS', 1)))
+
+    def needed(self, query, history):
+        if self.mode == 'off' or not history:
+            return False
+        if self.mode == 'always':
+            return True
+        text = normalize_query(query)
+        if text.startswith(FOLLOW_UP_STARTS):
+            return True
+        if any(word in FOLLOW_UP_WORDS for word in re.findall(r"\w+", text)):
+            return True
+        return len(query_terms(query)) <= self.max_terms
+
+    def rewrite_prompt(self, query, history):
+        return REWRITE_PROMPT.format(summary=history.summary or "(aucun)",
+                                     messages=_format_messages(history.messages), question=query)
+
+    def summary_prompt(self, summary, messages):
+        return SUMMARY_PROMPT.format(max_chars=SUMMARY_MAX_CHARS, summary=summary or "(aucun)",
+                                     messages=_format_messages(messages))
+
+    def clean(self, rewritten, query):
+        """Question reformulée, ou la question d'origine si la sortie du LLM est inutilisable."""
+        rewritten = ' '.join((rewritten or '').split()).strip('"« »')
+        with self._lock:
+            if not rewritten or len(rewritten) > 3 * len(query) + 200:
+                self.stats['skipped'] += 1
+                return query
+            self.stats['rewritten'] += 1
+        return rewritten
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+
+# --- Mise à jour du résumé, en arrière-plan ---
+
+_executor = None
+_executor_lock = threading.Lock()
+_refreshing = set()          # conversations dont le résumé est en cours de mise à jour
+
+
+def schedule_summary(app, conversation_id):
+    """
+    Replie les messages anciens de la conversation dans son résumé, dans un
+    thread de fond : la réponse à l'utilisateur n'attend pas ce second appel
+    au LLM. Une seule mise à jour à la fois par conversation.
+    """
+    global _executor
+    if SUMMARY_MODE == 'off':
+        return
+    with _executor_lock:
+        if conversation_id in _refreshing:
+            return
+        _refreshing.add(conversation_id)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=int(os.environ.get('RAG_SUMMARY_WORKERS', 1)),
+                                           thread_name_prefix='rag-summary')
+    _executor.submit(_refresh_summary, app, conversation_id)
+
+
+def _refresh_summary(app, conversation_id):
+    try:
+        with app.app_context():
+            refresh_summary(conversation_id)
+    except Exception as e:
+        logging.error(f"Error refreshing conversation summary: {e}")
+    finally:
+        with _executor_lock:
+            _refreshing.discard(conversation_id)
+
+
+def refresh_summary(conversation_id):
+    """
+    Met à jour le résumé si plus de HISTORY_RECENT messages n'y figurent pas
+    encore. Renvoie vrai si le résumé a changé.
+    """
+    from . import get_rag_service
+
+    row = db.session.query(Conversation.summary, Conversation.summary_message_id).filter_by(id=conversation_id).first()
+    if row is None:
+        return False
+    summary, summary_message_id = row
+    query = db.session.query(Message.id, Message.is_user, Message.content).filter(
+        Message.conversation_id == conversation_id)
+    if summary_message_id is not None:
+        query = query.filter(Message.id > summary_message_id)
+    # Les messages à replier sont ceux qui précèdent les HISTORY_RECENT derniers.
+    pending = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(
+        HISTORY_RECENT + SUMMARY_MAX_FOLD).all()
+    to_fold = list(reversed(pending[HISTORY_RECENT:]))
+    db.session.close()
+    if not to_fold:
+        return False
+
+    # Appel au LLM sans connexion tenue, comme pour les réponses.
+    new_summary = get_rag_service().summarize(summary, [(is_user, content) for _, is_user, content in to_fold])
+    last_id = max(message_id for message_id, _, _ in to_fold)
+    # Mise à jour conditionnelle : un autre worker a pu résumer entre-temps.
+    # updated_at est conservé (la liste des conversations est triée dessus).
+    current = (Conversation.summary_message_id.is_(None) if summary_message_id is None
+               else Conversation.summary_message_id == summary_message_id)
+    result = db.session.execute(
+        update(Conversation).where(Conversation.id == conversation_id, current)
+        .values(summary=new_summary[:SUMMARY_MAX_CHARS], summary_message_id=last_id,
+                updated_at=Conversation.updated_at)
+    )
+    db.session.commit()
+    return result.rowcount == 1
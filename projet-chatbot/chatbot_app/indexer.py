@@ -0,0 +1,321 @@
+# Fichier: chatbot_app/indexer.py
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from langchain_community.vectorstores import FAISS
+
+from .ann import IndexSpec, update_ann
+from .ingestion import EmbeddingPipeline
+from .parsing import SUPPORTED_EXTENSIONS, parse_files
+from .store import (DOCSTORE_FILE, INDEX_FILE, LEGACY_DOCSTORE_FILE, index_lock, legacy_store_exists,
+                    lexical_index_exists, load_editable_store, save_store)
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_ids(relative_path, chunks):
+    """
+    Identifiant stable de chaque chunk : hash de son fichier et de son contenu.
+    Un chunk inchangé garde donc le même identifiant d'une indexation à l'autre
+    (et n'est pas ré-embeddé). Les doublons exacts d'un même fichier sont
+    numérotés pour rester distincts.
+    """
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        digest = hashlib.sha256(f"{relative_path}\0{chunk.page_content}".encode('utf-8')).hexdigest()[:32]
+        seen[digest] = seen.get(digest, -1) + 1
+        ids.append(f"{digest}-{seen[digest]}")
+    return ids
+
+
+def _contents(files):
+    """Partie du manifeste qui décrit le contenu de l'index (sans les dates des fichiers)."""
+    return {path: (entry['sha256'], entry['chunks']) for path, entry in files.items()}
+
+
+def _relative_source(source, sources, by_path):
+    """
+    Fichier de la base de connaissances ('sources' : {chemin relatif: chemin
+    absolu}, 'by_path' : l'inverse) d'où vient un chunk de l'ancien index, ou
+    None. Le chemin enregistré peut venir d'une autre machine : à défaut du
+    chemin exact, on prend le plus long chemin relatif qui le termine.
+    """
+    if not source:
+        return None
+    relative_path = by_path.get(os.path.normcase(os.path.abspath(source)))
+    if relative_path is not None:
+        return relative_path
+    source = source.replace('\\', '/')
+    matches = [relative_path for relative_path in sources
+               if source == relative_path or source.endswith('/' + relative_path)]
+    return max(matches, key=len) if matches else None
+
+
+class KnowledgeBaseIndexer:
+    """
+    Indexation incrémentale du dossier knowledge_base/ dans l'index FAISS.
+
+    Un manifeste (db_faiss/manifest.json) garde, pour chaque fichier, le hash
+    de son contenu et la liste des identifiants de ses chunks. À chaque mise
+    à jour :
+    - les fichiers dont le hash n'a pas changé ne sont même pas relus ;
+    - pour un fichier modifié, seuls les chunks nouveaux sont embeddés, les
+      chunks disparus sont retirés de l'index et du docstore ;
+    - les chunks des fichiers supprimés sont retirés.
+
+    Les fichiers (texte, Markdown, PDF, DOCX, HTML) sont analysés dans un
+    pool de processus (voir parsing.py) ; leurs chunks passent au fil de
+    l'eau dans un EmbeddingPipeline (lots parallèles, backoff, reprise).
+    Le rapport donne la durée d'analyse de chaque fichier.
+
+    Si un index approché est demandé (index_spec, voir ann.py), il est
+    reconstruit à partir de l'index exact après chaque mise à jour.
+    """
+
+    def __init__(self, knowledge_base_dir, index_dir, embeddings, chunk_size=1200, chunk_overlap=150,
+                 extensions=SUPPORTED_EXTENSIONS, pipeline=None, index_spec=None, parse_workers=None):
+        self.knowledge_base_dir = knowledge_base_dir
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.pipeline = pipeline or EmbeddingPipeline.from_env(embeddings, checkpoint_dir=index_dir + ".checkpoint")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.extensions = tuple(extensions)
+        self.index_spec = index_spec or IndexSpec.from_env()
+        # Processus d'analyse des fichiers (RAG_PARSE_WORKERS, 0 = nombre de CPU).
+        self.parse_workers = parse_workers or int(os.environ.get('RAG_PARSE_WORKERS', 0)) or None
+
+    # --- Manifeste ---
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.index_dir, MANIFEST_NAME)
+
+    def _empty_manifest(self):
+        return {
+            'version': MANIFEST_VERSION,
+            'chunk_size': self.chunk_size,
+            'chunk_overlap': self.chunk_overlap,
+            'files': {},
+        }
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        # Un changement de découpage invalide tous les chunks existants.
+        if (manifest.get('version') != MANIFEST_VERSION
+                or manifest.get('chunk_size') != self.chunk_size
+                or manifest.get('chunk_overlap') != self.chunk_overlap):
+            return None
+        return manifest
+
+    # --- Fichiers sources ---
+
+    def _scan(self):
+        """Renvoie {chemin relatif: chemin absolu} des fichiers de la base de connaissances."""
+        root = Path(self.knowledge_base_dir)
+        return {
+            path.relative_to(root).as_posix(): str(path)
+            for path in sorted(root.rglob('*'))
+            # '~$...' : fichiers de verrouillage de Word, '.' : fichiers cachés.
+            if path.suffix.lower() in self.extensions and path.is_file() and not path.name.startswith(('~$', '.'))
+        }
+
+    # --- Mise à jour ---
+
+    def update(self, full=False):
+        """
+        Met l'index à jour et renvoie un rapport (nombre de chunks ajoutés,
+        retirés, conservés ; fichiers modifiés et supprimés). Deux mises à
+        jour du même index (plusieurs workers, index.py) s'exécutent l'une
+        après l'autre.
+        """
+        with index_lock(self.index_dir, 'write'):
+            return self._update(full)
+
+    def _update(self, full):
+        manifest = None if full else self._load_manifest()
+        vector_store = None
+        # Ancien format (pickle) ou docstore sans index BM25 : réécrit même
+        # si aucun fichier n'a changé, sans nouveaux appels d'embedding.
+        upgrade = legacy_store_exists(self.index_dir)
+        if manifest is None and upgrade and not full:
+            vector_store, manifest = self._convert_legacy()
+        elif manifest is not None and os.path.exists(os.path.join(self.index_dir, INDEX_FILE)):
+            vector_store = load_editable_store(self.index_dir, self.embeddings)
+            upgrade = upgrade or not lexical_index_exists(self.index_dir)
+        else:
+            manifest = self._empty_manifest()
+
+        report = {'added': 0, 'removed': 0, 'unchanged': 0, 'files_changed': [], 'files_deleted': [],
+                  'files_failed': [], 'parse': []}
+        old_files = manifest['files']
+        new_files = {}
+        to_remove = []     # ids des chunks à retirer
+
+        for batch in self.pipeline.run(self._changed_chunks(old_files, new_files, to_remove, report)):
+            pairs = zip(batch.texts, batch.vectors)
+            if vector_store is None:
+                vector_store = FAISS.from_embeddings(pairs, self.embeddings, metadatas=batch.metadatas, ids=batch.ids)
+            else:
+                vector_store.add_embeddings(pairs, metadatas=batch.metadatas, ids=batch.ids)
+            report['added'] += len(batch.ids)
+
+        if vector_store is not None and to_remove:
+            vector_store.delete(to_remove)
+        report['removed'] = len(to_remove)
+
+        if vector_store is None:
+            raise FileNotFoundError(f"ERREUR: Aucun document à indexer dans {self.knowledge_base_dir}")
+
+        manifest['files'] = new_files
+        if report['added'] or to_remove or _contents(new_files) != _contents(old_files) or upgrade:
+            self._save(vector_store, manifest)
+        elif new_files != old_files:
+            # Seules les dates ont changé (fichiers copiés, "touchés") : l'index
+            # reste le même, seul le manifeste est réécrit.
+            self._save_manifest(manifest)
+        self.pipeline.clear_checkpoint()
+        report['parse'].sort(key=lambda entry: entry['seconds'], reverse=True)
+        report['ann'] = update_ann(self.index_dir, vector_store, self.index_spec)
+        report['pipeline'] = dict(self.pipeline.stats)
+        return report
+
+    def _convert_legacy(self):
+        """
+        Index d'avant le manifeste (index.faiss + index.pkl, écrits par
+        FAISS.save_local) : reconstruit le manifeste et l'index à partir de ses
+        chunks et de ses vecteurs (index.reconstruct_n), sans appel
+        d'embedding. Les chunks gardent le découpage de l'ancien index ; un
+        fichier ne sera redécoupé qu'à sa prochaine modification (ou avec
+        python index.py --full). Renvoie (vector_store ou None, manifeste).
+        """
+        legacy = load_editable_store(self.index_dir, self.embeddings)
+        sources = self._scan()
+        by_path = {os.path.normcase(os.path.abspath(path)): relative_path for relative_path, path in sources.items()}
+        vectors = legacy.index.reconstruct_n(0, legacy.index.ntotal)
+        by_file = {}
+        dropped = 0
+        for position, doc_id in sorted(legacy.index_to_docstore_id.items()):
+            doc = legacy.docstore.search(doc_id)
+            relative_path = _relative_source(doc.metadata.get('source'), sources, by_path)
+            if relative_path is None:
+                # Fichier supprimé depuis la construction de l'ancien index.
+                dropped += 1
+                continue
+            by_file.setdefault(relative_path, []).append((doc, vectors[position]))
+
+        manifest = self._empty_manifest()
+        ids, pairs, metadatas = [], [], []
+        for relative_path, entries in by_file.items():
+            path = sources[relative_path]
+            stat = os.stat(path)
+            file_ids = chunk_ids(relative_path, [doc for doc, _ in entries])
+            manifest['files'][relative_path] = {'sha256': file_sha256(path), 'mtime_ns': stat.st_mtime_ns,
+                                                'size': stat.st_size, 'chunks': file_ids}
+            for chunk_id, (doc, vector) in zip(file_ids, entries):
+                ids.append(chunk_id)
+                pairs.append((doc.page_content, vector.tolist()))
+                metadatas.append(dict(doc.metadata, source=path))
+        print(f"INFO: {len(ids)} chunks de l'ancien index repris sans embedding"
+              f"{f' ({dropped} de fichiers supprimés ignorés)' if dropped else ''}.")
+        if not ids:
+            return None, manifest
+        return FAISS.from_embeddings(pairs, self.embeddings, metadatas=metadatas, ids=ids), manifest
+
+    def _changed_chunks(self, old_files, new_files, to_remove, report):
+        """
+        Générateur des (id, Document) à embedder. Remplit au passage le
+        nouveau manifeste, la liste des chunks à retirer et le rapport.
+        """
+        sources = self._scan()
+        to_parse = []
+        for relative_path, path in sources.items():
+            previous = old_files.get(relative_path)
+            stat = os.stat(path)
+            # Même taille et même date : le fichier n'est même pas relu.
+            if previous is not None and previous.get('mtime_ns') == stat.st_mtime_ns \
+                    and previous.get('size') == stat.st_size:
+                new_files[relative_path] = previous
+                report['unchanged'] += len(previous['chunks'])
+                continue
+            sha256 = file_sha256(path)
+            if previous is not None and previous['sha256'] == sha256:
+                new_files[relative_path] = dict(previous, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                report['unchanged'] += len(previous['chunks'])
+                continue
+            to_parse.append(((relative_path, {'sha256': sha256, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}),
+                             path))
+
+        for (relative_path, entry), chunks, seconds, error in parse_files(
+                to_parse, self.chunk_size, self.chunk_overlap, self.parse_workers):
+            previous = old_files.get(relative_path)
+            if error is not None:
+                # Fichier illisible (PDF corrompu...) : on garde ses anciens
+                # chunks, il sera réessayé à la prochaine mise à jour.
+                print(f"WARNING: {relative_path} n'a pas pu être analysé : {error}")
+                report['files_failed'].append({'file': relative_path, 'error': error})
+                if previous is not None:
+                    new_files[relative_path] = previous
+                    report['unchanged'] += len(previous['chunks'])
+                continue
+
+            ids = chunk_ids(relative_path, chunks)
+            report['parse'].append({'file': relative_path, 'seconds': round(seconds, 3), 'chunks': len(chunks)})
+            old_ids = set(previous['chunks']) if previous else set()
+            to_remove.extend(old_ids - set(ids))
+            report['unchanged'] += len(old_ids & set(ids))
+            report['files_changed'].append(relative_path)
+            new_files[relative_path] = dict(entry, chunks=ids)
+            for chunk_id, chunk in zip(ids, chunks):
+                if chunk_id not in old_ids:
+                    yield chunk_id, chunk
+
+        for relative_path in old_files.keys() - sources.keys():
+            to_remove.extend(old_files[relative_path]['chunks'])
+            report['files_deleted'].append(relative_path)
+
+    def _save_manifest(self, manifest):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _save(self, vector_store, manifest):
+        """
+        Écrit l'index dans un dossier temporaire puis remplace les fichiers un
+        par un : un lecteur concurrent ne voit jamais un fichier à moitié écrit.
+        Le manifeste est écrit en dernier. Le remplacement se fait sous le
+        verrou 'files' (voir store.index_lock).
+        """
+        tmp_dir = self.index_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        save_store(vector_store, tmp_dir)
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        with index_lock(self.index_dir):
+            for name in (INDEX_FILE, DOCSTORE_FILE, MANIFEST_NAME):
+                os.replace(os.path.join(tmp_dir, name), os.path.join(self.index_dir, name))
+            # Ancien format (pickle), désormais inutile.
+            legacy_path = os.path.join(self.index_dir, LEGACY_DOCSTORE_FILE)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
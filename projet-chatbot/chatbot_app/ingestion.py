@@ -0,0 +1,171 @@
+# Fichier: chatbot_app/ingestion.py
+import glob
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+# Un lot de chunks embeddés, prêt à être ajouté à l'index.
+EmbeddedBatch = namedtuple('EmbeddedBatch', ['ids', 'texts', 'metadatas', 'vectors'])
+
+
+def is_retryable(error):
+    """
+    Vrai pour les erreurs passagères de l'API d'embeddings : quota dépassé
+    (429 / ResourceExhausted) ou indisponibilité (500 / 503). Le client
+    LangChain ré-emballe souvent l'exception d'origine, d'où le test sur
+    le message en plus du type.
+    """
+    code = getattr(error, 'code', None)
+    if callable(code):
+        code = code()
+    if code in (429, 500, 503):
+        return True
+    message = f"{type(error).__name__} {error}"
+    return any(marker in message for marker in ('429', 'ResourceExhausted', 'RESOURCE_EXHAUSTED',
+                                                'rate limit', 'ServiceUnavailable', '503'))
+
+
+class EmbeddingPipeline:
+    """
+    Embedding des chunks par lots, en parallèle et avec reprise.
+
+    - Les chunks sont consommés au fil de l'eau (générateur) et regroupés en
+      lots de batch_size ; au plus 2 * max_workers lots sont en vol à la fois,
+      la mémoire reste donc bornée quelle que soit la taille du corpus.
+    - Les erreurs 429/503 sont réessayées avec un backoff exponentiel (et du
+      jitter pour que les threads ne se resynchronisent pas).
+    - Chaque lot embeddé est écrit dans checkpoint_dir : si la construction
+      est interrompue, la suivante réutilise ces vecteurs au lieu de refaire
+      les appels. Les identifiants de chunks étant dérivés de leur contenu,
+      un vecteur repris correspond toujours au bon texte.
+    """
+
+    def __init__(self, embeddings, batch_size=100, max_workers=4, max_retries=6,
+                 base_delay=1.0, max_delay=60.0, checkpoint_dir=None):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.checkpoint_dir = checkpoint_dir
+        self.stats = {'batches': 0, 'embedded': 0, 'resumed': 0, 'retries': 0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, embeddings, checkpoint_dir=None):
+        return cls(
+            embeddings,
+            batch_size=int(os.environ.get('RAG_EMBED_BATCH_SIZE', 100)),
+            max_workers=int(os.environ.get('RAG_EMBED_WORKERS', 4)),
+            max_retries=int(os.environ.get('RAG_EMBED_MAX_RETRIES', 6)),
+            checkpoint_dir=checkpoint_dir,
+        )
+
+    def run(self, chunks):
+        """
+        Consomme un itérable de (id, Document) et produit des EmbeddedBatch,
+        dans l'ordre où les lots se terminent.
+        """
+        self.stats = dict.fromkeys(self.stats, 0)
+        done = self._load_checkpoint()
+        resumed = []
+        batch = []
+        pending = set()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for chunk_id, doc in chunks:
+                if chunk_id in done:
+                    resumed.append((chunk_id, doc, done.pop(chunk_id)))
+                    if len(resumed) >= self.batch_size:
+                        yield self._resumed_batch(resumed)
+                        resumed = []
+                    continue
+
+                batch.append((chunk_id, doc))
+                if len(batch) >= self.batch_size:
+                    pending.add(pool.submit(self._embed_batch, batch))
+                    batch = []
+                    # Contre-pression : on n'avance dans le générateur de chunks
+                    # que si un lot s'est terminé.
+                    while len(pending) >= 2 * self.max_workers:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            yield future.result()
+
+            if batch:
+                pending.add(pool.submit(self._embed_batch, batch))
+            if resumed:
+                yield self._resumed_batch(resumed)
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield future.result()
+
+    def clear_checkpoint(self):
+        """À appeler une fois l'index sauvegardé : les vecteurs repris ne servent plus."""
+        if self.checkpoint_dir:
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+    # --- Interne ---
+
+    def _embed_batch(self, batch):
+        ids = [chunk_id for chunk_id, _ in batch]
+        texts = [doc.page_content for _, doc in batch]
+        metadatas = [doc.metadata for _, doc in batch]
+
+        attempt = 0
+        while True:
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                break
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                attempt += 1
+                with self._stats_lock:
+                    self.stats['retries'] += 1
+
+        self._save_checkpoint(ids, vectors)
+        with self._stats_lock:
+            self.stats['batches'] += 1
+            self.stats['embedded'] += len(ids)
+        return EmbeddedBatch(ids, texts, metadatas, vectors)
+
+    def _resumed_batch(self, resumed):
+        self.stats['resumed'] += len(resumed)
+        return EmbeddedBatch(
+            [chunk_id for chunk_id, _, _ in resumed],
+            [doc.page_content for _, doc, _ in resumed],
+            [doc.metadata for _, doc, _ in resumed],
+            [vector for _, _, vector in resumed],
+        )
+
+    def _save_checkpoint(self, ids, vectors):
+        if not self.checkpoint_dir:
+            return
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = os.path.join(self.checkpoint_dir, f"{uuid.uuid4().hex}.npz")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, ids=np.array(ids), vectors=np.asarray(vectors, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+    def _load_checkpoint(self):
+        done = {}
+        if not self.checkpoint_dir:
+            return done
+        for path in glob.glob(os.path.join(self.checkpoint_dir, "*.npz")):
+            with np.load(path) as data:
+                for chunk_id, vector in zip(data['ids'], data['vectors']):
+                    done[str(chunk_id)] = vector.tolist()
+        return done
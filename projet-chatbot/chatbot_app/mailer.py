@@ -0,0 +1,284 @@
+# Fichier: chatbot_app/mailer.py
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from flask_mail import Message as MailMessage
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+
+from . import db, mail
+from .models import OutboxEmail
+
+
+# --- Mise en file ---
+
+def queue_email(to, subject, html):
+    """
+    Ajoute l'email à la file d'envoi, dans la transaction en cours : il n'est
+    visible par le sender (et donc envoyé) qu'après le commit de l'appelant,
+    et disparaît avec un rollback.
+    """
+    db.session.add(OutboxEmail(recipient=to, subject=subject, html=html))
+    db.session.info['outbox_pending'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_sender_after_commit(session):
+    # Réveille le sender tout de suite plutôt qu'au prochain intervalle de scrutation.
+    if session.info.pop('outbox_pending', False) and _sender is not None:
+        _sender.wake()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_emails(session):
+    session.info.pop('outbox_pending', None)
+
+
+# --- Envoi ---
+
+class OutboxSender:
+    """
+    Vide la table email_outbox par lots, sur une seule connexion SMTP par lot.
+
+    Les emails sont d'abord "réclamés" (status='sending', avec un bail de
+    'lease' secondes) pour que plusieurs workers puissent tourner en même
+    temps : sous PostgreSQL, SKIP LOCKED évite qu'ils prennent les mêmes
+    lignes, et un email réclamé par un processus mort redevient disponible à
+    l'expiration du bail. Un échec est réessayé avec un délai exponentiel,
+    jusqu'à max_attempts tentatives (status='failed' ensuite).
+    """
+
+    def __init__(self, app, batch_size=20, poll_interval=5.0, max_attempts=5, retry_delay=30.0, lease=300.0):
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.stats = {'sent': 0, 'retried': 0, 'failed': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+
+    @classmethod
+    def from_config(cls, app):
+        return cls(
+            app,
+            batch_size=app.config['MAIL_OUTBOX_BATCH_SIZE'],
+            poll_interval=app.config['MAIL_OUTBOX_POLL_INTERVAL'],
+            max_attempts=app.config['MAIL_OUTBOX_MAX_ATTEMPTS'],
+            retry_delay=app.config['MAIL_OUTBOX_RETRY_DELAY'],
+        )
+
+    # --- Cycle de vie du thread ---
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name="outbox-sender", daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.drain_once()
+            except Exception as e:
+                logging.error(f"Error draining email outbox: {e}")
+                processed = 0
+            if not processed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    # --- Traitement d'un lot ---
+
+    def drain_once(self):
+        """Envoie un lot d'emails dus. Renvoie le nombre d'emails traités."""
+        with self.app.app_context():
+            batch = self._claim()
+            if batch:
+                self._record(batch, self._send(batch))
+            return len(batch)
+
+    def _claim(self):
+        now = datetime.utcnow()
+        rows = (
+            OutboxEmail.query
+            .filter(OutboxEmail.status.in_(('pending', 'sending')), OutboxEmail.next_attempt_at <= now)
+            .order_by(OutboxEmail.next_attempt_at, OutboxEmail.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        batch = []
+        for row in rows:
+            row.status = 'sending'
+            row.attempts += 1
+            row.next_attempt_at = now + timedelta(seconds=self.lease)
+            batch.append({'id': row.id, 'recipient': row.recipient, 'subject': row.subject, 'html': row.html,
+                          'attempts': row.attempts, 'created_at': row.created_at})
+        db.session.commit()
+        return batch
+
+    def _send(self, batch):
+        """Envoie le lot sur une seule connexion SMTP. Renvoie {id: exception ou None}."""
+        results = {}
+        sender = current_app.config['MAIL_DEFAULT_SENDER']
+        try:
+            with mail.connect() as connection:
+                for email in batch:
+                    try:
+                        connection.send(MailMessage(email['subject'], recipients=[email['recipient']],
+                                                    html=email['html'], sender=sender))
+                        results[email['id']] = None
+                    except Exception as e:
+                        results[email['id']] = e
+        except Exception as e:
+            # Connexion (ou déconnexion) impossible : les emails non envoyés sont réessayés.
+            for email in batch:
+                results.setdefault(email['id'], e)
+        return results
+
+    def _record(self, batch, results):
+        now = datetime.utcnow()
+        sent_ids = [email['id'] for email in batch if results[email['id']] is None]
+        if sent_ids:
+            db.session.execute(
+                update(OutboxEmail).where(OutboxEmail.id.in_(sent_ids))
+                .values(status='sent', sent_at=now, last_error=None)
+            )
+
+        retried = failed = 0
+        for email in batch:
+            error = results[email['id']]
+            if error is None:
+                continue
+            logging.error(f"Error sending email to {email['recipient']} (attempt {email['attempts']}): {error}")
+            if email['attempts'] >= self.max_attempts:
+                values = {'status': 'failed'}
+                failed += 1
+            else:
+                delay = self.retry_delay * 2 ** (email['attempts'] - 1)
+                values = {'status': 'pending', 'next_attempt_at': now + timedelta(seconds=delay)}
+                retried += 1
+            db.session.execute(
+                update(OutboxEmail).where(OutboxEmail.id == email['id']).values(last_error=str(error), **values)
+            )
+        db.session.commit()
+
+        latencies = [(now - email['created_at']).total_seconds() for email in batch if results[email['id']] is None]
+        with self._stats_lock:
+            self.stats['sent'] += len(latencies)
+            self.stats['retried'] += retried
+            self.stats['failed'] += failed
+            self.stats['latency_total'] += sum(latencies)
+            self.stats['latency_max'] = max([self.stats['latency_max']] + latencies)
+
+
+# --- Un sender par processus ---
+
+_sender = None
+_sender_lock = threading.Lock()
+_sender_pid = None
+
+
+def start_sender(app):
+    """
+    Démarre le thread d'envoi du processus courant s'il ne tourne pas déjà.
+    Appelé à la première requête de chaque worker (après le fork de gunicorn :
+    un thread démarré dans le master ne survivrait pas au fork).
+    """
+    global _sender, _sender_pid
+    if _sender is not None and _sender_pid == os.getpid() and _sender.is_alive():
+        return _sender
+    with _sender_lock:
+        if _sender is None or _sender_pid != os.getpid() or not _sender.is_alive():
+            _sender = OutboxSender.from_config(app)
+            _sender_pid = os.getpid()
+            _sender.start()
+    return _sender
+
+
+def outbox_stats():
+    """Profondeur de la file et latences d'envoi (depuis la création de l'email)."""
+    counts = dict(
+        db.session.query(OutboxEmail.status, func.count(OutboxEmail.id))
+        .filter(OutboxEmail.status.in_(('pending', 'sending', 'failed')))
+        .group_by(OutboxEmail.status)
+        .all()
+    )
+    oldest = db.session.query(func.min(OutboxEmail.created_at)).filter(
+        OutboxEmail.status.in_(('pending', 'sending'))).scalar()
+
+    stats = {
+        'pending': counts.get('pending', 0),
+        'sending': counts.get('sending', 0),
+        'failed': counts.get('failed', 0),
+        'oldest_pending_age_seconds': (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0,
+    }
+    if _sender is not None:
+        with _sender._stats_lock:
+            sender_stats = dict(_sender.stats)
+        latency_total = sender_stats.pop('latency_total')
+        sender_stats['latency_avg'] = latency_total / sender_stats['sent'] if sender_stats['sent'] else 0.0
+        stats['sender'] = sender_stats
+    return stats
+
+
+# --- Intégration Flask ---
+
+outbox_cli = AppGroup('outbox', help="File d'envoi des emails.")
+
+
+@outbox_cli.command('drain')
+def drain_command():
+    """Envoie tous les emails dus, puis s'arrête."""
+    sender = OutboxSender.from_config(current_app._get_current_object())
+    total = 0
+    while True:
+        processed = sender.drain_once()
+        if not processed:
+            break
+        total += processed
+    click.echo(f"Emails traités : {total} (envoyés : {sender.stats['sent']}, "
+               f"à réessayer : {sender.stats['retried']}, échecs : {sender.stats['failed']})")
+
+
+@outbox_cli.command('run')
+def run_command():
+    """Envoie les emails en continu (processus dédié, avec MAIL_OUTBOX_SENDER=off sur le web)."""
+    sender = OutboxSender.from_config(current_app._get_current_object())
+    click.echo("Sender de l'outbox démarré (Ctrl+C pour arrêter).")
+    try:
+        sender.run_forever()
+    except KeyboardInterrupt:
+        sender.stop()
+
+
+@outbox_cli.command('stats')
+def stats_command():
+    """Affiche la profondeur de la file."""
+    for key, value in outbox_stats().items():
+        click.echo(f"{key}: {value}")
+
+
+def init_app(app):
+    app.cli.add_command(outbox_cli)
+    if app.config['MAIL_OUTBOX_SENDER'] == 'thread':
+        @app.before_request
+        def _ensure_outbox_sender():
+            start_sender(app)
@@ -0,0 +1,221 @@
+# Fichier: chatbot_app/metrics.py
+import bisect
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Bornes (en secondes) des histogrammes de latence.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Histogramme cumulatif au format Prometheus. observe() ne fait qu'une
+    recherche dichotomique et trois additions sous un verrou : on peut
+    l'appeler à chaque requête sans coût mesurable.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labelvalues, (counts, total, count) in sorted(series.items()):
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labelvalues)]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = ','.join(labels + ['le="%s"' % le])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f"{{{','.join(labels)}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = []
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        histogram = Histogram(name, documentation, labelnames, buckets)
+        self.histograms.append(histogram)
+        return histogram
+
+    def render(self, values=None):
+        """
+        Texte d'exposition Prometheus. 'values' : {nom: (type, description,
+        valeur)} pour des valeurs tenues ailleurs (compteurs du cache...),
+        avec type 'gauge' ou 'counter'.
+        """
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for name, (kind, documentation, value) in (values or {}).items():
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+
+# Les métriques sont propres à chaque processus : avec plusieurs workers
+# gunicorn, chaque scrape de /metrics voit celles du worker qui répond.
+REGISTRY = Registry()
+RAG_STAGE_SECONDS = REGISTRY.histogram(
+    'rag_stage_seconds', "Durée de chaque étape d'une question (queue_wait, rewrite, embed, lexical, search, context, "
+                         "prompt, llm_first_token, llm_total, total) et des résumés de conversation (summary).",
+    ['stage'])
+DB_COMMIT_SECONDS = REGISTRY.histogram('db_commit_seconds', "Durée des commits SQLAlchemy (flush compris).")
+TEMPLATE_RENDER_SECONDS = REGISTRY.histogram('template_render_seconds', "Durée du rendu des templates.", ['template'])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_seconds', "Durée des requêtes HTTP (hors flux SSE).", ['endpoint', 'method', 'status'])
+
+
+# --- Trace par requête ---
+# Si le client envoie 'X-Trace: 1' (et METRICS_TRACE=1), les durées des
+# étapes de la requête sont renvoyées dans l'en-tête standard Server-Timing,
+# visible dans les outils de développement du navigateur.
+
+_trace = contextvars.ContextVar('metrics_trace', default=None)
+
+
+def trace_requested(header_value):
+    return header_value == '1' and os.environ.get('METRICS_TRACE', '0') == '1'
+
+
+def start_trace():
+    return _trace.set([])
+
+
+def end_trace(token):
+    spans = _trace.get()
+    _trace.reset(token)
+    return spans or []
+
+
+def server_timing(spans):
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans)
+
+
+def observe(histogram, seconds, *labelvalues, span):
+    """Enregistre une durée dans l'histogramme et, si la requête est tracée, dans sa trace."""
+    histogram.observe(seconds, *labelvalues)
+    spans = _trace.get()
+    if spans is not None:
+        spans.append((span, seconds))
+
+
+def observe_stage(stage, seconds):
+    observe(RAG_STAGE_SECONDS, seconds, stage, span=stage)
+
+
+@contextmanager
+def stage_timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+# --- Logs échantillonnés ---
+# Les questions et réponses ne sont plus écrites à chaque requête : seule une
+# fraction (RAG_LOG_SAMPLE_RATE, 1 % par défaut) est journalisée, tronquée.
+
+LOG_SAMPLE_RATE = float(os.environ.get('RAG_LOG_SAMPLE_RATE', 0.01))
+
+
+def log_sampled(logger, message):
+    if LOG_SAMPLE_RATE > 0 and random.random() < LOG_SAMPLE_RATE:
+        logger.info(message)
+
+
+# --- Durée des commits ---
+
+@event.listens_for(Session, 'before_commit')
+def _start_commit_timer(session):
+    session.info['metrics_commit_start'] = time.perf_counter()
+
+
+@event.listens_for(Session, 'after_commit')
+def _stop_commit_timer(session):
+    start = session.info.pop('metrics_commit_start', None)
+    if start is not None:
+        observe(DB_COMMIT_SECONDS, time.perf_counter() - start, span='db_commit')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_commit_timer(session):
+    session.info.pop('metrics_commit_start', None)
+
+
+# --- Intégration Flask ---
+
+def _before_render(sender, template, context, **extra):
+    g.setdefault('metrics_render_starts', []).append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    starts = g.get('metrics_render_starts')
+    if starts:
+        observe(TEMPLATE_RENDER_SECONDS, time.perf_counter() - starts.pop(), template.name or 'inline', span='render')
+
+
+def init_app(app):
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_start = time.perf_counter()
+        if trace_requested(request.headers.get('X-Trace')):
+            g.metrics_trace_token = start_trace()
+
+    @app.after_request
+    def _stop_request_timer(response):
+        start = g.pop('metrics_start', None)
+        if start is not None and not response.is_streamed:
+            elapsed = time.perf_counter() - start
+            HTTP_REQUEST_SECONDS.observe(elapsed, request.endpoint or 'not_found', request.method,
+                                         str(response.status_code))
+            token = g.pop('metrics_trace_token', None)
+            if token is not None:
+                spans = end_trace(token) + [('request', elapsed)]
+                response.headers['Server-Timing'] = server_timing(spans)
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        # Flux SSE ou exception : la trace n'a pas été renvoyée, on la referme
+        # pour ne pas la laisser attachée au thread.
+        token = g.pop('metrics_trace_token', None)
+        if token is not None:
+            end_trace(token)
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
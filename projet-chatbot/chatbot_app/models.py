@@ -31,21 +31,73 @@ class User(db.Model):
 
 class Conversation(db.Model):
     __tablename__ = 'conversations'
+    # Liste des conversations d'un utilisateur, triée par activité (pagination par curseur)
+    __table_args__ = (
+        db.Index('ix_conversations_user_id_updated_at', 'user_id', 'updated_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False, default="Nouvelle conversation")
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Résumé glissant des messages anciens (voir history.py) et id du dernier message qu'il couvre
+    summary = db.Column(db.Text)
+    summary_message_id = db.Column(db.Integer)
     
     # Relationship with messages
     messages = db.relationship('Message', backref='conversation', lazy=True, cascade='all, delete-orphan')
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    # Historique d'une conversation dans l'ordre chronologique (pagination par curseur)
+    __table_args__ = (
+        db.Index('ix_messages_conversation_id_timestamp', 'conversation_id', 'timestamp', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     is_user = db.Column(db.Boolean, nullable=False)  # True if message is from user, False if from bot
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ArchivedConversation(db.Model):
+    """
+    Conversation inactive déplacée hors des tables conversations/messages
+    (voir archive.py) : ses messages sont stockés ensemble, en JSON compressé.
+    """
+    __tablename__ = 'conversation_archive'
+    # Conversations archivées d'un utilisateur, les plus récentes d'abord
+    __table_args__ = (
+        db.Index('ix_conversation_archive_user_id_updated_at', 'user_id', 'updated_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)  # id d'origine de la conversation
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    payload = db.Column(db.LargeBinary, nullable=False)
+
+
+class OutboxEmail(db.Model):
+    """Email en attente d'envoi, écrit dans la même transaction que l'action qui le déclenche."""
+    __tablename__ = 'email_outbox'
+    # Le sender sélectionne les emails à envoyer par (status, next_attempt_at)
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
@@ -0,0 +1,176 @@
+# Fichier: chatbot_app/pagination.py
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_
+
+from . import db
+from .models import ArchivedConversation, Conversation, Message
+
+MESSAGE_PAGE_SIZE = 50
+CONVERSATION_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+# --- Curseurs ---
+# Pagination "keyset" : au lieu d'un OFFSET (qui relit toutes les lignes
+# sautées), le curseur contient la clé de tri (date, id) de la dernière ligne
+# renvoyée, et la page suivante commence juste après grâce aux index
+# composites définis dans models.py.
+
+def encode_cursor(moment, row_id):
+    raw = json.dumps([moment.isoformat(), row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Renvoie (datetime, id), ou None si le curseur est absent ou invalide."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        moment, row_id = json.loads(raw)
+        return datetime.fromisoformat(moment), int(row_id)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def page_size(value, default):
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+def _before(date_column, id_column, cursor):
+    """Lignes strictement avant le curseur dans l'ordre (date desc, id desc)."""
+    moment, row_id = cursor
+    return or_(date_column < moment, and_(date_column == moment, id_column < row_id))
+
+
+# --- Messages d'une conversation ---
+
+def message_page(conversation_id, before=None, limit=MESSAGE_PAGE_SIZE):
+    """
+    Renvoie les 'limit' messages les plus récents avant le curseur, dans
+    l'ordre chronologique, et le curseur de la page plus ancienne (ou None).
+    """
+    query = Message.query.filter(Message.conversation_id == conversation_id)
+    if before:
+        query = query.filter(_before(Message.timestamp, Message.id, before))
+    rows = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+
+    older_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        older_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    rows.reverse()
+    return rows, older_cursor
+
+
+def message_to_dict(message):
+    return {
+        'id': message.id,
+        'content': message.content,
+        'is_user': message.is_user,
+        'timestamp': message.timestamp.isoformat(),
+    }
+
+
+# --- Conversations d'un utilisateur ---
+
+def conversation_page(user_id, after=None, limit=CONVERSATION_PAGE_SIZE):
+    """
+    Une page de conversations (les plus récemment actives d'abord), avec pour
+    chacune le nombre de messages et un aperçu du dernier, calculés dans la
+    même requête (sous-requêtes corrélées servies par l'index des messages)
+    au lieu de charger la relation 'messages' de chaque conversation.
+    """
+    message_count = (
+        db.session.query(func.count(Message.id))
+        .filter(Message.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    last_message = (
+        db.session.query(func.substr(Message.content, 1, 100))
+        .filter(Message.conversation_id == Conversation.id)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(1)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    query = db.session.query(
+        Conversation.id,
+        Conversation.title,
+        Conversation.created_at,
+        Conversation.updated_at,
+        message_count.label('message_count'),
+        last_message.label('last_message'),
+    ).filter(Conversation.user_id == user_id)
+    if after:
+        query = query.filter(_before(Conversation.updated_at, Conversation.id, after))
+    rows = query.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def conversation_to_dict(row):
+    return {
+        'id': row.id,
+        'title': row.title,
+        'created_at': row.created_at.isoformat(),
+        'updated_at': row.updated_at.isoformat(),
+        'message_count': row.message_count,
+        'last_message': row.last_message,
+    }
+
+
+def archived_conversation_page(user_id, after=None, limit=CONVERSATION_PAGE_SIZE):
+    """Une page des conversations archivées (voir archive.py), sans leur contenu."""
+    query = db.session.query(
+        ArchivedConversation.id,
+        ArchivedConversation.title,
+        ArchivedConversation.created_at,
+        ArchivedConversation.updated_at,
+        ArchivedConversation.archived_at,
+        ArchivedConversation.message_count,
+    ).filter(ArchivedConversation.user_id == user_id)
+    if after:
+        query = query.filter(_before(ArchivedConversation.updated_at, ArchivedConversation.id, after))
+    rows = query.order_by(ArchivedConversation.updated_at.desc(), ArchivedConversation.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def archived_conversation_to_dict(row):
+    return {
+        'id': row.id,
+        'title': row.title,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+        'archived_at': row.archived_at.isoformat(),
+        'message_count': row.message_count,
+    }
+
+
+def user_history_stats(user_id):
+    """Nombre total de conversations et de messages d'un utilisateur (une requête)."""
+    conversations, messages = (
+        db.session.query(func.count(func.distinct(Conversation.id)), func.count(Message.id))
+        .select_from(Conversation)
+        .outerjoin(Message, Message.conversation_id == Conversation.id)
+        .filter(Conversation.user_id == user_id)
+        .one()
+    )
+    return {'conversations': conversations, 'messages': messages}
@@ -0,0 +1,149 @@
+# Fichier: chatbot_app/parsing.py
+import multiprocessing
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# --- Extraction du texte, par format ---
+# Chaque fonction renvoie une liste de Documents (un par page pour les PDF).
+
+
+def _parse_text(path):
+    from langchain_community.document_loaders import TextLoader
+    return TextLoader(path, encoding='utf-8', autodetect_encoding=True).load()
+
+
+def _parse_pdf(path):
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    if reader.is_encrypted:
+        # Beaucoup de PDF administratifs sont "chiffrés" sans mot de passe
+        # (simple restriction d'impression).
+        reader.decrypt('')
+    documents = []
+    for number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text() or ''
+        if text.strip():
+            documents.append(Document(page_content=text, metadata={'source': path, 'page': number}))
+    return documents
+
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def _parse_docx(path):
+    """Paragraphes (y compris ceux des tableaux) de word/document.xml, lus avec lxml."""
+    from lxml import etree
+
+    with zipfile.ZipFile(path) as archive:
+        root = etree.fromstring(archive.read('word/document.xml'))
+    paragraphs = []
+    for paragraph in root.iter(f'{WORD_NS}p'):
+        parts = []
+        for node in paragraph.iter(f'{WORD_NS}t', f'{WORD_NS}tab', f'{WORD_NS}br'):
+            if node.tag == f'{WORD_NS}t':
+                parts.append(node.text or '')
+            else:
+                parts.append('\t' if node.tag == f'{WORD_NS}tab' else '\n')
+        text = ''.join(parts).strip()
+        if text:
+            paragraphs.append(text)
+    return [Document(page_content="\n\n".join(paragraphs), metadata={'source': path})]
+
+
+HTML_BLOCK_TAGS = ('title', 'p', 'div', 'br', 'li', 'tr', 'section', 'article', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+
+
+def _parse_html(path):
+    import lxml.html
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    # Sans balise <meta charset>, lxml suppose du latin-1 : on décode nous-mêmes.
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        text = data.decode('cp1252', errors='replace')
+    root = lxml.html.fromstring(re.sub(r'^\s*<\?xml[^>]*\?>', '', text))
+    for node in root.xpath('//script|//style|//noscript|//template'):
+        node.drop_tree()
+    # Un saut de ligne après chaque bloc, sinon text_content() colle les
+    # paragraphes les uns aux autres.
+    for node in root.iter(*HTML_BLOCK_TAGS):
+        node.tail = "\n" + (node.tail or '')
+    text = re.sub(r'\n\s*\n+', "\n\n", root.text_content()).strip()
+    return [Document(page_content=text, metadata={'source': path})]
+
+
+PARSERS = {
+    '.txt': _parse_text,
+    '.md': _parse_text,
+    '.pdf': _parse_pdf,
+    '.docx': _parse_docx,
+    '.html': _parse_html,
+    '.htm': _parse_html,
+}
+SUPPORTED_EXTENSIONS = tuple(PARSERS)
+
+
+def parse_file(path, chunk_size, chunk_overlap):
+    """
+    Extrait et découpe un fichier. Exécutée dans un processus du pool :
+    renvoie (chunks, durée en secondes), les chunks étant des Documents.
+    """
+    start = time.perf_counter()
+    documents = PARSERS[os.path.splitext(path)[1].lower()](path)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = splitter.split_documents(documents)
+    return chunks, time.perf_counter() - start
+
+
+def _parse_job(job, chunk_size, chunk_overlap):
+    key, path = job
+    try:
+        chunks, seconds = parse_file(path, chunk_size, chunk_overlap)
+    except Exception as e:
+        return key, None, 0.0, f"{type(e).__name__}: {e}"
+    return key, chunks, seconds, None
+
+
+def parse_files(jobs, chunk_size, chunk_overlap, max_workers=None):
+    """
+    Analyse des fichiers dans un pool de processus (l'extraction du texte
+    des PDF est coûteuse en CPU et ne profite pas des threads).
+
+    'jobs' : liste de (clé, chemin). Produit (clé, chunks, durée, erreur)
+    dans l'ordre où les fichiers se terminent ; 'chunks' vaut None si le
+    fichier n'a pas pu être lu. Au plus 2 * max_workers fichiers sont en
+    cours à la fois : la mémoire reste bornée, et les chunks d'un fichier
+    partent à l'embedding pendant que les suivants sont analysés.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers <= 1 or len(jobs) <= 1:
+        # Pas de pool pour un seul fichier (mise à jour incrémentale courante).
+        for job in jobs:
+            yield _parse_job(job, chunk_size, chunk_overlap)
+        return
+
+    # 'spawn' : l'indexation peut être lancée depuis un thread du serveur
+    # (rechargement à chaud), et un fork avec des threads actifs est risqué.
+    context = multiprocessing.get_context('spawn')
+    pending = set()
+    jobs = iter(jobs)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        for job in jobs:
+            pending.add(pool.submit(_parse_job, job, chunk_size, chunk_overlap))
+            while len(pending) >= 2 * max_workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield future.result()
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield future.result()
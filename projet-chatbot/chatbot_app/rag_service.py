@@ -1,14 +1,28 @@
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from langchain_community.document_loaders import DirectoryLoader
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+from .ann import load_vector_store
+from .backends import embed_queries, get_embeddings, get_llm
+from .cache import AnswerCache, normalize_query
+from .admission import AdmissionController, Overloaded
+from .coalescing import SingleFlight
+from .history import QueryRewriter
+from .context import CHARS_PER_TOKEN, ContextAssembler
+from .indexer import KnowledgeBaseIndexer
+from .metrics import log_sampled, observe_stage, stage_timer
+from .reloader import IndexGeneration, IndexReloader
+from .retrieval import HybridRetriever
+from .store import index_lock, store_exists
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class RAGService:
     def __init__(self):
         print("Initialisation du RAGService...")
@@ -19,7 +33,8 @@ class RAGService:
 
         # On construit le chemin complet vers les dossiers, ce qui est infaillible.
         self.KNOWLEDGE_BASE_DIR = os.path.join(current_script_directory, "knowledge_base")
-        self.DB_FAISS_PATH = os.path.join(current_script_directory, "db_faiss")
+        # RAG_INDEX_DIR permet d'utiliser un autre index (benchmarks, tests).
+        self.DB_FAISS_PATH = os.environ.get('RAG_INDEX_DIR') or os.path.join(current_script_directory, "db_faiss")
         
         # On vérifie que le dossier knowledge_base existe bien à cet endroit
         if not os.path.isdir(self.KNOWLEDGE_BASE_DIR):
@@ -27,8 +42,27 @@ class RAGService:
             raise FileNotFoundError(f"ERREUR: Le dossier knowledge_base n'a pas été trouvé au chemin attendu: {self.KNOWLEDGE_BASE_DIR}")
         # -------------------------------------------------------------
 
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        self.llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0.2, convert_system_message_to_human=True)
+        self.embeddings = get_embeddings()
+        self.llm = get_llm()
+
+        # Cache des réponses : les étudiants posent sans cesse les mêmes questions.
+        self.answer_cache = AnswerCache(
+            max_entries=int(os.environ.get('RAG_CACHE_MAX_ENTRIES', 1024)),
+            ttl=float(os.environ.get('RAG_CACHE_TTL', 3600)),
+            similarity_threshold=float(os.environ.get('RAG_CACHE_SIMILARITY', 0.95)),
+            max_bytes=int(os.environ.get('RAG_CACHE_MAX_BYTES', 8 * 1024 * 1024)),
+        )
+        # Les questions identiques posées en même temps (annonce d'une date
+        # limite...) ne déclenchent qu'un seul calcul : voir coalescing.py.
+        self.single_flight = SingleFlight.from_env()
+        # Nombre d'appels simultanés au LLM borné, file d'attente équitable
+        # par client et refus rapide (429) au-delà : voir admission.py.
+        self.admission = AdmissionController.from_env()
+        # /api/ask_batch : nombre de générations lancées en parallèle par lot
+        # (chacune passe aussi par le contrôle d'admission).
+        self.batch_concurrency = int(os.environ.get('RAG_BATCH_CONCURRENCY', 4))
+        # Rechargement à chaud de l'index : voir reloader.py et reload_index().
+        self.reloader = IndexReloader(self, mode=os.environ.get('RAG_RELOAD', 'off'))
         
         self._load_or_create_vector_store()
         self._create_qa_chain()
@@ -37,22 +71,76 @@ class RAGService:
 
     def _load_or_create_vector_store(self):
         # Le reste du code n'a pas besoin de changer car il utilise les variables de classe
-        if os.path.exists(self.DB_FAISS_PATH):
+        if store_exists(self.DB_FAISS_PATH):
             print("INFO: Chargement de la base de données FAISS existante...")
-            self.vector_store = FAISS.load_local(self.DB_FAISS_PATH, self.embeddings, allow_dangerous_deserialization=True)
         else:
             print("INFO: Création de la base de données FAISS (cela peut prendre un moment)...")
-            loader = DirectoryLoader(self.KNOWLEDGE_BASE_DIR, glob="**/*.txt", show_progress=True)
-            documents = loader.load()
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=150)
-            texts = text_splitter.split_documents(documents)
-            self.vector_store = FAISS.from_documents(texts, self.embeddings)
-            self.vector_store.save_local(self.DB_FAISS_PATH)
+            # Construction via l'indexeur incrémental : il écrit aussi le manifeste
+            # qui permettra ensuite de ne ré-embedder que les chunks modifiés
+            # (voir index.py). Un index à l'ancien format (pickle, sans
+            # manifeste) est converti avec ses vecteurs, sans nouveaux
+            # appels d'embedding (voir KnowledgeBaseIndexer._convert_legacy).
+            KnowledgeBaseIndexer(self.KNOWLEDGE_BASE_DIR, self.DB_FAISS_PATH, self.embeddings).update()
             print("INFO: Base de données FAISS créée et sauvegardée.")
 
+        vector_store, version = load_vector_store(self.DB_FAISS_PATH, self.embeddings)
+        self.index = IndexGeneration(vector_store, version)
+        # Toute (re)construction de l'index rend les réponses en cache obsolètes.
+        self.answer_cache.set_index_version(version)
+
+    def reload_index(self, rebuild=False):
+        """
+        Charge l'index sur disque (après l'avoir mis à jour si 'rebuild') et le
+        substitue à l'index courant. Les requêtes en cours terminent leur
+        recherche sur l'ancien, libéré ensuite (voir IndexGeneration).
+        Renvoie (rapport de l'indexeur ou None, vrai si l'index a changé).
+        Appelé par IndexReloader, jamais pendant une requête.
+        """
+        report = None
+        if rebuild:
+            report = KnowledgeBaseIndexer(self.KNOWLEDGE_BASE_DIR, self.DB_FAISS_PATH, self.embeddings).update()
+        vector_store, version = load_vector_store(self.DB_FAISS_PATH, self.embeddings)
+        previous = self.index
+        if version == previous.version:
+            IndexGeneration(vector_store, version).retire()
+            return report, False
+
+        # Une simple affectation : atomique pour les threads comme pour la
+        # boucle asyncio.
+        self.index = IndexGeneration(vector_store, version)
+        self.answer_cache.set_index_version(version)
+        previous.retire()
+        print(f"INFO: Nouvel index chargé (version {version}).")
+        return report, True
+
+    def after_fork(self):
+        """
+        Worker créé par fork depuis le master (preload de gunicorn) : ouvre
+        les connexions SQLite de ce processus. Si l'index a été reconstruit
+        depuis le chargement du master (worker relancé plus tard), le worker
+        charge le nouvel index avant de servir.
+        """
+        docstore = self.index.vector_store.docstore
+        with index_lock(self.DB_FAISS_PATH, shared=True):
+            current = docstore.reopen() if hasattr(docstore, 'reopen') else True
+        if not current:
+            print("INFO: Index reconstruit depuis le chargement du master, rechargement dans le worker...")
+            self.reload_index()
+
     def _create_qa_chain(self):
-        # ... (le reste de la fonction est identique)
-        retriever = self.vector_store.as_retriever(search_kwargs={"k": 4})
+        # La recherche se fait dans ask() à partir de l'embedding déjà calculé
+        # pour le cache, et le prompt est assemblé dans _build_prompt() (pour
+        # chronométrer chaque étape) : la chaîne ne fait plus que LLM -> texte.
+        self.retriever_k = 4
+        # Recherche vectorielle + BM25 fusionnées, et raccourci sans embedding
+        # si BM25 est net (RAG_RETRIEVAL, voir retrieval.py).
+        self.retriever = HybridRetriever.from_env(k=self.retriever_k)
+        # Entre la recherche et le prompt : fusion des chunks voisins,
+        # doublons, reclassement et budget de tokens (voir context.py).
+        self.context = ContextAssembler.from_env()
+        # Questions de suivi reformulées à partir du résumé de la conversation
+        # (voir history.py).
+        self.rewriter = QueryRewriter.from_env()
         
         prompt_template = """
         Tu es "UPL-Bot", l'assistant IA officiel de l'Université Protestante de Lubumbashi.
@@ -69,22 +157,417 @@ class RAGService:
 
         RÉPONSE:
         """
-        prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
+        self.prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
         
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=retriever,
-            return_source_documents=False,
-            chain_type_kwargs={"prompt": prompt}
-        )
+        self.qa_chain = self.llm | StrOutputParser()
+
+    def rewrite(self, query, history, client=None):
+        """
+        Question autonome pour une question de suivi ("et pour la L2 ?"),
+        à partir du résumé et des derniers messages de la conversation
+        (history.ConversationHistory). Renvoie 'query' inchangée si ce
+        n'est pas nécessaire (voir QueryRewriter).
+        """
+        if not query or not query.strip() or not self.rewriter.needed(query, history):
+            return query
+        with self.admission.slot(client), stage_timer('rewrite'):
+            rewritten = self.qa_chain.invoke(self.rewriter.rewrite_prompt(query, history))
+        return self.rewriter.clean(rewritten, query)
+
+    async def arewrite(self, query, history, client=None):
+        if not query or not query.strip() or not self.rewriter.needed(query, history):
+            return query
+        async with self.admission.aslot(client):
+            with stage_timer('rewrite'):
+                rewritten = await self.qa_chain.ainvoke(self.rewriter.rewrite_prompt(query, history))
+        return self.rewriter.clean(rewritten, query)
+
+    def summarize(self, summary, messages):
+        """Nouveau résumé de conversation : 'summary' complété par 'messages' [(is_user, contenu)]."""
+        with self.admission.slot('summary'), stage_timer('summary'):
+            new_summary = self.qa_chain.invoke(self.rewriter.summary_prompt(summary, messages)).strip()
+        self.rewriter.count('summaries')
+        return new_summary
+
+    def _acquire_index(self):
+        while True:
+            generation = self.index
+            # Échoue seulement si la génération vient d'être libérée
+            # après un rechargement : on relit alors la nouvelle.
+            if generation.acquire():
+                return generation
 
-    def ask(self, query: str) -> str:
-        # ... (le reste de la fonction est identique)
+    def _lexical(self, query):
+        """Recherche BM25 (voir HybridRetriever.lexical) : (résultat ou None, version de l'index)."""
+        with stage_timer('lexical'):
+            generation = self._acquire_index()
+            try:
+                return self.retriever.lexical(generation.vector_store, query), generation.version
+            finally:
+                generation.release()
+
+    def _retrieve(self, query, query_vector, lexical):
+        """
+        Renvoie (documents, version de l'index interrogé). 'query_vector' et
+        'lexical' viennent de _lookup() ; le premier vaut None si l'embedding
+        a été évité.
+        """
+        lexical, lexical_version = lexical
+        with stage_timer('search'):
+            generation = self._acquire_index()
+            try:
+                if lexical_version != generation.version:
+                    # Index rechargé depuis la recherche BM25 : ses positions
+                    # ne correspondent plus.
+                    lexical = self.retriever.lexical(generation.vector_store, query)
+                docs = self.retriever.search(generation.vector_store, query_vector, lexical)
+            finally:
+                generation.release()
+            return docs, generation.version
+
+    def _retrieve_batch(self, queries, query_vectors, lexicals):
+        """_retrieve() pour plusieurs questions : une seule recherche FAISS."""
+        with stage_timer('search'):
+            generation = self._acquire_index()
+            try:
+                vector_store = generation.vector_store
+                lexicals = [result if version == generation.version else self.retriever.lexical(vector_store, query)
+                            for query, (result, version) in zip(queries, lexicals)]
+                docs = self.retriever.search_batch(vector_store, query_vectors, lexicals)
+            finally:
+                generation.release()
+            return docs, generation.version
+
+    @staticmethod
+    def _format_context(docs):
+        # Même assemblage que la chaîne "stuff" de LangChain.
+        return "\n\n".join(doc.page_content for doc in docs)
+
+    def _build_prompt(self, query, docs):
+        with stage_timer('context'):
+            docs, report = self.context.assemble(query, docs)
+        log_sampled(logger, f"rag context chunks={report['chunks_in']}->{report['chunks_out']} "
+                            f"merged={report['merged']} duplicates={report['duplicates']} dropped={report['dropped']} "
+                            f"chars={report['chars_in']}->{report['chars_out']} "
+                            f"saved_tokens~{(report['chars_in'] - report['chars_out']) // CHARS_PER_TOKEN}")
+        with stage_timer('prompt'):
+            return self.prompt.invoke({"context": self._format_context(docs), "question": query})
+
+    def _lookup(self, query):
+        """
+        Consulte le cache. Renvoie (réponse, None, None) en cas de hit, sinon
+        (None, embedding de la question ou None, résultat BM25) pour
+        poursuivre avec _retrieve().
+        """
+        # 1. Question déjà posée (à la casse/accents près) : aucun appel distant.
+        answer = self.answer_cache.get(query)
+        if answer is not None:
+            return answer, None, None
+
+        # 2. Résultat BM25 net (RAG_RETRIEVAL=lexical_first) : pas d'appel à
+        # l'API d'embedding, ni donc de cache sémantique.
+        lexical = self._lexical(query)
+        if lexical[0] is not None and lexical[0].decisive:
+            self.answer_cache.record_miss()
+            return None, None, lexical
+
+        # 3. L'embedding sert à la fois au cache sémantique et à la recherche FAISS.
+        with stage_timer('embed'):
+            query_vector = self.embeddings.embed_query(query)
+        return self.answer_cache.get_similar(query_vector), query_vector, lexical
+
+    def _done(self, mode, source, query, answer, start):
+        """Durée totale (histogramme) et, pour une fraction des questions, une ligne de log."""
+        elapsed = time.perf_counter() - start
+        observe_stage('total', elapsed)
+        log_sampled(logger, f"rag mode={mode} source={source} question={query[:80]!r} "
+                            f"answer_chars={len(answer)} total_ms={elapsed * 1000:.0f}")
+
+    def ask(self, query: str, client=None) -> str:
+        """
+        'client' (utilisateur ou adresse IP) sert au tour de rôle de la file
+        d'attente ; lève admission.Overloaded si le service est saturé.
+        """
         if not query or not query.strip():
             return "Veuillez poser une question valide."
-        
-        print(f"INFO: Réception de la question : '{query}'")
-        result = self.qa_chain.invoke({"query": query})
-        print(f"INFO: Réponse générée : '{result['result']}'")
-        return result['result']
\ No newline at end of file
+        start = time.perf_counter()
+
+        answer = self.answer_cache.get(query)
+        if answer is not None:
+            self._done('ask', 'cache', query, answer, start)
+            return answer
+
+        with self.single_flight.flight(normalize_query(query)) as flight:
+            if flight.done:
+                self._done('ask', 'coalesced', query, flight.result, start)
+                return flight.result
+
+            answer, query_vector, lexical = self._lookup(query)
+            source = 'cache'
+            if answer is None:
+                # 4. Cache manqué : recherche + génération complète, dans la
+                # limite des appels simultanés au LLM.
+                with self.admission.slot(client):
+                    docs, index_version = self._retrieve(query, query_vector, lexical)
+                    prompt = self._build_prompt(query, docs)
+                    with stage_timer('llm_total'):
+                        answer = self.qa_chain.invoke(prompt)
+                self.answer_cache.put(query, query_vector, answer, index_version=index_version)
+                source = 'llm'
+            flight.result = answer
+        self._done('ask', source, query, answer, start)
+        return answer
+
+    def ask_batch(self, queries, client=None):
+        """
+        Répond à une liste de questions (route /api/ask_batch). Renvoie, dans
+        le même ordre, un dict par question : {'answer', 'source'} ou, si
+        elle échoue, {'error', 'status'} (et 'retry_after' si le service est
+        saturé) ; les autres questions du lot ne sont pas affectées.
+
+        Les étapes communes sont groupées : un seul appel d'embedding pour
+        toutes les questions absentes du cache, une seule recherche FAISS
+        pour la matrice obtenue. Les générations tournent ensuite en
+        parallèle, au plus RAG_BATCH_CONCURRENCY à la fois.
+        """
+        start = time.perf_counter()
+        results = [None] * len(queries)
+        pending = {}      # question normalisée -> positions dans le lot (doublons calculés une fois)
+        for i, query in enumerate(queries):
+            if not isinstance(query, str) or not query.strip():
+                results[i] = {'error': "Veuillez poser une question valide.", 'status': 400}
+                continue
+            answer = self.answer_cache.get(query)
+            if answer is not None:
+                results[i] = {'answer': answer, 'source': 'cache'}
+            else:
+                pending.setdefault(normalize_query(query), []).append(i)
+
+        positions = list(pending.values())
+        texts = [queries[indices[0]] for indices in positions]
+        try:
+            todo, docs, index_version = self._lookup_batch(texts, results, positions)
+        except Exception as e:
+            logger.exception(f"Error in batch retrieval: {e}")
+            for indices in positions:
+                for i in indices:
+                    results[i] = {'error': "Erreur lors de la recherche dans la base de connaissances", 'status': 500}
+            todo = []
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(self.batch_concurrency, len(todo)),
+                                    thread_name_prefix='rag-batch') as pool:
+                futures = [pool.submit(self._generate, texts[j], vector, documents, index_version, client)
+                           for (j, vector), documents in zip(todo, docs)]
+                for (j, _), future in zip(todo, futures):
+                    try:
+                        answer, source = future.result()
+                        result = {'answer': answer, 'source': source}
+                    except Overloaded as e:
+                        result = {'error': str(e), 'status': 429, 'retry_after': e.retry_after}
+                    except Exception as e:
+                        logger.exception(f"Error generating batch answer: {e}")
+                        result = {'error': "Erreur lors de la génération de la réponse", 'status': 500}
+                    for i in positions[j]:
+                        results[i] = result
+
+        observe_stage('total', time.perf_counter() - start)
+        log_sampled(logger, f"rag mode=batch questions={len(queries)} distinct={len(texts)} "
+                            f"generated={len(todo)} total_ms={(time.perf_counter() - start) * 1000:.0f}")
+        return results
+
+    def _lookup_batch(self, texts, results, positions):
+        """
+        _lookup() pour les questions distinctes 'texts' du lot : remplit
+        'results' pour celles trouvées dans le cache sémantique et renvoie
+        ([(indice, embedding)], documents, version de l'index) pour les autres.
+        """
+        lexicals = [self._lexical(text) for text in texts]
+        to_embed = [j for j, (lexical, _) in enumerate(lexicals) if not (lexical is not None and lexical.decisive)]
+        vectors = [None] * len(texts)
+        if to_embed:
+            with stage_timer('embed'):
+                embedded = embed_queries(self.embeddings, [texts[j] for j in to_embed])
+            for j, vector in zip(to_embed, embedded):
+                vectors[j] = vector
+
+        todo = []
+        for j, vector in enumerate(vectors):
+            if vector is None:
+                self.answer_cache.record_miss()
+                answer = None
+            else:
+                answer = self.answer_cache.get_similar(vector)
+            if answer is None:
+                todo.append((j, vector))
+                continue
+            for i in positions[j]:
+                results[i] = {'answer': answer, 'source': 'cache'}
+        if not todo:
+            return todo, [], None
+        docs, index_version = self._retrieve_batch([texts[j] for j, _ in todo], [vector for _, vector in todo],
+                                                   [lexicals[j] for j, _ in todo])
+        return todo, docs, index_version
+
+    def _generate(self, query, query_vector, docs, index_version, client):
+        """Génération d'une réponse du lot : (réponse, source)."""
+        with self.single_flight.flight(normalize_query(query)) as flight:
+            if flight.done:
+                return flight.result, 'coalesced'
+            with self.admission.slot(client):
+                prompt = self._build_prompt(query, docs)
+                with stage_timer('llm_total'):
+                    answer = self.qa_chain.invoke(prompt)
+            self.answer_cache.put(query, query_vector, answer, index_version=index_version)
+            flight.result = answer
+        return answer, 'llm'
+
+    def stream(self, query: str, client=None):
+        """
+        Variante de ask() qui produit la réponse morceau par morceau, au fur
+        et à mesure que le LLM la génère (interface .stream() de la chaîne).
+
+        Si le consommateur abandonne le générateur (client déconnecté),
+        le flux du LLM est fermé et la génération s'arrête ; une réponse
+        incomplète n'est jamais mise en cache. La place du contrôle
+        d'admission est tenue pendant tout le flux.
+        """
+        if not query or not query.strip():
+            yield "Veuillez poser une question valide."
+            return
+        start = time.perf_counter()
+
+        answer = self.answer_cache.get(query)
+        if answer is not None:
+            self._done('stream', 'cache', query, answer, start)
+            yield answer
+            return
+
+        # Un appel identique déjà en cours : sa réponse est envoyée d'un bloc.
+        with self.single_flight.flight(normalize_query(query)) as flight:
+            if flight.done:
+                self._done('stream', 'coalesced', query, flight.result, start)
+                yield flight.result
+                return
+
+            answer, query_vector, lexical = self._lookup(query)
+            if answer is not None:
+                flight.result = answer
+                self._done('stream', 'cache', query, answer, start)
+                yield answer
+                return
+
+            with self.admission.slot(client):
+                docs, index_version = self._retrieve(query, query_vector, lexical)
+                prompt = self._build_prompt(query, docs)
+                chunks = []
+                llm_start = time.perf_counter()
+                llm_stream = self.qa_chain.stream(prompt)
+                try:
+                    for chunk in llm_stream:
+                        if not chunks:
+                            observe_stage('llm_first_token', time.perf_counter() - llm_start)
+                        chunks.append(chunk)
+                        yield chunk
+                finally:
+                    llm_stream.close()
+                observe_stage('llm_total', time.perf_counter() - llm_start)
+
+            answer = "".join(chunks)
+            self.answer_cache.put(query, query_vector, answer, index_version=index_version)
+            flight.result = answer
+        self._done('stream', 'llm', query, answer, start)
+
+    # --- Variantes asynchrones (mode ASGI, voir asgi.py) ---
+    # Même logique que ask() et stream(), mais l'appel à Gemini passe par
+    # ainvoke()/astream() : pendant l'attente, la boucle d'évènements sert
+    # les autres requêtes au lieu de bloquer un thread par question.
+
+    async def _alookup(self, query):
+        answer = self.answer_cache.get(query)
+        if answer is not None:
+            return answer, None, None
+        # SQLite local : la recherche BM25 ne bloque pas la boucle plus qu'une
+        # recherche FAISS.
+        lexical = self._lexical(query)
+        if lexical[0] is not None and lexical[0].decisive:
+            self.answer_cache.record_miss()
+            return None, None, lexical
+        with stage_timer('embed'):
+            query_vector = await self.embeddings.aembed_query(query)
+        return self.answer_cache.get_similar(query_vector), query_vector, lexical
+
+    async def aask(self, query: str, client=None) -> str:
+        if not query or not query.strip():
+            return "Veuillez poser une question valide."
+        start = time.perf_counter()
+
+        answer = self.answer_cache.get(query)
+        if answer is not None:
+            self._done('aask', 'cache', query, answer, start)
+            return answer
+
+        async with self.single_flight.aflight(normalize_query(query)) as flight:
+            if flight.done:
+                self._done('aask', 'coalesced', query, flight.result, start)
+                return flight.result
+
+            answer, query_vector, lexical = await self._alookup(query)
+            source = 'cache'
+            if answer is None:
+                async with self.admission.aslot(client):
+                    docs, index_version = self._retrieve(query, query_vector, lexical)
+                    prompt = self._build_prompt(query, docs)
+                    with stage_timer('llm_total'):
+                        answer = await self.qa_chain.ainvoke(prompt)
+                self.answer_cache.put(query, query_vector, answer, index_version=index_version)
+                source = 'llm'
+            flight.result = answer
+        self._done('aask', source, query, answer, start)
+        return answer
+
+    async def astream(self, query: str, client=None):
+        if not query or not query.strip():
+            yield "Veuillez poser une question valide."
+            return
+        start = time.perf_counter()
+
+        answer = self.answer_cache.get(query)
+        if answer is not None:
+            self._done('astream', 'cache', query, answer, start)
+            yield answer
+            return
+
+        async with self.single_flight.aflight(normalize_query(query)) as flight:
+            if flight.done:
+                self._done('astream', 'coalesced', query, flight.result, start)
+                yield flight.result
+                return
+
+            answer, query_vector, lexical = await self._alookup(query)
+            if answer is not None:
+                flight.result = answer
+                self._done('astream', 'cache', query, answer, start)
+                yield answer
+                return
+
+            async with self.admission.aslot(client):
+                docs, index_version = self._retrieve(query, query_vector, lexical)
+                prompt = self._build_prompt(query, docs)
+                chunks = []
+                llm_start = time.perf_counter()
+                llm_stream = self.qa_chain.astream(prompt)
+                try:
+                    async for chunk in llm_stream:
+                        if not chunks:
+                            observe_stage('llm_first_token', time.perf_counter() - llm_start)
+                        chunks.append(chunk)
+                        yield chunk
+                finally:
+                    await llm_stream.aclose()
+                observe_stage('llm_total', time.perf_counter() - llm_start)
+
+            answer = "".join(chunks)
+            self.answer_cache.put(query, query_vector, answer, index_version=index_version)
+            flight.result = answer
+        self._done('astream', 'llm', query, answer, start)
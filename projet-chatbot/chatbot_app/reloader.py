@@ -0,0 +1,202 @@
+# Fichier: chatbot_app/reloader.py
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import request
+
+
+class IndexGeneration:
+    """
+    Un index chargé (vector store + version). Les requêtes l'empruntent le
+    temps de leur recherche via acquire()/release() ; après un rechargement,
+    l'ancienne génération est retirée et sa mémoire (index FAISS projeté,
+    connexion SQLite) libérée dès que sa dernière recherche en cours se
+    termine, sans attendre le ramasse-miettes.
+    """
+
+    def __init__(self, vector_store, version):
+        self.vector_store = vector_store
+        self.version = version
+        self.loaded_at = datetime.utcnow()
+        self._readers = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Faux si la génération a déjà été libérée : relire la génération courante."""
+        with self._lock:
+            if self.vector_store is None:
+                return False
+            self._readers += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._readers -= 1
+            free = self._retired and self._readers == 0
+        if free:
+            self._free()
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            free = self._readers == 0
+        if free:
+            self._free()
+
+    def _free(self):
+        with self._lock:
+            vector_store, self.vector_store = self.vector_store, None
+        if vector_store is not None:
+            close = getattr(vector_store.docstore, 'close', None)
+            if close:
+                close()
+            vector_store.index = None
+
+
+class IndexReloader:
+    """
+    Rechargement à chaud de l'index d'un RAGService, sans redémarrer les
+    workers. Selon RAG_RELOAD :
+    - 'off' (défaut) : seulement sur demande (POST /api/admin/reload) ;
+    - 'index' : un thread surveille db_faiss/ et charge le nouvel index dès
+      qu'il est écrit (par python index.py ou par un autre worker) ;
+    - 'watch' : surveille aussi knowledge_base/ et reconstruit l'index
+      (de façon incrémentale) quand un fichier change.
+
+    Le chargement se fait dans un thread de fond ; les requêtes en cours
+    continuent sur l'ancien index et les suivantes passent sur le nouveau
+    dès qu'il est prêt (voir RAGService.reload_index).
+    """
+
+    def __init__(self, service, mode='off'):
+        if mode not in ('off', 'index', 'watch'):
+            raise ValueError(f"ERREUR: RAG_RELOAD inconnu '{mode}' (attendu : off, index, watch)")
+        self.service = service
+        self.mode = mode
+        self._reload_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._thread = None
+        self._pending = None          # rechargement demandé pendant qu'un autre tourne
+        self._watcher = None
+        self._watcher_pid = None
+        self._stop = threading.Event()
+        self.state = {'running': False, 'reloads': 0, 'last_reload': None, 'last_duration': None,
+                      'last_report': None, 'last_error': None}
+
+    # --- Rechargement ---
+
+    def reload(self, rebuild=False):
+        """Recharge (et reconstruit si 'rebuild') l'index, de façon synchrone."""
+        with self._reload_lock:
+            self._set_state(running=True)
+            start = time.perf_counter()
+            try:
+                report, swapped = self.service.reload_index(rebuild=rebuild)
+            except Exception as e:
+                logging.error(f"Error reloading index: {e}")
+                self._set_state(running=False, last_error=str(e))
+                raise
+            with self._state_lock:
+                self.state.update(running=False, last_error=None, last_duration=time.perf_counter() - start,
+                                  last_report=_summary(report))
+                if swapped:
+                    self.state['reloads'] += 1
+                    self.state['last_reload'] = datetime.utcnow().isoformat(timespec='seconds')
+            return swapped
+
+    def trigger(self, rebuild=False):
+        """
+        Lance reload() dans un thread de fond. Si un rechargement est déjà en
+        cours, un second est enchaîné après lui (un seul, quel que soit le
+        nombre de demandes). Renvoie False dans ce cas.
+        """
+        with self._state_lock:
+            if self._thread is not None:
+                self._pending = bool(self._pending) or rebuild
+                return False
+            self._thread = threading.Thread(target=self._run, args=(rebuild,), name="rag-reload", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, rebuild):
+        while True:
+            try:
+                self.reload(rebuild)
+            except Exception:
+                pass
+            with self._state_lock:
+                if self._pending is None:
+                    self._thread = None
+                    return
+                rebuild, self._pending = self._pending, None
+
+    def status(self):
+        with self._state_lock:
+            state = dict(self.state)
+        generation = self.service.index
+        state.update(mode=self.mode, index_version=generation.version,
+                     loaded_at=generation.loaded_at.isoformat(timespec='seconds'))
+        return state
+
+    def _set_state(self, **values):
+        with self._state_lock:
+            self.state.update(values)
+
+    # --- Surveillance des fichiers ---
+
+    def ensure_watching(self):
+        """
+        Démarre le thread de surveillance du processus courant s'il ne tourne
+        pas déjà. Appelé à la première requête de chaque worker (un thread
+        démarré dans le master de gunicorn ne survivrait pas au fork).
+        """
+        if self.mode == 'off' or self._watcher_pid == os.getpid():
+            return
+        with self._state_lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+            self._watcher = threading.Thread(target=self._watch, name="rag-index-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        from watchfiles import watch
+
+        index_dir = os.path.abspath(self.service.DB_FAISS_PATH)
+        knowledge_base_dir = os.path.abspath(self.service.KNOWLEDGE_BASE_DIR)
+        paths = [index_dir] + ([knowledge_base_dir] if self.mode == 'watch' else [])
+        print(f"INFO: Surveillance de {', '.join(paths)} pour le rechargement de l'index.")
+        try:
+            for changes in watch(*paths, stop_event=self._stop):
+                changed = [path for _, path in changes]
+                # Le manifeste et ann.json sont les derniers fichiers écrits
+                # par l'indexeur : l'index est alors complet sur disque.
+                if self.mode == 'watch' and any(path.startswith(knowledge_base_dir + os.sep) for path in changed):
+                    self.trigger(rebuild=True)
+                elif any(os.path.basename(path) in ('manifest.json', 'ann.json') for path in changed):
+                    self.trigger()
+        except Exception as e:
+            logging.error(f"Error watching index files: {e}")
+
+
+def _summary(report):
+    if report is None:
+        return None
+    return {key: report[key] for key in ('added', 'removed', 'unchanged', 'files_changed', 'files_deleted')}
+
+
+def init_app(app):
+    @app.before_request
+    def _ensure_index_watcher():
+        from . import get_rag_service, rag_status
+        # Seulement une fois le RAGService chargé : la surveillance ne doit
+        # pas déclencher son chargement.
+        if rag_status()['status'] == 'ready' and request.endpoint not in ('static', 'assets'):
+            get_rag_service().reloader.ensure_watching()
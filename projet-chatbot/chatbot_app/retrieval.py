@@ -0,0 +1,174 @@
+# Fichier: chatbot_app/retrieval.py
+import os
+import re
+import threading
+
+import numpy as np
+
+from .cache import normalize_query
+
+# Mots vides ignorés par la recherche lexicale : ils apparaissent dans
+# presque tous les chunks et ne font que diluer le score BM25.
+STOPWORDS = frozenset("""
+    au aux avec ce ces comment dans de des du elle en est et etre eux il ils je la le les leur leurs lui ma
+    mais me meme mes moi mon ne nos notre nous on ou par pas pour qu quand que quel quelle quelles quels qui
+    sa sans se ses son sont sur ta te tes toi ton tu un une vos votre vous ai as avez avoir combien faut
+    fait peut peux puis quoi dois doit
+""".split())
+
+RETRIEVAL_MODES = ('vector', 'hybrid', 'lexical_first')
+
+
+def query_terms(text):
+    """
+    Termes significatifs d'un texte : minuscules, sans accents ni mots vides.
+    Un pluriel en -s/-x est ramené au singulier ("inscriptions" -> "inscription"),
+    la recherche se faisant ensuite par préfixe.
+    """
+    terms = []
+    for word in re.findall(r"\w+", normalize_query(text)):
+        if word in STOPWORDS or (len(word) < 2 and not word.isdigit()):
+            continue
+        if len(word) > 3 and word[-1] in 'sx':
+            word = word[:-1]
+        if word not in terms:
+            terms.append(word)
+    return terms
+
+
+def _match_expression(terms):
+    # Chaque terme entre guillemets (jamais interprété comme opérateur FTS5),
+    # suivi de '*' pour la recherche par préfixe.
+    return " OR ".join(f'"{term}"*' for term in terms)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fusionne plusieurs classements (listes de positions) : chaque position
+    reçoit la somme des 1 / (k + rang). Seul le rang compte, on peut donc
+    combiner des scores BM25 et des distances L2 sans les normaliser.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking, start=1):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class LexicalResult:
+    """Résultat BM25 d'une question : positions classées et décision du raccourci."""
+
+    __slots__ = ('positions', 'decisive')
+
+    def __init__(self, positions, decisive):
+        self.positions = positions
+        self.decisive = decisive
+
+
+class HybridRetriever:
+    """
+    Recherche des chunks d'une question, selon RAG_RETRIEVAL :
+    - 'vector' : FAISS seul (comportement d'origine) ;
+    - 'hybrid' (défaut) : FAISS et BM25 (index FTS5 du docstore), fusionnés
+      par rang réciproque (RRF). Les questions contenant un sigle, un nom
+      ou un montant ("TFC", "KWANG SOO", "1320") retrouvent le bon chunk
+      même quand l'embedding les rapproche d'autre chose ;
+    - 'lexical_first' : comme 'hybrid', mais si le résultat BM25 est net
+      (voir lexical()), la question n'est pas du tout envoyée à l'API
+      d'embedding et les chunks BM25 sont utilisés seuls.
+    """
+
+    def __init__(self, k=4, mode='hybrid', fetch_k=20, rrf_k=60, margin=1.5, max_terms=8):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"ERREUR: RAG_RETRIEVAL inconnu '{mode}' (attendu : {', '.join(RETRIEVAL_MODES)})")
+        self.k = k
+        self.mode = mode
+        self.fetch_k = max(fetch_k, k)
+        self.rrf_k = rrf_k
+        self.margin = margin
+        self.max_terms = max_terms
+        self._lock = threading.Lock()
+        self.stats = {'vector': 0, 'hybrid': 0, 'lexical': 0}
+
+    @classmethod
+    def from_env(cls, k=4):
+        return cls(
+            k=k,
+            mode=os.environ.get('RAG_RETRIEVAL', 'hybrid'),
+            fetch_k=int(os.environ.get('RAG_HYBRID_FETCH_K', 20)),
+            rrf_k=int(os.environ.get('RAG_RRF_K', 60)),
+            margin=float(os.environ.get('RAG_LEXICAL_MARGIN', 1.5)),
+            max_terms=int(os.environ.get('RAG_LEXICAL_MAX_TERMS', 8)),
+        )
+
+    def lexical(self, vector_store, query):
+        """
+        Recherche BM25. Renvoie None en mode 'vector' ou si l'index n'a pas
+        de table FTS5 (il sera complété à la prochaine indexation).
+
+        Le résultat est "décisif" (mode 'lexical_first') si :
+        - la question a peu de termes significatifs (au plus max_terms) ;
+        - le premier chunk les contient tous ;
+        - son score dépasse celui du deuxième d'un facteur 'margin'.
+        """
+        docstore = vector_store.docstore
+        if self.mode == 'vector' or not getattr(docstore, 'lexical', False):
+            return None
+        terms = query_terms(query)
+        if not terms:
+            return LexicalResult([], False)
+        hits = docstore.lexical_search(_match_expression(terms), self.fetch_k)
+        decisive = False
+        if self.mode == 'lexical_first' and hits and len(terms) <= self.max_terms:
+            clear_lead = len(hits) == 1 or hits[0][1] >= self.margin * hits[1][1]
+            if clear_lead:
+                top_words = set(re.findall(r"\w+", normalize_query(docstore.search(hits[0][0]).page_content)))
+                decisive = all(any(word.startswith(term) for word in top_words) for term in terms)
+        return LexicalResult([position for position, _ in hits], decisive)
+
+    def search(self, vector_store, query_vector, lexical=None):
+        """
+        Renvoie les k Documents retenus. 'query_vector' vaut None quand
+        l'embedding a été évité : seuls les résultats BM25 sont alors utilisés.
+        """
+        vector_positions = None
+        if query_vector is not None:
+            fetch = self.fetch_k if lexical and lexical.positions else self.k
+            vector_positions = self._vector_search(vector_store, query_vector, fetch)
+        return self._select(vector_store, vector_positions, lexical)
+
+    def search_batch(self, vector_store, query_vectors, lexicals):
+        """
+        search() pour plusieurs questions (/api/ask_batch) : une seule
+        recherche FAISS pour la matrice des embeddings disponibles.
+        """
+        rows = [i for i, vector in enumerate(query_vectors) if vector is not None]
+        vector_positions = {}
+        if rows:
+            fetch = self.fetch_k if any(lexical and lexical.positions for lexical in lexicals) else self.k
+            matrix = np.asarray([query_vectors[i] for i in rows], dtype=np.float32)
+            _, indices = vector_store.index.search(matrix, fetch)
+            for i, row in zip(rows, indices):
+                vector_positions[i] = [int(position) for position in row if position != -1]
+        return [self._select(vector_store, vector_positions.get(i), lexical) for i, lexical in enumerate(lexicals)]
+
+    def _select(self, vector_store, vector_positions, lexical):
+        if vector_positions is None:
+            positions, path = (lexical.positions if lexical else []), 'lexical'
+        elif lexical and lexical.positions:
+            positions = reciprocal_rank_fusion([vector_positions, lexical.positions], self.rrf_k)
+            path = 'hybrid'
+        else:
+            positions, path = vector_positions, 'vector'
+        with self._lock:
+            self.stats[path] += 1
+        docstore = vector_store.docstore
+        return [docstore.search(position) for position in positions[:self.k]]
+
+    @staticmethod
+    def _vector_search(vector_store, query_vector, k):
+        # Même recherche que FAISS.similarity_search_by_vector(), mais on garde
+        # les positions pour la fusion.
+        vector = np.asarray([query_vector], dtype=np.float32)
+        _, indices = vector_store.index.search(vector, k)
+        return [int(position) for position in indices[0] if position != -1]
@@ -1,9 +1,24 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, current_app, Response, stream_with_context
 from . import db # On importe 'db' depuis le fichier app.py principal
-from .models import User, Conversation, Message
+from .models import User, Conversation, Message, ArchivedConversation
+from .pagination import (MESSAGE_PAGE_SIZE, CONVERSATION_PAGE_SIZE, decode_cursor, page_size, message_page,
+                         message_to_dict, conversation_page, conversation_to_dict, archived_conversation_page,
+                         archived_conversation_to_dict, user_history_stats)
 from chatbot_app.utils import generate_confirmation_token, confirm_token, send_email # Le chemin complet est plus sûr
+import hmac
+import json
 import logging
-from . import db, rag_service
+import os
+from datetime import datetime
+from sqlalchemy import delete, insert, update
+from . import get_rag_service, rag_status
+from .admission import Overloaded
+from .archive import load_archived_conversation, restore_conversation
+from .auth import bearer_token, current_identity, forget_identity, identity_cache_stats, issue_token, request_user_id
+from .history import HISTORY_RECENT, load_history, schedule_summary
+from .search import SEARCH_PAGE_SIZE, decode_search_cursor, encode_search_cursor, search_hit_to_dict, search_messages
+from .mailer import outbox_stats
+from .metrics import REGISTRY
 
 main_bp = Blueprint('main', __name__)
 @main_bp.route('/')
@@ -60,18 +75,16 @@ def register():
     user = User(nom=nom, postnom=postnom, prenom=prenom, email=email)
     user.set_password(password)
     db.session.add(user)
-    db.session.commit()
     
-    # --- BLOC D'ENVOI D'EMAIL SANS TRY...EXCEPT ---
-    # Si une erreur se produit ici, l'application va crasher et afficher la trace d'erreur complète.
-    print("Tentative d'envoi de l'email de confirmation...")
+    # L'email de confirmation est mis en file dans la même transaction que
+    # l'utilisateur : il part en arrière-plan une fois le compte enregistré,
+    # sans faire attendre la réponse sur le serveur SMTP.
     token = generate_confirmation_token(user.email)
     confirm_url = url_for('main.confirm_email', token=token, _external=True)
     html = render_template('emails/confirm_email.html', user=user, confirm_url=confirm_url)
     
     send_email(user.email, "Veuillez confirmer votre email", html)
-    
-    print("Email envoyé avec succès (selon le code).")
+    db.session.commit()
 
     flash('Un email de confirmation a été envoyé à votre adresse.', 'success')
     return redirect(url_for('main.auth'))
@@ -93,9 +106,11 @@ def send_confirmation_email(user_id):
     
     try:
         send_email(user.email, "Confirmation de votre compte", html_content)
+        db.session.commit()
         flash('Un email de confirmation a été envoyé.', 'success')
     except Exception as e:
-        logging.error(f"Error sending confirmation email: {e}")
+        db.session.rollback()
+        logging.error(f"Error queuing confirmation email: {e}")
         flash('Erreur lors de l\'envoi de l\'email de confirmation.', 'error')
     
     return redirect(url_for('main.auth'))
@@ -115,13 +130,14 @@ def test_email_route():
         
         print(f"Envoi de l'email de test à {recipient_email}...")
         
-        # On appelle la fonction d'envoi
+        # On met l'email dans la file d'envoi
         send_email(recipient_email, "Email de Test depuis Flask", html_content)
+        db.session.commit()
         
-        print("--- La fonction send_email a été appelée sans crash. ---")
+        print("--- L'email a été mis en file d'envoi. ---")
         
-        # Si on arrive ici, cela signifie qu'aucune erreur n'a été levée.
-        return "<h1>Test d'envoi d'email terminé !</h1><p>La fonction a été appelée. Vérifiez votre boîte de réception et le terminal pour les erreurs.</p>"
+        # L'envoi réel se fait en arrière-plan : voir /api/outbox/stats.
+        return "<h1>Test d'envoi d'email terminé !</h1><p>L'email a été mis en file d'envoi. Vérifiez votre boîte de réception, /api/outbox/stats et le terminal pour les erreurs.</p>"
 
     except Exception as e:
         # Si une erreur se produit, on l'affiche directement dans le navigateur
@@ -163,7 +179,7 @@ def home():
     if 'user_id' not in session: 
         return redirect(url_for('main.auth'))
     
-    user = User.query.get(session['user_id'])
+    user = current_identity()
     
     # --- NOUVELLE VÉRIFICATION ---
     # Si l'utilisateur n'existe plus dans la base de données,
@@ -180,21 +196,33 @@ def home():
 @main_bp.route('/chat/<int:conversation_id>')
 def chat(conversation_id=None):
     if 'user_id' not in session: return redirect(url_for('main.auth'))
-    user = User.query.get(session['user_id'])
+    user = current_identity()
     
     conversation = None
     messages = []
+    older_cursor = None
+    message_count = 0
+    archived = False
     if conversation_id:
         conversation = Conversation.query.filter_by(id=conversation_id, user_id=user.id).first()
         if conversation:
-            messages = Message.query.filter_by(conversation_id=conversation.id).order_by(Message.timestamp).all()
-    
-    return render_template('chat.html', user=user, conversation=conversation, messages=messages)
+            # Seule la dernière page est rendue ; les plus anciennes sont chargées
+            # au défilement via /api/conversations/<id>/messages.
+            messages, older_cursor = message_page(conversation.id)
+            message_count = Message.query.filter_by(conversation_id=conversation.id).count()
+        else:
+            # Conversation archivée (voir archive.py) : affichée en entier, en lecture seule.
+            conversation, messages = load_archived_conversation(conversation_id, user.id)
+            archived = conversation is not None
+            message_count = len(messages)
+    
+    return render_template('chat.html', user=user, conversation=conversation, messages=messages,
+                           older_cursor=older_cursor, message_count=message_count, archived=archived)
 
 @main_bp.route('/new_conversation', methods=['POST'])
 def new_conversation():
     if 'user_id' not in session: return redirect(url_for('main.auth'))
-    user = User.query.get(session['user_id'])
+    user = current_identity()
     conversation = Conversation(user_id=user.id)
     db.session.add(conversation)
     db.session.commit()
@@ -210,18 +238,26 @@ def profile():
     if 'user_id' not in session:
         return redirect(url_for('main.auth'))
     
-    # Récupérer l'utilisateur depuis la base de données
-    user = User.query.get(session['user_id'])
+    # Récupérer l'utilisateur (cache des identités, voir auth.py)
+    user = current_identity()
     if not user:
         # Si l'utilisateur a été supprimé, on nettoie la session
         session.clear()
         return redirect(url_for('main.auth'))
     
-    # Récupérer l'historique des conversations de l'utilisateur
-    conversations = Conversation.query.filter_by(user_id=user.id).order_by(Conversation.updated_at.desc()).all()
+    # Récupérer une page de l'historique (avec nombre de messages et aperçu)
+    cursor = request.args.get('cursor')
+    conversations, next_cursor = conversation_page(user.id, after=decode_cursor(cursor))
+    stats = user_history_stats(user.id)
+    # Les conversations archivées suivent la dernière page de l'historique actif.
+    archived, archived_cursor = [], None
+    if not next_cursor:
+        archived_after = decode_cursor(request.args.get('archived_cursor'))
+        archived, archived_cursor = archived_conversation_page(user.id, after=archived_after)
     
     # Afficher le template du profil avec les données de l'utilisateur
-    return render_template('profile.html', user=user, conversations=conversations)
+    return render_template('profile.html', user=user, conversations=conversations, next_cursor=next_cursor,
+                           is_first_page=not cursor, stats=stats, archived=archived, archived_cursor=archived_cursor)
 
 
 @main_bp.route('/main.settings')
@@ -232,7 +268,7 @@ def settings():
         return redirect(url_for('main.auth'))
     
     # Récupérer l'utilisateur pour pouvoir afficher son nom, etc.
-    user = User.query.get(session['user_id'])
+    user = current_identity()
     if not user:
         session.clear()
         return redirect(url_for('main.auth'))
@@ -253,33 +289,30 @@ def send_message():
         flash('Erreur lors de l\'envoi du message.', 'error')
         return redirect(request.referrer or url_for('main.home'))
         
-    user = User.query.get(session['user_id'])
-    conversation = Conversation.query.filter_by(id=conversation_id, user_id=user.id).first()
-    
+    conversation, history = _load_conversation_for_exchange(conversation_id, session['user_id'])
     if not conversation:
         flash('Conversation non trouvée.', 'error')
         return redirect(url_for('main.home'))
+    sent_at = datetime.utcnow()
     
     try:
-        # 1. Sauvegarder le message de l'utilisateur
-        user_message = Message(content=message_content, is_user=True, conversation_id=conversation.id)
-        db.session.add(user_message)
+        # 1. Obtenir la réponse du service RAG (aucune connexion DB n'est tenue pendant l'appel) ;
+        #    une question de suivi est d'abord reformulée à partir de l'historique.
+        rag_service = get_rag_service()
+        client = _client_key()
+        question = rag_service.rewrite(message_content, history, client=client)
+        bot_response = rag_service.ask(question, client=client)
         
-        # 2. Obtenir la réponse du service RAG (attaché à l'application)
-        rag_service = current_app.rag_service()
-        bot_response = rag_service.ask(message_content)
-        
-        # 3. Sauvegarder la réponse du bot
-        bot_message = Message(content=bot_response, is_user=False, conversation_id=conversation.id)
-        db.session.add(bot_message)
-        
-        # 4. Mettre à jour le titre de la conversation si c'est le premier message
-        if conversation.title == "Nouvelle conversation":
-            title_words = message_content.split()[:5]
-            conversation.title = ' '.join(title_words) + ('...' if len(title_words) == 5 else '')
-        
-        db.session.commit()
+        # 2. Enregistrer la question, la réponse et le titre en une seule transaction courte
+        _save_exchange(conversation, message_content, bot_response, sent_at, history)
         
+    except Overloaded as e:
+        # Formulaire classique : on revient à la conversation plutôt que
+        # d'afficher une page 429 ; la question n'est pas enregistrée.
+        flash(f"Le chatbot est très sollicité, veuillez réessayer dans {e.retry_after} secondes.", 'warning')
+    except ConversationGone:
+        flash('Cette conversation a été supprimée : le message n\'a pas été enregistré.', 'error')
+        return redirect(url_for('main.home'))
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error sending message: {e}")
@@ -287,6 +320,165 @@ def send_message():
 
     return redirect(url_for('main.chat', conversation_id=conversation_id))
 
+
+def _client_key():
+    """
+    Client pour le tour de rôle de la file d'attente des appels au LLM
+    (admission.py) : l'utilisateur connecté (session ou jeton), sinon l'adresse IP.
+    """
+    user_id = request_user_id()
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{request.remote_addr}"
+
+
+OVERLOADED_MESSAGE = "Le service est très sollicité, veuillez réessayer dans quelques instants."
+
+
+def _overloaded_response(error):
+    """429 avec Retry-After, pour une requête refusée par le contrôle d'admission."""
+    response = jsonify({'error': OVERLOADED_MESSAGE, 'retry_after': error.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def _title_from_message(message_content):
+    """Titre d'une conversation : les 5 premiers mots du premier message."""
+    title_words = message_content.split()[:5]
+    return ' '.join(title_words) + ('...' if len(title_words) == 5 else '')
+
+
+def _load_conversation_for_exchange(conversation_id, user_id):
+    """
+    Vérifie que la conversation appartient à l'utilisateur et renvoie
+    ce dont l'enregistrement aura besoin (id, propriétaire, titre) et son historique
+    (résumé et derniers messages, voir history.py), puis ferme la session :
+    la connexion retourne au pool avant l'appel au LLM, qui peut durer
+    plusieurs secondes. Renvoie (None, None) si elle n'existe pas.
+    """
+    row = db.session.query(Conversation.id, Conversation.user_id, Conversation.title, Conversation.summary,
+                           Conversation.summary_message_id).filter_by(id=conversation_id, user_id=user_id).first()
+    history = load_history(row.id, row.summary, row.summary_message_id) if row else None
+    db.session.close()
+    return row, history
+
+
+class ConversationGone(Exception):
+    """La conversation a été supprimée pendant l'appel au LLM : l'échange n'est pas enregistré."""
+
+
+# Évènement d'erreur des flux (/send_message/stream, Flask et ASGI).
+CONVERSATION_GONE_MESSAGE = "Cette conversation a été supprimée : la réponse n'a pas été enregistrée."
+
+
+def _save_exchange(conversation, question, answer, sent_at, history=None):
+    """
+    Met à jour le titre si c'est le premier échange et la date de mise à
+    jour, puis enregistre la question et la réponse (un seul INSERT
+    multi-lignes), le tout dans une transaction courte. Renvoie le titre de
+    la conversation. Si des messages dépassent la fenêtre récente, le résumé
+    de la conversation est mis à jour en arrière-plan.
+
+    La conversation a été lue avant l'appel au LLM : elle a pu être archivée
+    entre-temps (elle est alors restaurée) ou supprimée (ConversationGone).
+    L'UPDATE vient en premier : il verrouille la ligne jusqu'au commit, et
+    son nombre de lignes dit si la conversation existe encore.
+    """
+    title = conversation.title
+    if title == "Nouvelle conversation":
+        title = _title_from_message(question)
+    now = datetime.utcnow()
+    touch = update(Conversation).where(Conversation.id == conversation.id).values(title=title, updated_at=now)
+    if db.session.execute(touch).rowcount == 0:
+        # Une autre requête a pu la restaurer en même temps : on revérifie.
+        restore_conversation(conversation.id, conversation.user_id)
+        if db.session.execute(touch).rowcount == 0:
+            db.session.rollback()
+            raise ConversationGone(conversation.id)
+    db.session.execute(insert(Message), [
+        {'content': question, 'is_user': True, 'conversation_id': conversation.id, 'timestamp': sent_at},
+        {'content': answer, 'is_user': False, 'conversation_id': conversation.id, 'timestamp': now},
+    ])
+    db.session.commit()
+    if history is not None and len(history.messages) + 2 > HISTORY_RECENT:
+        schedule_summary(current_app._get_current_object(), conversation.id)
+    return title
+
+
+def _sse(data, event=None):
+    """Formate un évènement Server-Sent Events (données JSON)."""
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
+
+
+def _sse_response(events):
+    # 'X-Accel-Buffering' empêche un éventuel proxy nginx de bufferiser le flux.
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@main_bp.route('/send_message/stream', methods=['POST'])
+def send_message_stream():
+    """
+    Version streaming de send_message : les morceaux de la réponse sont
+    envoyés en Server-Sent Events dès que Gemini les produit. Les messages
+    ne sont enregistrés qu'une fois le flux terminé ; si le client se
+    déconnecte, le générateur est fermé et la génération s'arrête.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Non autorisé'}), 401
+
+    conversation_id = request.form.get('conversation_id')
+    message_content = request.form.get('message')
+    if not conversation_id or not message_content or not message_content.strip():
+        return jsonify({'error': 'Message ou conversation manquant'}), 400
+
+    conversation, history = _load_conversation_for_exchange(conversation_id, session['user_id'])
+    if not conversation:
+        return jsonify({'error': 'Conversation non trouvée'}), 404
+    sent_at = datetime.utcnow()
+
+    rag_service = get_rag_service()
+    client = _client_key()
+    # Refus anticipé : une fois le flux ouvert, le statut 200 est parti.
+    try:
+        rag_service.admission.check(client)
+    except Overloaded as e:
+        return _overloaded_response(e)
+
+    def events():
+        # Un premier évènement immédiat : le client sait que la requête est acceptée.
+        yield ": stream ouvert\n\n"
+        chunks = []
+        try:
+            question = rag_service.rewrite(message_content, history, client=client)
+            for chunk in rag_service.stream(question, client=client):
+                chunks.append(chunk)
+                yield _sse({'token': chunk})
+        except Overloaded as e:
+            yield _sse({'error': OVERLOADED_MESSAGE, 'retry_after': e.retry_after}, event='error')
+            return
+        except Exception as e:
+            logging.error(f"Error streaming message: {e}")
+            yield _sse({'error': 'Une erreur est survenue lors de la communication avec le chatbot.'}, event='error')
+            return
+
+        # Flux terminé : on enregistre la question et la réponse complète.
+        try:
+            title = _save_exchange(conversation, message_content, ''.join(chunks), sent_at, history)
+        except ConversationGone:
+            yield _sse({'error': CONVERSATION_GONE_MESSAGE}, event='error')
+            return
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error saving streamed message: {e}")
+            yield _sse({'error': "La réponse n'a pas pu être enregistrée."}, event='error')
+            return
+        yield _sse({'title': title}, event='done')
+
+    return _sse_response(events())
+
 @main_bp.route('/update_profile', methods=['POST'])
 def update_profile():
     """Met à jour les informations du profil de l'utilisateur."""
@@ -324,6 +516,7 @@ def update_profile():
         user.email = email
         
         db.session.commit()
+        forget_identity(user.id)
         
         # Mettre à jour le nom dans la session pour l'affichage
         session['user_name'] = user.get_full_name()
@@ -345,21 +538,29 @@ def delete_conversation(conversation_id):
     if 'user_id' not in session:
         return redirect(url_for('main.auth'))
     
-    # Trouver la conversation à supprimer, en s'assurant qu'elle appartient bien à l'utilisateur connecté
-    conversation = Conversation.query.filter_by(id=conversation_id, user_id=session['user_id']).first()
-    
-    if conversation:
-        try:
-            # SQLAlchemy gère la suppression en cascade des messages
-            db.session.delete(conversation)
-            db.session.commit()
+    # Suppression ensembliste (sans charger les messages comme le ferait la
+    # cascade de l'ORM), limitée aux conversations de l'utilisateur connecté ;
+    # la conversation peut aussi avoir été archivée.
+    user_id = session['user_id']
+    owned = db.session.query(Conversation.id).filter_by(id=conversation_id, user_id=user_id)
+    try:
+        db.session.execute(delete(Message).where(Message.conversation_id.in_(owned.scalar_subquery())))
+        deleted = db.session.execute(
+            delete(Conversation).where(Conversation.id == conversation_id, Conversation.user_id == user_id)
+        ).rowcount
+        deleted += db.session.execute(
+            delete(ArchivedConversation).where(ArchivedConversation.id == conversation_id,
+                                               ArchivedConversation.user_id == user_id)
+        ).rowcount
+        db.session.commit()
+        if deleted:
             flash('Conversation supprimée avec succès.', 'success')
-        except Exception as e:
-            db.session.rollback()
-            logging.error(f"Error deleting conversation: {e}")
-            flash('Erreur lors de la suppression de la conversation.', 'error')
-    else:
-        flash('Conversation non trouvée ou vous n\'avez pas la permission de la supprimer.', 'warning')
+        else:
+            flash('Conversation non trouvée ou vous n\'avez pas la permission de la supprimer.', 'warning')
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error deleting conversation: {e}")
+        flash('Erreur lors de la suppression de la conversation.', 'error')
     
     # Rediriger vers la page de profil après la suppression
     return redirect(url_for('main.profile'))
@@ -403,6 +604,7 @@ def change_password():
     try:
         user.set_password(new_password)
         db.session.commit()
+        forget_identity(user.id)
         flash('Mot de passe modifié avec succès !', 'success')
     except Exception as e:
         db.session.rollback()
@@ -420,10 +622,14 @@ def api_login():
     user = User.query.filter_by(email=email).first()
     
     if user and user.check_password(password):
-        # Pour une vraie app, on utiliserait un token (JWT)
-        # Pour commencer, on peut juste renvoyer un succès
+        # Jeton d'accès à envoyer dans l'en-tête "Authorization: Bearer ..."
+        # des appels suivants à /api/* (voir auth.py).
+        token, expires_in = issue_token(user)
         return jsonify({
             'success': True,
+            'access_token': token,
+            'token_type': 'Bearer',
+            'expires_in': expires_in,
             'user': {
                 'id': user.id,
                 'name': user.get_full_name()
@@ -452,10 +658,299 @@ def api_ask():
     user_question = data.get('question')
     
     # Utiliser le même service RAG que vous avez déjà initialisé
-    rag_service = current_app.rag_service
-    response_text = rag_service.ask(user_question)
+    rag_service = get_rag_service()
+    try:
+        response_text = rag_service.ask(user_question, client=_client_key())
+    except Overloaded as e:
+        return _overloaded_response(e)
     
     # Renvoyer la réponse au format JSON
     return jsonify({'answer': response_text})
 
+
+@main_bp.route('/api/ask/stream', methods=['POST'])
+def api_ask_stream():
+    """
+    Variante streaming de /api/ask : même entrée JSON, réponse en
+    Server-Sent Events ('data: {"token": ...}' puis un évènement 'done'
+    contenant la réponse complète).
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('question'), str) or not data['question'].strip():
+        return jsonify({'error': 'La question est manquante ou vide'}), 400
+
+    user_question = data['question']
+    rag_service = get_rag_service()
+    client = _client_key()
+    try:
+        rag_service.admission.check(client)
+    except Overloaded as e:
+        return _overloaded_response(e)
+
+    def events():
+        yield ": stream ouvert\n\n"
+        chunks = []
+        try:
+            for chunk in rag_service.stream(user_question, client=client):
+                chunks.append(chunk)
+                yield _sse({'token': chunk})
+        except Overloaded as e:
+            yield _sse({'error': OVERLOADED_MESSAGE, 'retry_after': e.retry_after}, event='error')
+            return
+        except Exception as e:
+            logging.error(f"Error streaming answer: {e}")
+            yield _sse({'error': 'Erreur lors de la génération de la réponse'}, event='error')
+            return
+        yield _sse({'answer': ''.join(chunks)}, event='done')
+
+    return _sse_response(events())
+
+
+# Nombre maximal de questions par appel à /api/ask_batch.
+BATCH_MAX_QUESTIONS = int(os.environ.get('RAG_BATCH_MAX_QUESTIONS', 32))
+
+
+@main_bp.route('/api/ask_batch', methods=['POST'])
+def api_ask_batch():
+    """
+    Plusieurs questions en un appel : {"questions": ["...", ...]}. Renvoie
+    {"results": [...]} dans le même ordre, avec pour chaque question soit
+    "answer", soit "error" (et "retry_after" si le service est saturé) :
+    une question en échec ne fait pas échouer le lot.
+    """
+    data = request.get_json(silent=True)
+    questions = data.get('questions') if isinstance(data, dict) else None
+    if not isinstance(questions, list) or not questions:
+        return jsonify({'error': 'La liste de questions est manquante ou vide'}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'Au plus {BATCH_MAX_QUESTIONS} questions par lot'}), 400
+
+    results = get_rag_service().ask_batch(questions, client=_client_key())
+    for result in results:
+        if result.get('status') == 429:
+            result['error'] = OVERLOADED_MESSAGE
+    return jsonify({'results': results})
+
+
+@main_bp.route('/api/conversations')
+def api_conversations():
+    """Historique des conversations de l'utilisateur connecté (session ou jeton), paginé par curseur."""
+    user_id = request_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Non autorisé'}), 401
+
+    cursor = request.args.get('cursor')
+    after = decode_cursor(cursor)
+    if cursor and not after:
+        return jsonify({'error': 'Curseur invalide'}), 400
+
+    rows, next_cursor = conversation_page(user_id, after=after,
+                                          limit=page_size(request.args.get('limit'), CONVERSATION_PAGE_SIZE))
+    return jsonify({'conversations': [conversation_to_dict(row) for row in rows], 'next_cursor': next_cursor})
+
+
+@main_bp.route('/api/conversations/<int:conversation_id>/messages')
+def api_conversation_messages(conversation_id):
+    """
+    Messages d'une conversation, du plus récent au plus ancien par pages
+    (chaque page est renvoyée dans l'ordre chronologique). Utilisé par la page
+    de chat pour charger l'historique au défilement.
+    """
+    user_id = request_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Non autorisé'}), 401
+
+    conversation = db.session.query(Conversation.id).filter_by(id=conversation_id, user_id=user_id).first()
+    if not conversation:
+        return jsonify({'error': 'Conversation non trouvée'}), 404
+
+    cursor = request.args.get('before')
+    before = decode_cursor(cursor)
+    if cursor and not before:
+        return jsonify({'error': 'Curseur invalide'}), 400
+
+    messages, older_cursor = message_page(conversation_id, before=before,
+                                          limit=page_size(request.args.get('limit'), MESSAGE_PAGE_SIZE))
+    return jsonify({'messages': [message_to_dict(m) for m in messages], 'older_cursor': older_cursor})
+
+
+@main_bp.route('/api/archive/conversations')
+def api_archived_conversations():
+    """Conversations archivées de l'utilisateur connecté (sans leurs messages), paginées par curseur."""
+    user_id = request_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Non autorisé'}), 401
+
+    cursor = request.args.get('cursor')
+    after = decode_cursor(cursor)
+    if cursor and not after:
+        return jsonify({'error': 'Curseur invalide'}), 400
+
+    rows, next_cursor = archived_conversation_page(user_id, after=after,
+                                                   limit=page_size(request.args.get('limit'), CONVERSATION_PAGE_SIZE))
+    return jsonify({'conversations': [archived_conversation_to_dict(row) for row in rows], 'next_cursor': next_cursor})
+
+
+@main_bp.route('/api/archive/conversations/<int:conversation_id>')
+def api_archived_conversation(conversation_id):
+    """Une conversation archivée et tous ses messages, dans l'ordre chronologique."""
+    user_id = request_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Non autorisé'}), 401
+
+    archived, messages = load_archived_conversation(conversation_id, user_id)
+    if archived is None:
+        return jsonify({'error': 'Conversation non trouvée'}), 404
+    return jsonify(dict(archived_conversation_to_dict(archived),
+                        messages=[message_to_dict(message) for message in messages]))
+
+
+@main_bp.route('/api/search')
+def api_search():
+    """
+    Recherche plein texte dans les messages de l'utilisateur connecté
+    (session ou jeton) : ?q=...&cursor=...&limit=... Résultats du plus
+    pertinent au moins pertinent, avec un extrait où les termes trouvés
+    sont entre <mark> et </mark> (le reste est échappé).
+    """
+    user_id = request_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Non autorisé'}), 401
+
+    query = (request.args.get('q') or '').strip()
+    if len(query) < 2 or len(query) > 200:
+        return jsonify({'error': 'La recherche doit contenir entre 2 et 200 caractères'}), 400
+    offset = decode_search_cursor(request.args.get('cursor'))
+    if offset is None:
+        return jsonify({'error': 'Curseur invalide'}), 400
+
+    rows, next_offset = search_messages(user_id, query, offset=offset,
+                                        limit=page_size(request.args.get('limit'), SEARCH_PAGE_SIZE))
+    return jsonify({'results': [search_hit_to_dict(row) for row in rows],
+                    'next_cursor': encode_search_cursor(next_offset) if next_offset is not None else None})
+
+
+def _admin_authorized():
+    """
+    Routes d'administration et d'exploitation (statistiques, /metrics) :
+    en-tête X-Admin-Token égal à RAG_ADMIN_TOKEN. Pour /metrics, le jeton
+    peut aussi être envoyé en "Authorization: Bearer" (scrape Prometheus).
+    Sans RAG_ADMIN_TOKEN, ces routes sont fermées.
+    """
+    expected = os.environ.get('RAG_ADMIN_TOKEN')
+    provided = request.headers.get('X-Admin-Token') or bearer_token(request.headers.get('Authorization')) or ''
+    return bool(expected) and hmac.compare_digest(provided.encode(), expected.encode())
+
+
+@main_bp.route('/api/cache/stats')
+def api_cache_stats():
+    """Compteurs du cache de réponses (hits exacts, hits sémantiques, misses...)."""
+    if not _admin_authorized():
+        return jsonify({'error': 'Non autorisé'}), 403
+    return jsonify(get_rag_service().answer_cache.stats())
+
+
+@main_bp.route('/api/coalescing/stats')
+def api_coalescing_stats():
+    """Questions identiques regroupées : appels au LLM évités ('saved_calls')."""
+    if not _admin_authorized():
+        return jsonify({'error': 'Non autorisé'}), 403
+    return jsonify(get_rag_service().single_flight.snapshot())
+
+
+@main_bp.route('/api/admission/stats')
+def api_admission_stats():
+    """Appels au LLM en cours, profondeur de la file d'attente, attentes et refus (429)."""
+    if not _admin_authorized():
+        return jsonify({'error': 'Non autorisé'}), 403
+    return jsonify(get_rag_service().admission.snapshot())
+
+
+@main_bp.route('/api/outbox/stats')
+def api_outbox_stats():
+    """Profondeur de la file d'envoi des emails et latences d'envoi."""
+    if not _admin_authorized():
+        return jsonify({'error': 'Non autorisé'}), 403
+    return jsonify(outbox_stats())
+
+
+@main_bp.route('/api/admin/reload', methods=['GET', 'POST'])
+def api_admin_reload():
+    """
+    Rechargement à chaud de l'index (voir reloader.py). POST lance le
+    rechargement en arrière-plan ; avec {"rebuild": true}, l'index est d'abord
+    mis à jour à partir de knowledge_base/. GET renvoie l'état du dernier
+    rechargement. Seul le worker qui reçoit la requête recharge : les autres
+    suivent si RAG_RELOAD vaut 'index' ou 'watch'.
+    """
+    if not _admin_authorized():
+        return jsonify({'error': 'Non autorisé'}), 403
+    reloader = get_rag_service().reloader
+    if request.method == 'GET':
+        return jsonify(reloader.status())
+
+    data = request.get_json(silent=True) or {}
+    started = reloader.trigger(rebuild=bool(data.get('rebuild')))
+    return jsonify(dict(reloader.status(), started=started)), 202
+
+
+@main_bp.route('/metrics')
+def metrics():
+    """
+    Métriques au format Prometheus : histogrammes de durée par étape
+    (queue_wait, rewrite, embed, lexical, search, context, prompt,
+    llm_first_token, llm_total, total), des commits, du rendu des templates
+    et des requêtes, plus les compteurs du cache, de la file d'attente et
+    du cache des identités.
+    """
+    if not _admin_authorized():
+        return jsonify({'error': 'Non autorisé'}), 403
+    values = {}
+    if rag_status()['status'] == 'ready':
+        rag_service = get_rag_service()
+        cache_stats = rag_service.answer_cache.stats()
+        flight_stats = rag_service.single_flight.snapshot()
+        admission_stats = rag_service.admission.snapshot()
+        values = {
+            'rag_cache_entries': ('gauge', "Réponses en cache.", cache_stats['entries']),
+            'rag_cache_hits_total': ('counter', "Hits exacts du cache.", cache_stats['hits']),
+            'rag_cache_semantic_hits_total': ('counter', "Hits sémantiques du cache.", cache_stats['semantic_hits']),
+            'rag_cache_misses_total': ('counter', "Questions absentes du cache.", cache_stats['misses']),
+            'rag_coalesced_calls_total': ('counter', "Appels au LLM évités par regroupement.", flight_stats['saved_calls']),
+            'rag_index_reloads_total': ('counter', "Index rechargés à chaud.", rag_service.reloader.state['reloads']),
+            'rag_embeddings_skipped_total': ('counter', "Questions servies par BM25 seul, sans embedding.",
+                                             rag_service.retriever.stats['lexical']),
+            'rag_context_chars_saved_total': ('counter', "Caractères retirés des prompts (chevauchements, doublons, budget).",
+                                              rag_service.context.stats['chars_in'] - rag_service.context.stats['chars_out']),
+            'rag_llm_active': ('gauge', "Appels au LLM en cours.", admission_stats['active']),
+            'rag_queue_depth': ('gauge', "Questions en attente d'un appel au LLM.", admission_stats['queue_depth']),
+            'rag_admission_rejected_total': ('counter', "Questions refusées d'emblée (429).", admission_stats['rejected']),
+            'rag_admission_timeouts_total': ('counter', "Questions refusées après une attente trop longue (429).",
+                                             admission_stats['timeouts']),
+            'rag_queries_rewritten_total': ('counter', "Questions de suivi reformulées avec l'historique.",
+                                            rag_service.rewriter.stats['rewritten']),
+            'rag_conversation_summaries_total': ('counter', "Résumés de conversation mis à jour.",
+                                                 rag_service.rewriter.stats['summaries']),
+        }
+    identity_stats = identity_cache_stats()
+    values.update({
+        'identity_cache_hits_total': ('counter', "Utilisateurs connectés servis par le cache des identités.",
+                                      identity_stats['hits']),
+        'identity_cache_misses_total': ('counter', "Utilisateurs connectés relus en base.", identity_stats['misses']),
+    })
+    return Response(REGISTRY.render(values), mimetype='text/plain; version=0.0.4')
+
+
+@main_bp.route('/healthz')
+def healthz():
+    """Vivacité : le processus répond. Indique aussi l'état du RAGService."""
+    return jsonify({'status': 'ok', 'rag': rag_status()['status']})
+
+
+@main_bp.route('/readyz')
+def readyz():
+    """Disponibilité : 200 une fois le RAGService chargé, 503 sinon."""
+    state = rag_status()
+    return jsonify(state), 200 if state['status'] == 'ready' else 503
+
 # ... (vos autres routes restent inchangées)
@@ -0,0 +1,190 @@
+# Fichier: chatbot_app/search.py
+import base64
+import binascii
+import html
+import json
+import re
+
+from sqlalchemy import DDL, bindparam, event, text
+
+from . import db
+from .models import Conversation, Message
+
+# Recherche plein texte dans les messages d'un utilisateur (/api/search).
+#
+# Un LIKE '%...%' relirait toute la table messages ; on utilise l'index
+# plein texte de chaque base, tenu à jour à chaque INSERT sans code applicatif :
+# - PostgreSQL : colonne générée messages.search_vector (tsvector, config
+#   'french' : "inscriptions" trouve "inscription") et index GIN ;
+# - SQLite (développement) : table FTS5 messages_fts à contenu externe (le
+#   texte n'est pas dupliqué) et triggers sur messages.
+# Pour une base créée avant la recherche : flask --app wsgi db upgrade.
+#
+# La recherche porte sur les messages d'un seul utilisateur : ce filtre est
+# appliqué dans la recherche plein texte elle-même, pas après le classement
+# de toutes les lignes trouvées (un mot courant en trouverait des millions,
+# tous utilisateurs confondus) :
+# - PostgreSQL : les identifiants de ses conversations font partie de la
+#   requête ; selon la rareté du mot, le planificateur part de l'index GIN
+#   ou de l'index (conversation_id, timestamp, id), et seuls ses messages
+#   sont classés ;
+# - SQLite : l'utilisateur est indexé dans messages_fts (colonne 'owner',
+#   jeton "u<id>", lue dans la vue messages_search) et la requête FTS5
+#   exige ce jeton en plus des mots cherchés.
+SEARCH_CONFIG = 'french'
+SEARCH_PAGE_SIZE = 20
+# Au-delà, plus de page suivante : le tri par pertinence porte sur toutes
+# les lignes trouvées, les pages lointaines coûteraient autant qu'une
+# recherche complète pour un intérêt nul.
+SEARCH_MAX_RESULTS = 200
+MAX_QUERY_TERMS = 8
+
+# Marqueurs de surlignage posés par la base, remplacés par <mark> une fois
+# le reste du texte échappé (le contenu des messages n'est pas du HTML sûr).
+_START, _STOP = '\x02', '\x03'
+
+_POSTGRESQL_DDL = [
+    f"ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    f"GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}', content)) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)",
+]
+_SQLITE_OWNER = "'u' || conversations.user_id"
+_SQLITE_DDL = [
+    "CREATE VIEW IF NOT EXISTS messages_search AS "
+    f"SELECT messages.id AS id, messages.content AS content, {_SQLITE_OWNER} AS owner "
+    "FROM messages JOIN conversations ON conversations.id = messages.conversation_id",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, owner, content='messages_search', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    # Les messages d'une conversation sont toujours supprimés avant elle
+    # (suppression, archivage) : son user_id est encore lisible ici.
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+    f"INSERT INTO messages_fts(rowid, content, owner) SELECT new.id, new.content, {_SQLITE_OWNER} "
+    "FROM conversations WHERE conversations.id = new.conversation_id; END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+    f"INSERT INTO messages_fts(messages_fts, rowid, content, owner) SELECT 'delete', old.id, old.content, {_SQLITE_OWNER} "
+    "FROM conversations WHERE conversations.id = old.conversation_id; END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+    f"INSERT INTO messages_fts(messages_fts, rowid, content, owner) SELECT 'delete', old.id, old.content, {_SQLITE_OWNER} "
+    "FROM conversations WHERE conversations.id = old.conversation_id; "
+    f"INSERT INTO messages_fts(rowid, content, owner) SELECT new.id, new.content, {_SQLITE_OWNER} "
+    "FROM conversations WHERE conversations.id = new.conversation_id; END",
+]
+# Exécutées par db.create_all() juste après la création de la table messages
+# (les migrations c4f7a9d2e613 et f3b8c2d5a417 en gardent une copie pour les
+# bases existantes).
+for _statement in _POSTGRESQL_DDL:
+    event.listen(Message.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+for _statement in _SQLITE_DDL:
+    event.listen(Message.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
+
+# --- Curseurs ---
+# Le tri par pertinence oblige la base à classer toutes les lignes trouvées :
+# une pagination keyset n'économiserait rien, le curseur contient donc
+# simplement le rang de la ligne suivante.
+
+def encode_search_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    """Renvoie le décalage, 0 sans curseur, ou None si le curseur est invalide."""
+    if not cursor:
+        return 0
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))['offset']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+    return offset if isinstance(offset, int) and 0 <= offset < SEARCH_MAX_RESULTS else None
+
+
+# --- Recherche ---
+
+# ts_headline() relit et analyse le texte : seulement pour les lignes de la page.
+_POSTGRESQL_SEARCH = text(f"""
+    WITH hits AS (
+        SELECT m.id, m.conversation_id, m.is_user, m.timestamp, m.content,
+               ts_rank_cd(m.search_vector, q) AS rank
+        FROM messages m, websearch_to_tsquery('{SEARCH_CONFIG}', :query) q
+        WHERE m.conversation_id IN :conversation_ids AND m.search_vector @@ q
+        ORDER BY rank DESC, m.id DESC
+        LIMIT :limit OFFSET :offset
+    )
+    SELECT hits.id, hits.conversation_id, hits.is_user, hits.timestamp, c.title, hits.rank,
+           ts_headline('{SEARCH_CONFIG}', hits.content, websearch_to_tsquery('{SEARCH_CONFIG}', :query),
+                       'StartSel={_START}, StopSel={_STOP}, MaxFragments=2, MaxWords=25, MinWords=8') AS snippet
+    FROM hits
+    JOIN conversations c ON c.id = hits.conversation_id
+    ORDER BY hits.rank DESC, hits.id DESC
+""").bindparams(bindparam('conversation_ids', expanding=True)).columns(timestamp=db.DateTime, is_user=db.Boolean)
+
+# bm25() : plus petit = plus pertinent ; poids nul pour la colonne 'owner'.
+_SQLITE_SEARCH = text(f"""
+    SELECT m.id, m.conversation_id, m.is_user, m.timestamp, c.title,
+           -bm25(messages_fts, 1.0, 0.0) AS rank,
+           snippet(messages_fts, 0, '{_START}', '{_STOP}', '…', 16) AS snippet
+    FROM messages_fts
+    JOIN messages m ON m.id = messages_fts.rowid
+    JOIN conversations c ON c.id = m.conversation_id
+    WHERE messages_fts MATCH :query
+    ORDER BY rank DESC, m.id DESC
+    LIMIT :limit OFFSET :offset
+""").columns(timestamp=db.DateTime, is_user=db.Boolean)
+
+
+def _fts5_query(user_id, query):
+    """
+    Requête FTS5 : les messages de l'utilisateur contenant tous les mots,
+    chacun en préfixe ("inscri" trouve "inscription"). None sans mot.
+    """
+    terms = re.findall(r"\w+", query.lower())[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    words = ' '.join(f'"{term}"*' for term in terms)
+    return f"owner : u{int(user_id)} AND content : ({words})"
+
+
+def search_messages(user_id, query, offset=0, limit=SEARCH_PAGE_SIZE):
+    """
+    Messages de l'utilisateur correspondant à 'query', du plus pertinent au
+    moins pertinent. Renvoie (lignes, décalage de la page suivante ou None).
+    """
+    limit = min(limit, SEARCH_MAX_RESULTS - offset)
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        statement, params = _POSTGRESQL_SEARCH, {'query': query}
+    elif dialect == 'sqlite':
+        statement, params = _SQLITE_SEARCH, {'query': _fts5_query(user_id, query)}
+    else:
+        raise ValueError(f"ERREUR: recherche plein texte non disponible pour la base '{dialect}'")
+    if not params['query'] or limit <= 0:
+        return [], None
+    if dialect == 'postgresql':
+        params['conversation_ids'] = [conversation_id for conversation_id, in
+                                      db.session.query(Conversation.id).filter(Conversation.user_id == user_id)]
+        if not params['conversation_ids']:
+            return [], None
+    rows = db.session.execute(statement, dict(params, limit=limit + 1, offset=offset)).all()
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if offset + limit < SEARCH_MAX_RESULTS:
+            next_offset = offset + limit
+    return rows, next_offset
+
+
+def highlight(snippet):
+    """Extrait échappé, avec les termes trouvés entre <mark> et </mark>."""
+    return html.escape(snippet or '').replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def search_hit_to_dict(row):
+    return {
+        'message_id': row.id,
+        'conversation_id': row.conversation_id,
+        'conversation_title': row.title,
+        'is_user': row.is_user,
+        'timestamp': row.timestamp.isoformat(),
+        'rank': float(row.rank),
+        'snippet': highlight(row.snippet),
+    }
@@ -0,0 +1,244 @@
+# Fichier: chatbot_app/store.py
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus (développement local)
+    fcntl = None
+
+# Format de l'index sur disque (dossier db_faiss/) :
+# - index.faiss : vecteurs (format natif FAISS), ouvert en mémoire partagée ;
+# - docstore.sqlite3 : texte et métadonnées des chunks, par position dans
+#   l'index, plus un index plein texte FTS5 (BM25) sur ce même texte ;
+# Aucun pickle : l'ancien index.pkl de LangChain n'est plus lu que par
+# l'indexeur, une seule fois, pour convertir un index existant.
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite3"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+LEXICAL_TABLE = "chunks_fts"
+
+
+def store_exists(index_dir):
+    return all(os.path.exists(os.path.join(index_dir, name)) for name in (INDEX_FILE, DOCSTORE_FILE))
+
+
+def legacy_store_exists(index_dir):
+    return (os.path.exists(os.path.join(index_dir, INDEX_FILE))
+            and os.path.exists(os.path.join(index_dir, LEGACY_DOCSTORE_FILE))
+            and not os.path.exists(os.path.join(index_dir, DOCSTORE_FILE)))
+
+
+def lexical_index_exists(index_dir):
+    """Faux pour un docstore écrit avant l'ajout de l'index BM25."""
+    conn = sqlite3.connect(f"file:{os.path.join(index_dir, DOCSTORE_FILE)}?mode=ro", uri=True)
+    try:
+        return _has_lexical_table(conn)
+    finally:
+        conn.close()
+
+
+def _has_lexical_table(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (LEXICAL_TABLE,)).fetchone() is not None
+
+
+@contextmanager
+def index_lock(index_dir, name='files', shared=False):
+    """
+    Verrou entre processus (flock) sur un fichier à côté de l'index :
+    - 'write' : tenu par l'indexeur pendant toute une mise à jour, les
+      reconstructions (index.py, rechargement à chaud) ne se chevauchent pas ;
+    - 'files' : tenu en exclusif pendant le remplacement des fichiers et en
+      partagé pendant leur ouverture, un worker n'ouvre donc jamais un
+      index.faiss et un docstore de deux versions différentes.
+    """
+    if fcntl is None:
+        yield
+        return
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    os.makedirs(parent, exist_ok=True)
+    with open(f"{os.path.abspath(index_dir)}.{name}.lock", 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SQLiteDocstore(Docstore):
+    """
+    Docstore en lecture seule : le texte d'un chunk n'est lu dans SQLite que
+    lorsqu'il fait partie des résultats d'une recherche.
+
+    La connexion est ouverte une fois, au chargement : si l'indexeur remplace
+    le fichier entre-temps, ce worker continue de lire l'ancien, cohérent avec
+    l'index FAISS qu'il a chargé au même moment. Une connexion SQLite ne
+    survit pas à fork() : un worker créé depuis le master (preload de
+    gunicorn) ouvre la sienne, voir reopen().
+
+    lexical_search() interroge l'index BM25 (FTS5) du même fichier, qui
+    partage donc les positions de l'index FAISS.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        with self._lock:
+            self.lexical = _has_lexical_table(self._connection())
+        self._file_id = _file_id(path)
+
+    def _connection(self):
+        """Connexion de ce processus ; à appeler sous self._lock."""
+        if self._pid != os.getpid():
+            # Celle du master, héritée par fork, n'est pas fermée : la fermer
+            # ici toucherait l'état qu'il partage avec ce processus.
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._conn
+
+    def reopen(self):
+        """
+        Ouvre la connexion du processus courant (worker après fork). Renvoie
+        False si le fichier a été remplacé depuis le chargement : ses
+        positions ne correspondent plus à l'index FAISS, il faut recharger.
+        """
+        with self._lock:
+            self._connection()
+        return _file_id(self.path) == self._file_id
+
+    def search(self, search):
+        with self._lock:
+            row = self._connection().execute("SELECT content, metadata FROM chunks WHERE position = ?",
+                                     (int(search),)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def lexical_search(self, match, limit):
+        """
+        Recherche BM25. 'match' est une expression FTS5 ; renvoie au plus
+        'limit' couples (position, score), du plus pertinent au moins
+        pertinent (score positif : bm25() de SQLite est négatif).
+        """
+        if not self.lexical:
+            return []
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT rowid, bm25({LEXICAL_TABLE}) AS rank FROM {LEXICAL_TABLE} "
+                f"WHERE {LEXICAL_TABLE} MATCH ? ORDER BY rank LIMIT ?", (match, int(limit))).fetchall()
+        return [(position, -rank) for position, rank in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._pid = None
+
+
+def _file_id(path):
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+class PositionMap(Mapping):
+    """
+    index_to_docstore_id de LangChain sans dictionnaire en mémoire : le
+    docstore SQLite est indexé par position, la position i renvoie donc i.
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.size:
+            raise KeyError(position)
+        return int(position)
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self):
+        return self.size
+
+
+def load_store(index_dir, embeddings, index_file=INDEX_FILE):
+    """
+    Ouvre l'index pour la recherche (workers). Les vecteurs sont projetés en
+    mémoire (mmap) au lieu d'être copiés : les workers d'une même machine
+    partagent les mêmes pages du cache système, et le chargement ne dépend
+    plus de la taille du corpus. 'index_file' permet d'ouvrir l'index
+    approché (ann.faiss, voir ann.py), dont les positions sont les mêmes.
+    """
+    index = faiss.read_index(os.path.join(index_dir, index_file), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    docstore = SQLiteDocstore(os.path.join(index_dir, DOCSTORE_FILE))
+    return FAISS(embeddings, index, docstore, PositionMap(index.ntotal))
+
+
+def load_editable_store(index_dir, embeddings):
+    """
+    Charge tout l'index en mémoire pour le modifier (indexeur uniquement).
+    Un index à l'ancien format (index.pkl) est lu une dernière fois ici ;
+    save_store() l'écrira au nouveau format.
+    """
+    if legacy_store_exists(index_dir):
+        print("INFO: Conversion de l'index FAISS (index.pkl) au format SQLite...")
+        return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+
+    index = faiss.read_index(os.path.join(index_dir, INDEX_FILE))
+    conn = sqlite3.connect(f"file:{os.path.join(index_dir, DOCSTORE_FILE)}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT position, id, content, metadata FROM chunks ORDER BY position").fetchall()
+    finally:
+        conn.close()
+    docstore = InMemoryDocstore({
+        chunk_id: Document(page_content=content, metadata=json.loads(metadata))
+        for _, chunk_id, content, metadata in rows
+    })
+    return FAISS(embeddings, index, docstore, {position: chunk_id for position, chunk_id, _, _ in rows})
+
+
+def save_store(vector_store, directory):
+    """Écrit index.faiss et docstore.sqlite3 (chunks et index BM25) dans 'directory'."""
+    os.makedirs(directory, exist_ok=True)
+    faiss.write_index(vector_store.index, os.path.join(directory, INDEX_FILE))
+
+    path = os.path.join(directory, DOCSTORE_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("CREATE TABLE chunks (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+                     "content TEXT NOT NULL, metadata TEXT NOT NULL)")
+
+        def rows():
+            for position, chunk_id in sorted(vector_store.index_to_docstore_id.items()):
+                doc = vector_store.docstore.search(chunk_id)
+                yield position, chunk_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)
+
+        with conn:
+            conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows())
+            # Table FTS5 "à contenu externe" : elle ne stocke que l'index
+            # inversé et relit le texte dans 'chunks'. Les accents sont
+            # ignorés ("Économie" trouve "economie").
+            conn.execute(f"CREATE VIRTUAL TABLE {LEXICAL_TABLE} USING fts5(content, content='chunks', "
+                         f"content_rowid='position', tokenize='unicode61 remove_diacritics 2')")
+            conn.execute(f"INSERT INTO {LEXICAL_TABLE}({LEXICAL_TABLE}) VALUES ('rebuild')")
+    finally:
+        conn.close()
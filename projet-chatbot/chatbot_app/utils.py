@@ -1,9 +1,7 @@
 # Fichier: chatbot_app/utils.py
 from itsdangerous import URLSafeTimedSerializer
 from flask import current_app
-from flask_mail import Message
-from . import mail
-from flask_mail import Message
+from .mailer import queue_email
 
 def generate_confirmation_token(email):
     serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
@@ -22,10 +20,9 @@ def confirm_token(token, expiration=3600):
     return email
 
 def send_email(to, subject, template):
-    msg = Message(
-        subject,
-        recipients=[to],
-        html=template,
-        sender=current_app.config['MAIL_DEFAULT_SENDER']
-    )
-    mail.send(msg)
+    """
+    Met l'email dans la file d'envoi (voir mailer.py) au lieu de l'envoyer
+    pendant la requête. Il part en arrière-plan après le db.session.commit()
+    de l'appelant.
+    """
+    queue_email(to, subject, template)
@@ -0,0 +1,32 @@
+# Configuration gunicorn, chargée automatiquement par `gunicorn wsgi:app`.
+import gc
+import os
+
+# Nombre de workers : WEB_CONCURRENCY (défaut de gunicorn), et non l'option
+# -w, car le contrôle d'admission s'en sert pour répartir RAG_MAX_CONCURRENT
+# et RAG_QUEUE_MAX entre les workers (voir AdmissionController.from_env).
+
+# Preload : l'application (et l'index FAISS) est chargée une seule fois dans
+# le master, puis les workers sont créés par fork et partagent ces pages
+# mémoire en copy-on-write au lieu d'avoir chacun leur copie.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+if preload_app:
+    # Dans le master, le RAGService doit être chargé avant le fork (pas de
+    # thread de fond : il ne survivrait pas au fork).
+    os.environ.setdefault('RAG_STARTUP', 'eager')
+
+
+def post_fork(server, worker):
+    # Les connexions SQLite du master (docstore de l'index, store de
+    # coalescing) ne sont pas utilisables après fork : le worker ouvre les
+    # siennes (le store de coalescing le fait seul, à son premier appel).
+    from chatbot_app import after_fork
+    after_fork()
+
+
+def when_ready(server):
+    # Les objets chargés par le master ne seront plus parcourus par le GC :
+    # sinon chaque collecte dans un worker toucherait leurs en-têtes et
+    # forcerait la copie des pages partagées.
+    gc.freeze()
@@ -0,0 +1,127 @@
+"""
+Met à jour l'index FAISS à partir du dossier chatbot_app/knowledge_base
+(fichiers .txt, .md, .pdf, .docx, .html).
+
+    python index.py          # incrémental : seuls les chunks modifiés sont ré-embeddés
+    python index.py --full   # reconstruction complète
+
+Les fichiers sont analysés dans un pool de processus (--parse-workers) et
+les plus lents sont affichés à la fin. Les embeddings sont calculés par
+lots en parallèle (--batch-size, --workers).
+Si la construction est interrompue (quota, coupure réseau...), il suffit de
+la relancer : les lots déjà embeddés sont repris depuis db_faiss.checkpoint/.
+
+Les workers déjà lancés chargent le nouvel index sans redémarrer si
+RAG_RELOAD vaut 'index' ou 'watch' (voir chatbot_app/reloader.py) ; sinon,
+via POST /api/admin/reload ou à leur redémarrage.
+
+Type d'index (voir chatbot_app/ann.py) : RAG_INDEX_TYPE=flat|hnsw|ivfpq,
+RAG_INDEX_STORAGE=float32|float16, et leurs paramètres (RAG_HNSW_M,
+RAG_HNSW_EF_SEARCH, RAG_IVF_NLIST, RAG_IVF_NPROBE, RAG_PQ_M...). Pour choisir :
+
+    python index.py --report                      # rappel / latence / mémoire de chaque configuration
+    python index.py --report --questions faq.txt  # avec de vraies questions (une par ligne)
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from chatbot_app.ann import IndexSpec, default_specs, recall_report
+from chatbot_app.backends import get_embeddings
+from chatbot_app.indexer import KnowledgeBaseIndexer
+from chatbot_app.ingestion import EmbeddingPipeline
+from chatbot_app.store import load_store
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot_app")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexation de la base de connaissances")
+    parser.add_argument('--full', action='store_true', help="tout ré-embedder au lieu d'une mise à jour incrémentale")
+    parser.add_argument('--batch-size', type=int, help="nombre de chunks par appel d'embedding (RAG_EMBED_BATCH_SIZE)")
+    parser.add_argument('--workers', type=int, help="appels d'embedding simultanés (RAG_EMBED_WORKERS)")
+    parser.add_argument('--parse-workers', type=int, help="processus d'analyse des fichiers (RAG_PARSE_WORKERS)")
+    parser.add_argument('--slowest', type=int, default=10, help="nombre de fichiers les plus lents à afficher")
+    parser.add_argument('--report', action='store_true',
+                        help="compare les types d'index à la recherche exacte au lieu d'indexer")
+    parser.add_argument('--questions', help="fichier de questions (une par ligne) pour --report")
+    parser.add_argument('--queries', type=int, default=200,
+                        help="sans --questions : nombre de chunks de l'index, bruités, utilisés comme requêtes")
+    parser.add_argument('-k', type=int, default=4, help="nombre de voisins comparés (rappel@k)")
+    parser.add_argument('--json', help="écrit le rapport dans ce fichier")
+    args = parser.parse_args()
+
+    index_dir = os.environ.get('RAG_INDEX_DIR') or os.path.join(APP_DIR, "db_faiss")
+    embeddings = get_embeddings()
+    if args.report:
+        ann_report(args, index_dir, embeddings)
+        return
+    pipeline = EmbeddingPipeline.from_env(embeddings, checkpoint_dir=index_dir + ".checkpoint")
+    if args.batch_size:
+        pipeline.batch_size = args.batch_size
+    if args.workers:
+        pipeline.max_workers = args.workers
+
+    indexer = KnowledgeBaseIndexer(
+        knowledge_base_dir=os.path.join(APP_DIR, "knowledge_base"),
+        index_dir=index_dir,
+        embeddings=embeddings,
+        pipeline=pipeline,
+        parse_workers=args.parse_workers,
+    )
+    report = indexer.update(full=args.full)
+
+    stats = report['pipeline']
+    print(f"Chunks ajoutés : {report['added']}, retirés : {report['removed']}, inchangés : {report['unchanged']}")
+    print(f"Lots embeddés : {stats['batches']}, chunks repris du checkpoint : {stats['resumed']}, "
+          f"réessais : {stats['retries']}")
+    for path in report['files_changed']:
+        print(f"  modifié : {path}")
+    for path in report['files_deleted']:
+        print(f"  supprimé : {path}")
+    for failure in report['files_failed']:
+        print(f"  ERREUR : {failure['file']} : {failure['error']}")
+    if report['parse']:
+        total = sum(entry['seconds'] for entry in report['parse'])
+        print(f"Analyse : {len(report['parse'])} fichiers, {total:.1f} s cumulées. Les plus lents :")
+        for entry in report['parse'][:args.slowest]:
+            print(f"  {entry['seconds']:8.2f} s  {entry['chunks']:5} chunks  {entry['file']}")
+    if report['ann']:
+        ann = report['ann']
+        print(f"Index approché : {IndexSpec.from_env().label()}, {ann['ntotal']} vecteurs, "
+              f"{ann['bytes'] / (1024 * 1024):.1f} Mo, construit en {ann['build_seconds']:.1f} s")
+
+
+def ann_report(args, index_dir, embeddings):
+    index = load_store(index_dir, embeddings).index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    rng = np.random.default_rng(0)
+    if args.questions:
+        with open(args.questions, encoding='utf-8') as f:
+            questions = [line.strip() for line in f if line.strip()]
+        queries = np.array(embeddings.embed_documents(questions), dtype=np.float32)
+    else:
+        # Chunks existants légèrement bruités : proches de questions réelles
+        # sans être des copies exactes des vecteurs indexés.
+        sample = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+        noise = rng.normal(0, 0.1 * np.linalg.norm(sample, axis=1).mean() / np.sqrt(vectors.shape[1]), sample.shape)
+        queries = (sample + noise).astype(np.float32)
+
+    print(f"{len(vectors)} vecteurs de dimension {vectors.shape[1]}, {len(queries)} requêtes, rappel@{args.k}")
+    rows = recall_report(vectors, queries, default_specs(IndexSpec.from_env()), k=args.k)
+    print(f"{'index':45} {'rappel':>7} {'p50 ms':>8} {'p95 ms':>8} {'Mo':>8} {'o/vecteur':>10} {'constr. s':>10}")
+    for row in rows:
+        print(f"{row['index']:45} {row['recall']:7.3f} {row['p50_ms']:8.3f} {row['p95_ms']:8.3f} "
+              f"{row['mb']:8.1f} {row['bytes_per_vector']:10.0f} {row['build_seconds']:10.2f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'vectors': len(vectors), 'queries': len(queries), 'k': args.k, 'results': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Index composites pour l'historique des conversations et des messages
+
+Revision ID: 3c1f9a2b7d41
+Revises: 
+Create Date: 2026-10-18 10:00:00.000000
+
+Les tables sont créées par db.create_all() au démarrage ; cette migration
+ajoute les index aux bases existantes (if_not_exists : sans effet si
+create_all() les a déjà créés).
+
+    flask --app wsgi db upgrade
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f9a2b7d41'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_conversations_user_id_updated_at', 'conversations',
+                    ['user_id', 'updated_at', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_messages_conversation_id_timestamp', 'messages',
+                    ['conversation_id', 'timestamp', 'id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_messages_conversation_id_timestamp', table_name='messages', if_exists=True)
+    op.drop_index('ix_conversations_user_id_updated_at', table_name='conversations', if_exists=True)
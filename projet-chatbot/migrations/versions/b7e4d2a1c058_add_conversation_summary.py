@@ -0,0 +1,40 @@
+"""Résumé glissant des conversations (Conversation.summary)
+
+Revision ID: b7e4d2a1c058
+Revises: 8d52e0c4a913
+Create Date: 2026-10-18 14:00:00.000000
+
+Comme pour les index, une base créée par db.create_all() a déjà ces
+colonnes : elles ne sont ajoutées que si elles manquent.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d2a1c058'
+down_revision = '8d52e0c4a913'
+branch_labels = None
+depends_on = None
+
+
+def _columns():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('conversations')}
+
+
+def upgrade():
+    columns = _columns()
+    if 'summary' not in columns:
+        op.add_column('conversations', sa.Column('summary', sa.Text(), nullable=True))
+    if 'summary_message_id' not in columns:
+        op.add_column('conversations', sa.Column('summary_message_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    columns = _columns()
+    with op.batch_alter_table('conversations') as batch_op:
+        if 'summary_message_id' in columns:
+            batch_op.drop_column('summary_message_id')
+        if 'summary' in columns:
+            batch_op.drop_column('summary')
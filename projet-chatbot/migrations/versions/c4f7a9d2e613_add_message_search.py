@@ -0,0 +1,50 @@
+"""Recherche plein texte dans les messages
+
+Revision ID: c4f7a9d2e613
+Revises: b7e4d2a1c058
+Create Date: 2026-10-18 16:00:00.000000
+
+PostgreSQL : colonne générée messages.search_vector et index GIN ;
+SQLite : table FTS5 messages_fts et ses triggers, puis indexation des
+messages existants. Mêmes objets que ceux créés par db.create_all() (voir
+chatbot_app/search.py), d'où les IF NOT EXISTS.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f7a9d2e613'
+down_revision = 'b7e4d2a1c058'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                   "GENERATED ALWAYS AS (to_tsvector('french', content)) STORED")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)")
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                   "content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+        op.execute("CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+                   "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+                   "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+                   "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+                   "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END")
+        op.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_messages_search_vector")
+        op.execute("ALTER TABLE messages DROP COLUMN IF EXISTS search_vector")
+    elif dialect == 'sqlite':
+        for trigger in ('messages_fts_insert', 'messages_fts_delete', 'messages_fts_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS messages_fts")
@@ -0,0 +1,40 @@
+"""Table conversation_archive pour l'archivage des conversations inactives
+
+Revision ID: e91b3c5f7a20
+Revises: c4f7a9d2e613
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91b3c5f7a20'
+down_revision = 'c4f7a9d2e613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'conversation_archive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_conversation_archive_user_id_updated_at', 'conversation_archive',
+                    ['user_id', 'updated_at', 'id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_conversation_archive_user_id_updated_at', table_name='conversation_archive', if_exists=True)
+    op.drop_table('conversation_archive', if_exists=True)
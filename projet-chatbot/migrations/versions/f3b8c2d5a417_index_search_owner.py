@@ -0,0 +1,73 @@
+"""Recherche plein texte filtrée par utilisateur dans l'index (SQLite)
+
+Revision ID: f3b8c2d5a417
+Revises: e91b3c5f7a20
+Create Date: 2026-10-19 09:00:00.000000
+
+SQLite : messages_fts indexe aussi l'utilisateur de chaque message (colonne
+'owner', lue dans la vue messages_search), pour que la recherche ne classe
+que ses messages. La table et ses triggers sont recréés puis réindexés si
+la colonne manque. PostgreSQL : rien à faire, le filtre passe par l'index
+(conversation_id, timestamp, id) déjà créé par 3c1f9a2b7d41.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8c2d5a417'
+down_revision = 'e91b3c5f7a20'
+branch_labels = None
+depends_on = None
+
+OWNER = "'u' || conversations.user_id"
+TRIGGERS = ('messages_fts_insert', 'messages_fts_delete', 'messages_fts_update')
+
+
+def _fts_columns():
+    return [row[1] for row in op.get_bind().execute(sa.text("PRAGMA table_info(messages_fts)"))]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite' or 'owner' in _fts_columns():
+        return
+    for trigger in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS messages_fts")
+    op.execute("CREATE VIEW IF NOT EXISTS messages_search AS "
+               f"SELECT messages.id AS id, messages.content AS content, {OWNER} AS owner "
+               "FROM messages JOIN conversations ON conversations.id = messages.conversation_id")
+    op.execute("CREATE VIRTUAL TABLE messages_fts USING fts5(content, owner, content='messages_search', "
+               "content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+    op.execute("CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN "
+               f"INSERT INTO messages_fts(rowid, content, owner) SELECT new.id, new.content, {OWNER} "
+               "FROM conversations WHERE conversations.id = new.conversation_id; END")
+    op.execute("CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN "
+               f"INSERT INTO messages_fts(messages_fts, rowid, content, owner) SELECT 'delete', old.id, old.content, {OWNER} "
+               "FROM conversations WHERE conversations.id = old.conversation_id; END")
+    op.execute("CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+               f"INSERT INTO messages_fts(messages_fts, rowid, content, owner) SELECT 'delete', old.id, old.content, {OWNER} "
+               "FROM conversations WHERE conversations.id = old.conversation_id; "
+               f"INSERT INTO messages_fts(rowid, content, owner) SELECT new.id, new.content, {OWNER} "
+               "FROM conversations WHERE conversations.id = new.conversation_id; END")
+    op.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite' or 'owner' not in _fts_columns():
+        return
+    for trigger in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS messages_fts")
+    op.execute("DROP VIEW IF EXISTS messages_search")
+    op.execute("CREATE VIRTUAL TABLE messages_fts USING fts5("
+               "content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+    op.execute("CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN "
+               "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END")
+    op.execute("CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN "
+               "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END")
+    op.execute("CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+               "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+               "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END")
+    op.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
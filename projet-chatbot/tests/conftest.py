@@ -0,0 +1,155 @@
+# Fichier: tests/conftest.py
+#
+# Tests unitaires, hors ligne :  python -m pytest -q  (depuis projet-chatbot/)
+#
+# Comme la suite de benchmarks, les tests tournent sans réseau ni clé d'API :
+# embeddings HashingEmbeddings, LLM FakeChatModel (voir backends.py), base
+# SQLite et index dans un répertoire temporaire. Les variables sont fixées
+# avant l'import de chatbot_app : plusieurs modules lisent leur
+# configuration à l'import.
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import pytest
+
+_WORK_DIR = tempfile.mkdtemp(prefix='chatbot-tests-')
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_WORK_DIR, 'tests.sqlite3')}",
+    RAG_INDEX_DIR=os.path.join(_WORK_DIR, 'db_faiss'),
+    RAG_EMBEDDINGS='fake',
+    RAG_LLM='fake',
+    RAG_FAKE_LLM_LATENCY='0',
+    RAG_STARTUP='lazy',
+    MAIL_OUTBOX_SENDER='off',
+    RAG_LOG_SAMPLE_RATE='0',
+    RAG_HISTORY_SUMMARY='off',
+)
+
+from chatbot_app.backends import FakeChatModel, HashingEmbeddings  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_WORK_DIR, ignore_errors=True)
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    """HashingEmbeddings qui compte les textes envoyés à l'API simulée."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.embedded += 1
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def embeddings():
+    return HashingEmbeddings()
+
+
+@pytest.fixture
+def counting_embeddings():
+    return CountingEmbeddings()
+
+
+def write_paragraphs(path, name, count):
+    """Fichier de 'count' paragraphes d'environ 150 caractères : un chunk chacun (chunk_size=200)."""
+    path.write_text('\n\n'.join(
+        f"{name} paragraphe {i} : les étudiants consultent le règlement {name} pour la rubrique {i}, "
+        f"avec les dates, les frais et les documents demandés au secrétariat." for i in range(count)),
+        encoding='utf-8')
+
+
+@pytest.fixture
+def knowledge_base(tmp_path):
+    """Petite base de connaissances : frais.txt (4 chunks), inscription.txt (6), sous/historique.md (3)."""
+    root = tmp_path / 'knowledge_base'
+    (root / 'sous').mkdir(parents=True)
+    write_paragraphs(root / 'frais.txt', 'frais', 4)
+    write_paragraphs(root / 'inscription.txt', 'inscription', 6)
+    write_paragraphs(root / 'sous' / 'historique.md', 'historique', 3)
+    return root
+
+
+@pytest.fixture
+def make_indexer(tmp_path, knowledge_base, counting_embeddings):
+    """KnowledgeBaseIndexer sur la base de test, index dans tmp_path/db_faiss, sans pool de processus."""
+    from chatbot_app.indexer import KnowledgeBaseIndexer
+    from chatbot_app.ingestion import EmbeddingPipeline
+
+    def make(**kwargs):
+        index_dir = str(tmp_path / 'db_faiss')
+        pipeline = EmbeddingPipeline(counting_embeddings, batch_size=4, max_workers=2,
+                                     checkpoint_dir=index_dir + '.checkpoint')
+        return KnowledgeBaseIndexer(str(knowledge_base), index_dir, counting_embeddings, chunk_size=200,
+                                    chunk_overlap=20, pipeline=pipeline, parse_workers=1, **kwargs)
+    return make
+
+
+@pytest.fixture
+def llm():
+    return FakeChatModel(latency=0)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from chatbot_app import create_app
+    return create_app()
+
+
+@pytest.fixture(scope='session')
+def rag_service(app):
+    """RAGService partagé : index construit une fois à partir de knowledge_base/."""
+    from chatbot_app import get_rag_service
+    return get_rag_service()
+
+
+@pytest.fixture
+def db_session(app):
+    """Contexte applicatif ; toutes les tables sont vidées après le test."""
+    from chatbot_app import db
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+
+@pytest.fixture
+def make_user(db_session):
+    """Crée un utilisateur ; renvoie son id."""
+    from chatbot_app.models import User
+
+    def make(email='etudiant@example.com'):
+        user = User(nom='Nom', postnom='Postnom', prenom='Prenom', email=email, email_confirmed=True)
+        user.set_password('secret1')
+        db_session.add(user)
+        db_session.commit()
+        return user.id
+    return make
+
+
+@pytest.fixture
+def make_conversation(db_session):
+    """Crée une conversation et ses messages ; renvoie son id."""
+    from chatbot_app.models import Conversation, Message
+
+    def make(user_id, messages=(), updated_at=None, title='Nouvelle conversation'):
+        conversation = Conversation(user_id=user_id, title=title, updated_at=updated_at or datetime.utcnow())
+        db_session.add(conversation)
+        db_session.flush()
+        for i, content in enumerate(messages):
+            db_session.add(Message(conversation_id=conversation.id, is_user=i % 2 == 0, content=content,
+                                   timestamp=datetime(2025, 1, 1, 12, 0, i)))
+        db_session.commit()
+        return conversation.id
+    return make
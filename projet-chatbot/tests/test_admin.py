@@ -0,0 +1,30 @@
+# Fichier: tests/test_admin.py
+import pytest
+
+STATS_ROUTES = ['/api/cache/stats', '/api/coalescing/stats', '/api/admission/stats', '/api/outbox/stats',
+                '/metrics']
+
+
+@pytest.fixture
+def client(app, db_session, monkeypatch):
+    monkeypatch.setenv('RAG_ADMIN_TOKEN', 'jeton-admin')
+    return app.test_client()
+
+
+@pytest.mark.parametrize('path', STATS_ROUTES)
+def test_stats_routes_require_admin_token(client, path):
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={'X-Admin-Token': 'autre'}).status_code == 403
+
+
+@pytest.mark.parametrize('path', STATS_ROUTES)
+def test_stats_routes_closed_without_configured_token(client, monkeypatch, path):
+    monkeypatch.delenv('RAG_ADMIN_TOKEN')
+    assert client.get(path, headers={'X-Admin-Token': ''}).status_code == 403
+
+
+def test_admin_token_accepted(client):
+    assert client.get('/api/outbox/stats', headers={'X-Admin-Token': 'jeton-admin'}).status_code == 200
+    response = client.get('/metrics', headers={'Authorization': 'Bearer jeton-admin'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
@@ -0,0 +1,171 @@
+# Fichier: tests/test_admission.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from chatbot_app.admission import AdmissionController, Overloaded
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition jamais remplie"
+        time.sleep(0.005)
+
+
+def enqueue(controller, client, order, hold=None):
+    """Lance un thread qui attend une place puis note son client dans 'order'."""
+    def run():
+        try:
+            with controller.slot(client):
+                order.append(client)
+                if hold is not None:
+                    hold.wait(5)
+        except Overloaded as e:
+            order.append(e)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_from_env_splits_limits_across_workers(monkeypatch):
+    monkeypatch.setenv('RAG_MAX_CONCURRENT', '8')
+    monkeypatch.setenv('RAG_QUEUE_MAX', '64')
+    monkeypatch.setenv('WEB_CONCURRENCY', '4')
+    controller = AdmissionController.from_env()
+    assert (controller.max_concurrent, controller.max_queue) == (2, 16)
+
+    monkeypatch.setenv('WEB_CONCURRENCY', '16')
+    assert AdmissionController.from_env().max_concurrent == 1
+
+
+def test_concurrency_is_bounded(llm):
+    controller = AdmissionController(max_concurrent=2, max_queue=16, max_queue_per_client=16, slo=30)
+    llm.latency = 0.05
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def call(i):
+        with controller.slot(f"client-{i}"):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            llm.invoke("Quels sont les frais ?")
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert peak[0] == 2
+    stats = controller.snapshot()
+    assert (stats['admitted'], stats['active'], stats['queue_depth'], stats['rejected']) == (8, 0, 0, 0)
+
+
+def test_round_robin_between_clients():
+    controller = AdmissionController(max_concurrent=1, max_queue=16, max_queue_per_client=16, slo=30)
+    order = []
+    with controller.slot('occupant'):
+        threads = []
+        for client in ('a', 'a', 'a', 'b'):
+            threads.append(enqueue(controller, client, order))
+            wait_until(lambda: controller.snapshot()['queue_depth'] == len(threads))
+    for thread in threads:
+        thread.join(5)
+
+    # b n'attend pas derrière toutes les questions de a.
+    assert order == ['a', 'b', 'a', 'a']
+
+
+def test_rejects_when_queue_is_full():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, max_queue_per_client=4, slo=30)
+    order = []
+    with controller.slot('occupant'):
+        thread = enqueue(controller, 'a', order)
+        wait_until(lambda: controller.snapshot()['queue_depth'] == 1)
+        with pytest.raises(Overloaded) as rejected:
+            with controller.slot('b'):
+                pass
+    thread.join(5)
+
+    assert rejected.value.reason == 'file pleine'
+    assert rejected.value.retry_after >= 1
+    assert controller.snapshot()['rejected'] == 1
+
+
+def test_rejects_client_with_too_many_waiting():
+    controller = AdmissionController(max_concurrent=1, max_queue=16, max_queue_per_client=1, slo=30)
+    order = []
+    with controller.slot('occupant'):
+        thread = enqueue(controller, 'a', order)
+        wait_until(lambda: controller.snapshot()['queue_depth'] == 1)
+        with pytest.raises(Overloaded) as rejected:
+            controller.check('a')
+        controller.check('b')                     # un autre client passe encore
+    thread.join(5)
+
+    assert rejected.value.reason == 'trop de questions en attente pour ce client'
+
+
+def test_rejects_when_estimated_wait_exceeds_slo():
+    controller = AdmissionController(max_concurrent=1, max_queue=16, max_queue_per_client=16, slo=3,
+                                     service_time=2.0)
+    order = []
+    with controller.slot('occupant'):
+        thread = enqueue(controller, 'a', order)
+        wait_until(lambda: controller.snapshot()['queue_depth'] == 1)
+        # Une question en cours et une en file : attente estimée (1 + 1) x 2 s > 3 s.
+        with pytest.raises(Overloaded) as rejected:
+            controller.check('b')
+    thread.join(5)
+
+    assert rejected.value.reason == 'attente estimée trop longue'
+
+
+def test_waiting_past_the_slo_times_out():
+    controller = AdmissionController(max_concurrent=1, max_queue=16, max_queue_per_client=16, slo=0.1,
+                                     service_time=0.01)
+    order = []
+    with controller.slot('occupant'):
+        enqueue(controller, 'a', order).join(5)
+
+    assert isinstance(order[0], Overloaded) and order[0].reason == "délai d'attente dépassé"
+    stats = controller.snapshot()
+    assert (stats['timeouts'], stats['queue_depth'], stats['active']) == (1, 0, 0)
+
+
+def test_service_time_follows_completed_calls(llm):
+    controller = AdmissionController(service_time=2.0)
+    llm.latency = 0.05
+    with controller.slot('a'):
+        llm.invoke("Quels sont les frais ?")
+    assert controller.snapshot()['service_time'] < 2.0
+
+
+def test_async_slots_and_cancellation(llm):
+    controller = AdmissionController(max_concurrent=1, max_queue=16, max_queue_per_client=16, slo=30)
+    llm.latency = 0.05
+
+    async def ask(client):
+        async with controller.aslot(client):
+            return (await llm.ainvoke("Quels sont les frais ?")).content
+
+    async def main():
+        answers = await asyncio.gather(*(ask(f"client-{i}") for i in range(3)))
+        # Client déconnecté pendant l'attente : sa place n'est pas perdue.
+        async with controller.aslot('occupant'):
+            waiting = asyncio.ensure_future(ask('parti'))
+            await asyncio.sleep(0.05)
+            waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        answers.append(await ask('suivant'))
+        return answers
+
+    assert asyncio.run(main()) == [llm.answer] * 4
+    stats = controller.snapshot()
+    assert (stats['active'], stats['queue_depth']) == (0, 0)
@@ -0,0 +1,210 @@
+# Fichier: tests/test_archive.py
+import asyncio
+import json
+import zlib
+from datetime import datetime, timedelta
+
+import pytest
+
+from chatbot_app.archive import (archive_batch, archive_conversations, archive_stats, load_archived_conversation,
+                                 restore_conversation)
+
+OLD = datetime.utcnow() - timedelta(days=400)
+
+
+@pytest.fixture
+def old_conversation(db_session, make_user, make_conversation):
+    """Conversation inactive depuis 400 jours, avec un résumé ; renvoie (user_id, conversation_id)."""
+    from chatbot_app.models import Conversation
+    user_id = make_user()
+    conversation_id = make_conversation(user_id, ["Quels sont les frais ?", "100 dollars.", "Et l'inscription ?"],
+                                        updated_at=OLD, title="Frais")
+    first_id = db_session.get(Conversation, conversation_id).messages[0].id
+    db_session.query(Conversation).filter_by(id=conversation_id).update(
+        {'summary': "L'étudiant demande les frais.", 'summary_message_id': first_id, 'updated_at': OLD})
+    db_session.commit()
+    return user_id, conversation_id
+
+
+def test_archive_moves_only_inactive_conversations(db_session, old_conversation, make_conversation):
+    from chatbot_app.models import Conversation, Message
+    user_id, conversation_id = old_conversation
+    recent_id = make_conversation(user_id, ["question récente"])
+
+    totals = archive_conversations(older_than_days=180)
+
+    assert totals == {'conversations': 1, 'messages': 3, 'batches': 1}
+    assert [c.id for c in db_session.query(Conversation)] == [recent_id]
+    assert db_session.query(Message).count() == 1
+    stats = archive_stats()
+    assert (stats['conversations'], stats['messages'], stats['hot_conversations']) == (1, 3, 1)
+
+
+def test_archived_conversation_is_readable(old_conversation):
+    user_id, conversation_id = old_conversation
+    archive_batch(datetime.utcnow())
+
+    archived, messages = load_archived_conversation(conversation_id, user_id)
+    assert archived.title == "Frais" and archived.message_count == 3
+    assert [(m.is_user, m.content) for m in messages] == [
+        (True, "Quels sont les frais ?"), (False, "100 dollars."), (True, "Et l'inscription ?")]
+    assert messages[0].timestamp == datetime(2025, 1, 1, 12, 0, 0)
+    assert load_archived_conversation(conversation_id, user_id + 1) == (None, [])
+
+
+def test_archive_in_batches(make_user, make_conversation):
+    user_id = make_user()
+    for i in range(5):
+        make_conversation(user_id, [f"message {i}"], updated_at=OLD + timedelta(minutes=i))
+
+    assert archive_conversations(older_than_days=180, batch_size=2, max_batches=2)['conversations'] == 4
+    assert archive_conversations(older_than_days=180, batch_size=2) == {'conversations': 1, 'messages': 1,
+                                                                         'batches': 1}
+
+
+def test_restore_conversation(db_session, old_conversation):
+    from chatbot_app.models import ArchivedConversation, Conversation
+    user_id, conversation_id = old_conversation
+    before = db_session.get(Conversation, conversation_id)
+    message_ids = [m.id for m in before.messages]
+    summary_message_id = before.summary_message_id
+    archive_batch(datetime.utcnow())
+
+    assert not restore_conversation(conversation_id, user_id + 1)
+    assert restore_conversation(conversation_id, user_id)
+    db_session.commit()
+
+    restored = db_session.get(Conversation, conversation_id)
+    assert (restored.title, restored.user_id) == ("Frais", user_id)
+    assert [m.id for m in restored.messages] == message_ids
+    assert (restored.summary, restored.summary_message_id) == ("L'étudiant demande les frais.", summary_message_id)
+    assert db_session.query(ArchivedConversation).count() == 0
+    assert not restore_conversation(conversation_id, user_id)
+
+
+def test_restore_payload_without_summary_message_id(db_session, old_conversation):
+    from chatbot_app.models import ArchivedConversation, Conversation
+    user_id, conversation_id = old_conversation
+    archive_batch(datetime.utcnow())
+    # Archive écrite avant l'ajout de summary_message_id dans le contenu.
+    archived = db_session.get(ArchivedConversation, conversation_id)
+    data = json.loads(zlib.decompress(archived.payload))
+    del data['summary_message_id']
+    archived.payload = zlib.compress(json.dumps(data).encode('utf-8'))
+    db_session.commit()
+
+    assert restore_conversation(conversation_id, user_id)
+    db_session.commit()
+    restored = db_session.get(Conversation, conversation_id)
+    assert (restored.summary, restored.summary_message_id, len(restored.messages)) == (None, None, 3)
+
+
+def test_exchange_saved_after_archiving_restores_the_conversation(app, db_session, old_conversation):
+    from chatbot_app import routes
+    from chatbot_app.models import ArchivedConversation, Conversation
+    user_id, conversation_id = old_conversation
+    # La conversation est lue avant l'appel au LLM, puis archivée pendant celui-ci.
+    conversation, _ = routes._load_conversation_for_exchange(conversation_id, user_id)
+    archive_batch(datetime.utcnow())
+
+    with app.test_request_context():
+        routes._save_exchange(conversation, "Et les horaires ?", "De 8 h à 16 h.", datetime.utcnow())
+
+    restored = db_session.get(Conversation, conversation_id)
+    assert [m.content for m in restored.messages][-2:] == ["Et les horaires ?", "De 8 h à 16 h."]
+    assert restored.updated_at > OLD
+    assert db_session.query(ArchivedConversation).count() == 0
+
+
+def test_exchange_for_deleted_conversation_is_refused(app, db_session, old_conversation):
+    from chatbot_app import routes
+    from chatbot_app.models import Conversation, Message
+    user_id, conversation_id = old_conversation
+    conversation, _ = routes._load_conversation_for_exchange(conversation_id, user_id)
+    db_session.query(Message).filter_by(conversation_id=conversation_id).delete()
+    db_session.query(Conversation).filter_by(id=conversation_id).delete()
+    db_session.commit()
+
+    with app.test_request_context():
+        with pytest.raises(routes.ConversationGone):
+            routes._save_exchange(conversation, "Et les horaires ?", "De 8 h à 16 h.", datetime.utcnow())
+    assert db_session.query(Message).count() == 0
+
+
+@pytest.fixture
+def deleted_during_call(db_session, monkeypatch, old_conversation):
+    """
+    La conversation est supprimée juste après avoir été lue, donc pendant
+    l'appel au LLM. Renvoie (user_id, conversation_id).
+    """
+    from chatbot_app import asgi, routes
+    from chatbot_app.models import Conversation, Message
+    load = routes._load_conversation_for_exchange
+
+    def load_then_delete(conversation_id, user_id):
+        loaded = load(conversation_id, user_id)
+        db_session.query(Message).filter_by(conversation_id=int(conversation_id)).delete()
+        db_session.query(Conversation).filter_by(id=int(conversation_id)).delete()
+        db_session.commit()
+        return loaded
+
+    monkeypatch.setattr(routes, '_load_conversation_for_exchange', load_then_delete)
+    monkeypatch.setattr(asgi, '_load_conversation_for_exchange', load_then_delete)
+    return old_conversation
+
+
+def sse_events(body):
+    """[(évènement, données)] d'un flux Server-Sent Events."""
+    events = []
+    for block in body.split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'data' in lines:
+            events.append((lines.get('event', 'message'), json.loads(lines['data'])))
+    return events
+
+
+def test_stream_for_deleted_conversation(app, db_session, deleted_during_call):
+    from chatbot_app.models import Message
+    from chatbot_app.routes import CONVERSATION_GONE_MESSAGE
+    user_id, conversation_id = deleted_during_call
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+
+    response = client.post('/send_message/stream', data={'conversation_id': conversation_id, 'message': "Et après ?"})
+
+    assert sse_events(response.get_data(as_text=True))[-1] == ('error', {'error': CONVERSATION_GONE_MESSAGE})
+    assert db_session.query(Message).count() == 0
+
+
+def test_asgi_stream_for_deleted_conversation(app, db_session, deleted_during_call):
+    from urllib.parse import urlencode
+
+    from chatbot_app.asgi import AsyncRAGApp
+    from chatbot_app.models import Message
+    from chatbot_app.routes import CONVERSATION_GONE_MESSAGE
+    user_id, conversation_id = deleted_during_call
+    cookie = app.session_interface.get_signing_serializer(app).dumps({'user_id': user_id})
+    body = urlencode({'conversation_id': conversation_id, 'message': "Et après ?"}).encode('utf-8')
+    scope = {'type': 'http', 'method': 'POST', 'path': '/send_message/stream', 'client': ('127.0.0.1', 1),
+             'headers': [(b'content-type', b'application/x-www-form-urlencoded'),
+                         (b'cookie', f"{app.config['SESSION_COOKIE_NAME']}={cookie}".encode('latin-1'))]}
+
+    async def request():
+        sent, requests = [], [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            await asyncio.Event().wait()           # le client reste connecté
+
+        async def send(message):
+            sent.append(message)
+
+        await AsyncRAGApp(app)(scope, receive, send)
+        return b''.join(message.get('body', b'') for message in sent).decode('utf-8')
+
+    events = sse_events(asyncio.run(request()))
+
+    assert events[-1] == ('error', {'error': CONVERSATION_GONE_MESSAGE})
+    assert db_session.query(Message).count() == 0
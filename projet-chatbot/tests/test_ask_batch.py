@@ -0,0 +1,67 @@
+# Fichier: tests/test_ask_batch.py
+#
+# Bout en bout avec les backends simulés : l'index est construit à partir de
+# knowledge_base/ avec HashingEmbeddings (dans RAG_INDEX_DIR temporaire), les
+# réponses viennent de FakeChatModel.
+import pytest
+
+from chatbot_app.backends import FakeChatModel
+
+
+@pytest.fixture
+def service(rag_service):
+    """RAGService au cache vide."""
+    rag_service.answer_cache.clear()
+    return rag_service
+
+
+@pytest.fixture
+def embedding_calls(service, monkeypatch):
+    """Taille de chaque appel d'embedding par lot."""
+    calls = []
+    embed_documents = service.embeddings.embed_documents
+    monkeypatch.setattr(service.embeddings, 'embed_documents',
+                        lambda texts: calls.append(len(texts)) or embed_documents(texts))
+    return calls
+
+
+@pytest.fixture
+def client(app, db_session):
+    return app.test_client()
+
+
+def test_batch_answers_in_order(service, embedding_calls):
+    questions = ["Quels sont les frais académiques ?", "", "Comment se préinscrire ?",
+                 "quels sont les frais academiques"]
+    results = service.ask_batch(questions, client='test')
+
+    answer = FakeChatModel().answer
+    assert results[0] == {'answer': answer, 'source': 'llm'}
+    assert results[1]['status'] == 400
+    assert results[2] == {'answer': answer, 'source': 'llm'}
+    # Doublon (après normalisation) : calculé une seule fois.
+    assert results[3] is results[0]
+    # Un seul appel d'embedding pour les questions distinctes du lot.
+    assert len(embedding_calls) <= 1 and sum(embedding_calls) <= 2
+
+
+def test_batch_uses_the_answer_cache(service):
+    service.ask("Quels sont les frais académiques ?", client='test')
+    results = service.ask_batch(["Quels sont les FRAIS académiques", "Où se trouve l'université ?"], client='test')
+
+    assert results[0]['source'] == 'cache'
+    assert results[1]['source'] == 'llm'
+
+
+def test_api_ask_batch(service, client):
+    response = client.post('/api/ask_batch', json={'questions': ["Quels sont les frais ?", 42]})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert results[0]['answer'] == FakeChatModel().answer
+    assert results[1]['status'] == 400
+
+
+@pytest.mark.parametrize('body', [None, {}, {'questions': []}, {'questions': 'frais'},
+                                  {'questions': ['frais'] * 1000}])
+def test_api_ask_batch_rejects_invalid_body(client, body):
+    assert client.post('/api/ask_batch', json=body).status_code == 400
@@ -0,0 +1,76 @@
+# Fichier: tests/test_auth.py
+import time
+
+import jwt
+import pytest
+
+from chatbot_app.auth import JWT_ALGORITHM, bearer_token, forget_identity, identity_cache_stats, load_identity
+
+
+@pytest.fixture
+def client(app, db_session):
+    return app.test_client()
+
+
+def login(client, email='etudiant@example.com', password='secret1'):
+    return client.post('/api/login', json={'email': email, 'password': password})
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('Bearer abc.def', 'abc.def'), ('bearer  abc ', 'abc'), ('Basic abc', None), ('Bearer ', None), (None, None)])
+def test_bearer_token(header, expected):
+    assert bearer_token(header) == expected
+
+
+def test_token_gives_access_to_the_api(client, make_user, make_conversation):
+    user_id = make_user()
+    conversation_id = make_conversation(user_id, ["bonjour"])
+
+    response = login(client)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['token_type'] == 'Bearer' and body['user']['id'] == user_id
+
+    response = client.get('/api/conversations', headers={'Authorization': f"Bearer {body['access_token']}"})
+    assert response.status_code == 200
+    assert [c['id'] for c in response.get_json()['conversations']] == [conversation_id]
+
+
+def test_wrong_password(client, make_user):
+    make_user()
+    assert login(client, password='mauvais').status_code == 401
+
+
+def test_invalid_or_expired_token(app, client, make_user):
+    user_id = make_user()
+    assert client.get('/api/conversations', headers={'Authorization': 'Bearer pas-un-jwt'}).status_code == 401
+
+    now = int(time.time())
+    expired = jwt.encode({'sub': str(user_id), 'iat': now - 7200, 'exp': now - 3600},
+                         app.config['SECRET_KEY'], algorithm=JWT_ALGORITHM)
+    assert client.get('/api/conversations', headers={'Authorization': f"Bearer {expired}"}).status_code == 401
+
+    forged = jwt.encode({'sub': str(user_id), 'exp': now + 3600}, 'autre-cle', algorithm=JWT_ALGORITHM)
+    assert client.get('/api/conversations', headers={'Authorization': f"Bearer {forged}"}).status_code == 401
+
+
+def test_no_credentials(client):
+    assert client.get('/api/conversations').status_code == 401
+
+
+def test_identity_cache(app, db_session, make_user):
+    from chatbot_app.models import User
+    user_id = make_user()
+    with app.test_request_context():
+        before = identity_cache_stats()
+        assert load_identity(user_id).prenom == 'Prenom'
+        assert load_identity(user_id).prenom == 'Prenom'
+        stats = identity_cache_stats()
+        assert (stats['misses'] - before['misses'], stats['hits'] - before['hits']) == (1, 1)
+
+        db_session.get(User, user_id).prenom = 'Nouveau'
+        db_session.commit()
+        assert load_identity(user_id).prenom == 'Prenom'       # instantané encore en cache
+        forget_identity(user_id)
+        assert load_identity(user_id).prenom == 'Nouveau'
+        forget_identity(user_id)
@@ -0,0 +1,123 @@
+# Fichier: tests/test_cache.py
+from chatbot_app import cache
+from chatbot_app.cache import AnswerCache, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  Quels sont les FRAIS  académiques ?") == "quels sont les frais academiques"
+
+
+def test_exact_hit_after_normalization(embeddings):
+    answers = AnswerCache()
+    question = "Quels sont les frais ?"
+    answers.put(question, embeddings.embed_query(question), "100 dollars")
+
+    assert answers.get("quels sont les FRAIS") == "100 dollars"
+    assert answers.get("Comment s'inscrire ?") is None
+    assert answers.stats()['hits'] == 1
+
+
+def test_semantic_hit(embeddings):
+    answers = AnswerCache(similarity_threshold=0.8)
+    answers.put("frais d'inscription en licence", embeddings.embed_query("frais d'inscription en licence"), "réponse")
+
+    # Mêmes mots dans un autre ordre : même vecteur avec HashingEmbeddings.
+    assert answers.get_similar(embeddings.embed_query("licence : frais d'inscription")) == "réponse"
+    assert answers.get_similar(embeddings.embed_query("horaires de la bibliothèque")) is None
+    stats = answers.stats()
+    assert (stats['semantic_hits'], stats['misses']) == (1, 1)
+
+
+def test_lru_eviction_by_entries(embeddings):
+    answers = AnswerCache(max_entries=2)
+    for question in ("question a", "question b"):
+        answers.put(question, embeddings.embed_query(question), question)
+    answers.get("question a")                       # b devient la plus ancienne
+    answers.put("question c", embeddings.embed_query("question c"), "question c")
+
+    assert answers.get("question b") is None
+    assert answers.get("question a") == "question a"
+    assert answers.stats()['evictions'] == 1
+
+
+def test_eviction_by_bytes(embeddings):
+    answers = AnswerCache(max_bytes=100)
+    answers.put("a", None, "x" * 60)
+    answers.put("b", None, "y" * 60)
+
+    assert answers.get("a") is None
+    assert answers.get("b") == "y" * 60
+    assert answers.stats()['bytes'] <= 100
+
+
+def test_answer_larger_than_cache_is_ignored():
+    answers = AnswerCache(max_bytes=10)
+    answers.put("a", None, "x" * 60)
+
+    assert answers.stats()['entries'] == 0
+
+
+def test_ttl_expiration(monkeypatch, embeddings):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    answers = AnswerCache(ttl=10)
+    answers.put("frais", embeddings.embed_query("frais"), "réponse")
+
+    now[0] += 11
+    assert answers.get("frais") is None
+    assert answers.get_similar(embeddings.embed_query("frais")) is None
+    assert answers.stats()['entries'] == 0
+
+
+def test_index_version_change_invalidates(embeddings):
+    answers = AnswerCache()
+    answers.set_index_version('v1')
+    answers.put("frais", embeddings.embed_query("frais"), "réponse", index_version='v1')
+    # Réponse calculée avec un index déjà remplacé : pas mise en cache.
+    answers.put("horaires", None, "réponse", index_version='v0')
+    assert answers.stats()['entries'] == 1
+
+    answers.set_index_version('v2')
+    assert answers.get("frais") is None
+    assert answers.get_similar(embeddings.embed_query("frais")) is None
+    assert answers.stats()['invalidations'] == 1
+
+
+def test_slots_are_reused(embeddings):
+    answers = AnswerCache(max_entries=3)
+    for i in range(20):
+        question = f"question {i}"
+        answers.put(question, embeddings.embed_query(question), question)
+
+    assert answers.stats()['entries'] == 3
+    assert answers.get_similar(embeddings.embed_query("question 19")) == "question 19"
+
+
+def test_record_miss():
+    answers = AnswerCache()
+    answers.record_miss()
+    assert answers.stats()['misses'] == 1
+
+
+QUESTIONS = ["Qu'est-ce que le TFC ?", "Quels sont les frais académiques ?", "Comment se préinscrire ?",
+             "Où se trouve l'université ?"]
+
+
+def test_decisive_lexical_questions_count_as_misses(rag_service, monkeypatch):
+    # Avec 'lexical_first', une question au résultat BM25 net ne passe pas
+    # par le cache sémantique : elle doit tout de même compter comme miss.
+    monkeypatch.setattr(rag_service.retriever, 'mode', 'lexical_first')
+    answers = rag_service.answer_cache
+    assert rag_service._lexical(QUESTIONS[0])[0].decisive
+
+    answers.clear()
+    before = answers.stats()
+    for question in QUESTIONS:
+        rag_service.ask(question, client='test')
+    rag_service.ask(QUESTIONS[0], client='test')
+    after = answers.stats()
+    assert (after['misses'] - before['misses'], after['hits'] - before['hits']) == (4, 1)
+
+    answers.clear()
+    rag_service.ask_batch(QUESTIONS, client='test')
+    assert answers.stats()['misses'] - after['misses'] == 4
@@ -0,0 +1,186 @@
+# Fichier: tests/test_coalescing.py
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from chatbot_app.admission import Overloaded
+from chatbot_app.backends import FakeChatModel
+from chatbot_app.coalescing import SingleFlight, SQLiteFlightStore
+
+KEY = "quels sont les frais"
+
+
+class CountingModel:
+    """
+    FakeChatModel qui compte ses appels et signale le début du premier. Le
+    premier appel peut lever 'fail_first', après 'hold' secondes : les
+    suiveurs ont le temps de le rejoindre.
+    """
+
+    def __init__(self, latency=0.3, fail_first=None, hold=0.3):
+        self.model = FakeChatModel(latency=latency)
+        self.calls = 0
+        self.started = threading.Event()
+        self.fail_first = fail_first
+        self.hold = hold
+        self._lock = threading.Lock()
+
+    def __call__(self, question):
+        with self._lock:
+            self.calls += 1
+            first = self.calls == 1
+        self.started.set()
+        if first and self.fail_first is not None:
+            time.sleep(self.hold)
+            raise self.fail_first
+        return self.model.invoke(question).content
+
+
+def ask(single_flight, model, key=KEY):
+    with single_flight.flight(key) as handle:
+        if handle.done:
+            return handle.result
+        handle.result = model(key)
+        return handle.result
+
+
+def run_concurrently(single_flight, model, followers=4):
+    """Un leader, puis des suiveurs lancés pendant son calcul. Renvoie (résultats, exceptions)."""
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(ask(single_flight, model))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker)]
+    threads[0].start()
+    assert model.started.wait(5)
+    threads += [threading.Thread(target=worker) for _ in range(followers)]
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results, errors
+
+
+def test_followers_share_the_leader_answer():
+    single_flight, model = SingleFlight(), CountingModel()
+    results, errors = run_concurrently(single_flight, model)
+
+    assert not errors
+    assert results == [model.model.answer] * 5
+    assert model.calls == 1
+    stats = single_flight.snapshot()
+    assert (stats['leaders'], stats['followers'], stats['in_flight']) == (1, 4, 0)
+
+
+def test_leader_error_is_shared():
+    single_flight = SingleFlight()
+    model = CountingModel(fail_first=RuntimeError("Gemini indisponible"))
+    results, errors = run_concurrently(single_flight, model, followers=2)
+
+    assert not results
+    assert len(errors) == 3 and all(str(e) == "Gemini indisponible" for e in errors)
+    assert model.calls == 1
+
+
+def test_overloaded_leader_hands_over_to_a_follower():
+    single_flight = SingleFlight()
+    model = CountingModel(fail_first=Overloaded(3, 'trop de questions en attente pour ce client'))
+    results, errors = run_concurrently(single_flight, model, followers=3)
+
+    # Seul le leader refusé reçoit le 429 ; un suiveur a calculé pour les autres.
+    assert [type(e) for e in errors] == [Overloaded]
+    assert results == [model.model.answer] * 3
+    assert model.calls == 2
+    assert single_flight.snapshot()['abandoned'] == 1
+
+
+def test_follower_timeout_computes_itself():
+    single_flight, model = SingleFlight(timeout=0.05), CountingModel(latency=0.5)
+    results, errors = run_concurrently(single_flight, model, followers=1)
+
+    assert not errors and len(results) == 2
+    assert model.calls == 2
+    assert single_flight.snapshot()['timeouts'] == 1
+
+
+def test_different_keys_are_not_coalesced():
+    single_flight, model = SingleFlight(), CountingModel(latency=0)
+    ask(single_flight, model, "frais")
+    ask(single_flight, model, "horaires")
+    assert model.calls == 2
+
+
+def test_async_followers_share_the_leader_answer():
+    single_flight = SingleFlight()
+    model = FakeChatModel(latency=0.2)
+    calls = []
+
+    async def ask_async():
+        async with single_flight.aflight(KEY) as handle:
+            if handle.done:
+                return handle.result
+            calls.append(1)
+            handle.result = (await model.ainvoke(KEY)).content
+            return handle.result
+
+    async def main():
+        return await asyncio.gather(*(ask_async() for _ in range(5)))
+
+    assert asyncio.run(main()) == [model.answer] * 5
+    assert len(calls) == 1
+
+
+def test_shared_store_between_workers(tmp_path):
+    # Deux SingleFlight sur le même fichier : deux workers d'une même machine.
+    path = os.path.join(tmp_path, 'flights.sqlite3')
+    worker_a = SingleFlight(store=SQLiteFlightStore(path, poll_interval=0.01), timeout=5)
+    worker_b = SingleFlight(store=SQLiteFlightStore(path, poll_interval=0.01), timeout=5)
+    model = CountingModel()
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(ask(worker_a, model)))
+    leader.start()
+    assert model.started.wait(5)
+    results.append(ask(worker_b, model))
+    leader.join(10)
+
+    assert results == [model.model.answer] * 2
+    assert model.calls == 1
+    assert worker_b.snapshot()['shared_followers'] == 1
+
+
+def test_shared_store_release_lets_another_worker_claim(tmp_path):
+    path = os.path.join(tmp_path, 'flights.sqlite3')
+    store_a, store_b = SQLiteFlightStore(path), SQLiteFlightStore(path)
+
+    assert store_a.claim(KEY)[0]
+    assert not store_b.claim(KEY)[0]
+    store_a.release(KEY)
+    assert store_b.claim(KEY)[0]
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="fork() indisponible")
+def test_shared_store_after_fork(tmp_path):
+    store = SQLiteFlightStore(os.path.join(tmp_path, 'flights.sqlite3'))
+    assert store.claim(KEY)[0]
+    parent_owner = store.owner
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Enfant : nouvelle connexion et nouveau propriétaire, la clé du parent reste prise.
+        try:
+            claimed, _ = store.claim(KEY)
+            os.write(write, b'1' if store.owner != parent_owner and not claimed else b'0')
+        finally:
+            os._exit(0)
+    os.close(write)
+    os.waitpid(pid, 0)
+    assert os.read(read, 1) == b'1'
@@ -0,0 +1,59 @@
+# Fichier: tests/test_context.py
+from langchain_core.documents import Document
+
+from chatbot_app.context import CHARS_PER_TOKEN, ContextAssembler, estimate_tokens
+
+TEXT = ("Les frais académiques sont payables en deux tranches auprès de la comptabilité de l'université. "
+        "La première tranche est due à l'inscription, la seconde avant les examens du premier semestre. "
+        "Un reçu est remis à chaque paiement et doit être présenté au secrétariat de la faculté.")
+
+
+def doc(text, source='FRAIS.txt', page=None):
+    return Document(page_content=text, metadata={'source': source, 'page': page})
+
+
+def test_overlapping_chunks_are_merged():
+    # Découpage avec chevauchement : la fin du premier chunk ouvre le second.
+    first, second = TEXT[:150], TEXT[100:]
+    docs, report = ContextAssembler(max_tokens=0).assemble("frais", [doc(first), doc(second)])
+
+    assert [d.page_content for d in docs] == [TEXT]
+    assert report['merged'] == 1
+
+
+def test_chunks_of_different_files_are_not_merged():
+    docs, report = ContextAssembler(max_tokens=0, dedup_threshold=1).assemble(
+        "frais", [doc(TEXT[:150]), doc(TEXT[100:], source='inscription.txt')])
+    assert len(docs) == 2 and report['merged'] == 0
+
+
+def test_near_duplicates_are_dropped():
+    docs, report = ContextAssembler(max_tokens=0).assemble(
+        "frais", [doc(TEXT), doc(TEXT.replace("Un reçu", "Le reçu"), source='copie.txt')])
+    assert len(docs) == 1 and report['duplicates'] == 1
+
+
+def test_rerank_prefers_chunks_with_query_terms():
+    docs, _ = ContextAssembler(max_tokens=0).assemble(
+        "horaires de la bibliothèque",
+        [doc("Historique de l'université, fondée en 1990.", source='a.txt'),
+         doc("La bibliothèque ouvre ses horaires de 8 h à 18 h.", source='b.txt')])
+    assert docs[0].metadata['source'] == 'b.txt'
+
+
+def test_token_budget():
+    chunks = [doc(f"Chunk {i} : " + "mot " * 40, source=f"{i}.txt") for i in range(5)]
+    assembler = ContextAssembler(max_tokens=100, rerank=False, dedup_threshold=1)
+    docs, report = assembler.assemble("frais", chunks)
+
+    assert sum(estimate_tokens(d.page_content) for d in docs) + len(docs) - 1 <= 100
+    assert report['dropped'] == len(chunks) - len(docs) > 0
+    assert assembler.stats['requests'] == 1
+
+
+def test_first_chunk_truncated_at_a_sentence():
+    docs, report = ContextAssembler(max_tokens=50).assemble("frais", [doc(TEXT)])
+
+    assert report['truncated']
+    assert len(docs[0].page_content) <= 50 * CHARS_PER_TOKEN
+    assert docs[0].page_content.endswith('.')
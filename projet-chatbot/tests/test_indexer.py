@@ -0,0 +1,138 @@
+# Fichier: tests/test_indexer.py
+import json
+import os
+
+from chatbot_app.indexer import MANIFEST_NAME, chunk_ids
+from chatbot_app.store import DOCSTORE_FILE, INDEX_FILE, load_store
+from tests.conftest import write_paragraphs
+
+
+def manifest(indexer):
+    with open(os.path.join(indexer.index_dir, MANIFEST_NAME), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def stored_texts(indexer):
+    """Textes des chunks de l'index écrit sur disque."""
+    store = load_store(indexer.index_dir, indexer.embeddings)
+    try:
+        return sorted(store.docstore.search(position).page_content for position in range(store.index.ntotal))
+    finally:
+        store.docstore.close()
+
+
+def test_chunk_ids_are_stable_and_distinct():
+    from langchain_core.documents import Document
+    chunks = [Document(page_content="même texte"), Document(page_content="même texte"), Document(page_content="autre")]
+    ids = chunk_ids('frais.txt', chunks)
+
+    assert ids == chunk_ids('frais.txt', chunks)
+    assert len(set(ids)) == 3
+    assert ids[0] != chunk_ids('autre.txt', chunks)[0]
+
+
+def test_first_build(make_indexer, counting_embeddings):
+    indexer = make_indexer()
+    report = indexer.update()
+
+    assert (report['added'], report['removed'], report['unchanged']) == (13, 0, 0)
+    assert sorted(report['files_changed']) == ['frais.txt', 'inscription.txt', 'sous/historique.md']
+    files = manifest(indexer)['files']
+    assert {path: len(entry['chunks']) for path, entry in files.items()} == {
+        'frais.txt': 4, 'inscription.txt': 6, 'sous/historique.md': 3}
+    assert len(stored_texts(indexer)) == 13
+    assert counting_embeddings.embedded == 13
+
+
+def test_unchanged_run_embeds_nothing(make_indexer, counting_embeddings):
+    indexer = make_indexer()
+    indexer.update()
+    index_stat = os.stat(os.path.join(indexer.index_dir, INDEX_FILE))
+    counting_embeddings.embedded = 0
+
+    report = indexer.update()
+
+    assert (report['added'], report['removed'], report['unchanged']) == (0, 0, 13)
+    assert report['files_changed'] == [] and report['parse'] == []
+    assert counting_embeddings.embedded == 0
+    # Rien n'a changé : l'index n'est pas réécrit.
+    assert os.stat(os.path.join(indexer.index_dir, INDEX_FILE)).st_mtime_ns == index_stat.st_mtime_ns
+
+
+def test_touched_file_only_rewrites_the_manifest(make_indexer, knowledge_base, counting_embeddings):
+    indexer = make_indexer()
+    indexer.update()
+    index_stat = os.stat(os.path.join(indexer.index_dir, INDEX_FILE))
+    path = knowledge_base / 'frais.txt'
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    counting_embeddings.embedded = 0
+
+    report = indexer.update()
+
+    assert (report['added'], report['removed'], report['unchanged']) == (0, 0, 13)
+    assert report['files_changed'] == []           # même hash : fichier relu mais pas redécoupé
+    assert counting_embeddings.embedded == 0
+    assert manifest(indexer)['files']['frais.txt']['mtime_ns'] == stat.st_mtime_ns + 10 ** 9
+    assert os.stat(os.path.join(indexer.index_dir, INDEX_FILE)).st_mtime_ns == index_stat.st_mtime_ns
+
+
+def test_edited_paragraph_replaces_one_chunk(make_indexer, knowledge_base, counting_embeddings):
+    indexer = make_indexer()
+    indexer.update()
+    old_ids = manifest(indexer)['files']['inscription.txt']['chunks']
+    path = knowledge_base / 'inscription.txt'
+    path.write_text(path.read_text(encoding='utf-8').replace('rubrique 2,', 'rubrique deux,'), encoding='utf-8')
+    counting_embeddings.embedded = 0
+
+    report = indexer.update()
+
+    assert (report['added'], report['removed'], report['unchanged']) == (1, 1, 12)
+    assert report['files_changed'] == ['inscription.txt']
+    assert counting_embeddings.embedded == 1
+    new_ids = manifest(indexer)['files']['inscription.txt']['chunks']
+    assert len(set(old_ids) & set(new_ids)) == 5
+    texts = stored_texts(indexer)
+    assert len(texts) == 13
+    assert any('rubrique deux,' in text for text in texts)
+    assert not any('rubrique 2,' in text for text in texts if text.startswith('inscription'))
+
+
+def test_added_and_deleted_files(make_indexer, knowledge_base):
+    indexer = make_indexer()
+    indexer.update()
+    os.remove(knowledge_base / 'inscription.txt')
+    write_paragraphs(knowledge_base / 'bourses.txt', 'bourses', 2)
+
+    report = indexer.update()
+
+    assert (report['added'], report['removed']) == (2, 6)
+    assert report['files_deleted'] == ['inscription.txt']
+    assert report['files_changed'] == ['bourses.txt']
+    assert sorted(manifest(indexer)['files']) == ['bourses.txt', 'frais.txt', 'sous/historique.md']
+    texts = stored_texts(indexer)
+    assert len(texts) == 9 and not any(text.startswith('inscription') for text in texts)
+
+
+def test_ignored_files(make_indexer, knowledge_base):
+    (knowledge_base / '.cache.txt').write_text("caché", encoding='utf-8')
+    (knowledge_base / '~$brouillon.txt').write_text("verrou de Word", encoding='utf-8')
+    (knowledge_base / 'image.png').write_bytes(b'\x89PNG')
+
+    indexer = make_indexer()
+    indexer.update()
+
+    assert sorted(manifest(indexer)['files']) == ['frais.txt', 'inscription.txt', 'sous/historique.md']
+
+
+def test_full_rebuild(make_indexer, counting_embeddings):
+    indexer = make_indexer()
+    indexer.update()
+    counting_embeddings.embedded = 0
+
+    report = indexer.update(full=True)
+
+    assert (report['added'], report['removed']) == (13, 0)
+    assert counting_embeddings.embedded == 13
+    assert os.path.exists(os.path.join(indexer.index_dir, DOCSTORE_FILE))
+    assert len(stored_texts(indexer)) == 13
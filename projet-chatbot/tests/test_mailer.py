@@ -0,0 +1,170 @@
+# Fichier: tests/test_mailer.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from chatbot_app import mailer
+from chatbot_app.mailer import OutboxSender, outbox_stats, queue_email
+
+
+class FakeSMTP:
+    """Connexion SMTP simulée : note les destinataires, échoue pour ceux de 'failing'."""
+
+    def __init__(self):
+        self.sent = []
+        self.failing = set()
+        self.down = False
+
+    def connect(self):
+        if self.down:
+            raise ConnectionRefusedError("SMTP injoignable")
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send(self, message):
+        recipient = message.recipients[0]
+        if recipient in self.failing:
+            raise OSError(f"refusé : {recipient}")
+        self.sent.append(recipient)
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    fake = FakeSMTP()
+    monkeypatch.setattr(mailer.mail, 'connect', fake.connect)
+    return fake
+
+
+@pytest.fixture
+def sender(app, db_session, smtp):
+    return OutboxSender(app, batch_size=10, max_attempts=3, retry_delay=30, lease=300)
+
+
+def outbox(db_session):
+    from chatbot_app.models import OutboxEmail
+    db_session.expire_all()
+    return {email.recipient: email for email in db_session.query(OutboxEmail)}
+
+
+def make_due(db_session):
+    """Avance l'horloge : tous les emails en attente ou réclamés deviennent dus."""
+    from chatbot_app.models import OutboxEmail
+    db_session.query(OutboxEmail).update({'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)})
+    db_session.commit()
+
+
+def test_queued_email_is_sent_after_commit(db_session, sender, smtp):
+    queue_email('a@example.com', "Confirmez votre email", "<p>lien</p>")
+    queue_email('b@example.com', "Confirmez votre email", "<p>lien</p>")
+    db_session.commit()
+
+    assert sender.drain_once() == 2
+    assert sorted(smtp.sent) == ['a@example.com', 'b@example.com']
+    email = outbox(db_session)['a@example.com']
+    assert (email.status, email.attempts, email.last_error) == ('sent', 1, None)
+    assert email.sent_at is not None
+    assert sender.drain_once() == 0
+    assert sender.stats['sent'] == 2
+
+
+def test_rollback_drops_the_queued_email(db_session, sender, smtp):
+    queue_email('a@example.com', "Confirmez votre email", "<p>lien</p>")
+    db_session.rollback()
+
+    assert outbox(db_session) == {}
+    assert sender.drain_once() == 0
+    assert 'outbox_pending' not in db_session.info
+
+
+def test_failed_email_is_retried_with_backoff(db_session, sender, smtp):
+    smtp.failing.add('b@example.com')
+    queue_email('a@example.com', "Sujet", "<p>a</p>")
+    queue_email('b@example.com', "Sujet", "<p>b</p>")
+    db_session.commit()
+
+    start = datetime.utcnow()
+    assert sender.drain_once() == 2
+    emails = outbox(db_session)
+    assert emails['a@example.com'].status == 'sent'
+    failed = emails['b@example.com']
+    assert (failed.status, failed.attempts, failed.last_error) == ('pending', 1, "refusé : b@example.com")
+    assert timedelta(seconds=29) < failed.next_attempt_at - start < timedelta(seconds=32)
+    # Pas encore dû : rien à envoyer.
+    assert sender.drain_once() == 0
+
+    make_due(db_session)
+    start = datetime.utcnow()
+    assert sender.drain_once() == 1
+    failed = outbox(db_session)['b@example.com']
+    assert failed.attempts == 2
+    # Délai doublé à chaque tentative.
+    assert timedelta(seconds=59) < failed.next_attempt_at - start < timedelta(seconds=62)
+    assert smtp.sent == ['a@example.com']
+
+
+def test_email_fails_after_max_attempts(db_session, sender, smtp):
+    smtp.failing.add('a@example.com')
+    queue_email('a@example.com', "Sujet", "<p>a</p>")
+    db_session.commit()
+
+    for _ in range(sender.max_attempts):
+        assert sender.drain_once() == 1
+        make_due(db_session)
+    email = outbox(db_session)['a@example.com']
+    assert (email.status, email.attempts) == ('failed', 3)
+    # Un email en échec définitif n'est plus réclamé.
+    assert sender.drain_once() == 0
+    assert (sender.stats['retried'], sender.stats['failed']) == (2, 1)
+    assert outbox_stats()['failed'] == 1
+
+
+def test_smtp_connection_failure_retries_the_batch(db_session, sender, smtp):
+    smtp.down = True
+    queue_email('a@example.com', "Sujet", "<p>a</p>")
+    queue_email('b@example.com', "Sujet", "<p>b</p>")
+    db_session.commit()
+
+    assert sender.drain_once() == 2
+    assert {email.status for email in outbox(db_session).values()} == {'pending'}
+
+    smtp.down = False
+    make_due(db_session)
+    assert sender.drain_once() == 2
+    assert {email.status for email in outbox(db_session).values()} == {'sent'}
+
+
+def test_claim_lease(app, db_session, sender, smtp):
+    queue_email('a@example.com', "Sujet", "<p>a</p>")
+    db_session.commit()
+
+    # Un autre processus réclame l'email puis meurt avant de l'envoyer.
+    with app.app_context():
+        claimed = OutboxSender(app, lease=300)._claim()
+    assert [email['recipient'] for email in claimed] == ['a@example.com']
+    email = outbox(db_session)['a@example.com']
+    assert (email.status, email.attempts) == ('sending', 1)
+    assert outbox_stats()['sending'] == 1
+
+    # Bail en cours : l'email n'est pas réclamé une seconde fois.
+    assert sender.drain_once() == 0
+    # Bail expiré : il redevient disponible.
+    make_due(db_session)
+    assert sender.drain_once() == 1
+    email = outbox(db_session)['a@example.com']
+    assert (email.status, email.attempts) == ('sent', 2)
+    assert smtp.sent == ['a@example.com']
+
+
+def test_batch_size(db_session, app, smtp):
+    for i in range(5):
+        queue_email(f"{i}@example.com", "Sujet", "<p>x</p>")
+    db_session.commit()
+    sender = OutboxSender(app, batch_size=2)
+
+    assert [sender.drain_once() for _ in range(4)] == [2, 2, 1, 0]
+    assert len(smtp.sent) == 5
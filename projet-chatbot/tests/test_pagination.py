@@ -0,0 +1,80 @@
+# Fichier: tests/test_pagination.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from chatbot_app.pagination import (MAX_PAGE_SIZE, conversation_page, decode_cursor, encode_cursor, message_page,
+                                    page_size, user_history_stats)
+
+
+def test_cursor_round_trip():
+    moment = datetime(2025, 3, 1, 10, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(moment, 42)) == (moment, 42)
+
+
+@pytest.mark.parametrize('cursor', [None, '', 'pas-un-curseur', 'W10', encode_cursor(datetime(2025, 1, 1), 1)[:-3]])
+def test_invalid_cursor(cursor):
+    assert decode_cursor(cursor) is None
+
+
+@pytest.mark.parametrize('value, expected', [(None, 20), ('abc', 20), ('0', 1), ('5', 5), ('1000', MAX_PAGE_SIZE)])
+def test_page_size(value, expected):
+    assert page_size(value, 20) == expected
+
+
+def test_message_pages_walk_back_in_time(make_user, make_conversation):
+    user_id = make_user()
+    conversation_id = make_conversation(user_id, [f"message {i}" for i in range(7)])
+
+    pages, cursor = [], None
+    while True:
+        rows, cursor = message_page(conversation_id, before=decode_cursor(cursor), limit=3)
+        pages.append([row.content for row in rows])
+        if cursor is None:
+            break
+
+    # Chaque page est dans l'ordre chronologique, la première est la plus récente.
+    assert pages == [['message 4', 'message 5', 'message 6'], ['message 1', 'message 2', 'message 3'], ['message 0']]
+
+
+def test_message_page_ties_on_timestamp(db_session, make_user, make_conversation):
+    from chatbot_app.models import Message
+    user_id = make_user()
+    conversation_id = make_conversation(user_id)
+    moment = datetime(2025, 1, 1)
+    db_session.add_all([Message(conversation_id=conversation_id, is_user=True, content=str(i), timestamp=moment)
+                        for i in range(5)])
+    db_session.commit()
+
+    first, cursor = message_page(conversation_id, limit=2)
+    second, cursor = message_page(conversation_id, before=decode_cursor(cursor), limit=2)
+    third, cursor = message_page(conversation_id, before=decode_cursor(cursor), limit=2)
+
+    seen = [row.content for row in third + second + first]
+    assert sorted(seen) == ['0', '1', '2', '3', '4'] and cursor is None
+
+
+def test_conversation_pages(make_user, make_conversation):
+    user_id = make_user()
+    other_id = make_user('autre@example.com')
+    start = datetime(2025, 1, 1)
+    ids = [make_conversation(user_id, [f"question {i}", f"réponse {i}"], updated_at=start + timedelta(hours=i))
+           for i in range(5)]
+    make_conversation(other_id, ["pas à moi"])
+
+    rows, cursor = conversation_page(user_id, limit=3)
+    assert [row.id for row in rows] == ids[:1:-1]
+    assert rows[0].message_count == 2
+    assert rows[0].last_message == "réponse 4"
+
+    rows, cursor = conversation_page(user_id, after=decode_cursor(cursor), limit=3)
+    assert [row.id for row in rows] == ids[1::-1]
+    assert cursor is None
+
+
+def test_user_history_stats(make_user, make_conversation):
+    user_id = make_user()
+    make_conversation(user_id, ["a", "b", "c"])
+    make_conversation(user_id)
+
+    assert user_history_stats(user_id) == {'conversations': 2, 'messages': 3}
@@ -0,0 +1,185 @@
+# Fichier: tests/test_reloader.py
+import os
+import threading
+import time
+
+import pytest
+
+from chatbot_app.reloader import IndexGeneration, IndexReloader
+from chatbot_app.store import INDEX_FILE
+
+
+class FakeDocstore:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.docstore = FakeDocstore()
+        self.index = object()
+
+
+# --- IndexGeneration ---
+
+def test_retired_generation_is_freed_after_its_last_reader():
+    vector_store = FakeVectorStore()
+    generation = IndexGeneration(vector_store, 'v1')
+    assert generation.acquire() and generation.acquire()
+
+    generation.retire()
+    assert generation.vector_store is vector_store
+    generation.release()
+    assert generation.vector_store is vector_store and not vector_store.docstore.closed
+    generation.release()
+
+    assert generation.vector_store is None
+    assert vector_store.docstore.closed and vector_store.index is None
+    # Une requête arrivée après la libération relit la génération courante.
+    assert not generation.acquire()
+
+
+def test_unused_generation_is_freed_on_retire():
+    vector_store = FakeVectorStore()
+    generation = IndexGeneration(vector_store, 'v1')
+    generation.acquire()
+    generation.release()
+    assert not vector_store.docstore.closed
+
+    generation.retire()
+
+    assert generation.vector_store is None and vector_store.docstore.closed
+
+
+# --- IndexReloader ---
+
+class BlockingService:
+    """Service dont reload_index() attend 'proceed' ; enregistre les appels."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+        self.fail = fail
+        self.index = IndexGeneration(FakeVectorStore(), 'v1')
+
+    def reload_index(self, rebuild=False):
+        self.calls.append(rebuild)
+        self.started.set()
+        assert self.proceed.wait(5)
+        if self.fail:
+            raise RuntimeError("index illisible")
+        return None, True
+
+
+def wait_idle(reloader):
+    deadline = time.monotonic() + 5
+    while reloader._thread is not None:
+        assert time.monotonic() < deadline, "le rechargement ne s'est pas terminé"
+        time.sleep(0.01)
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        IndexReloader(BlockingService(), mode='auto')
+
+
+def test_trigger_coalesces_requests_during_a_reload():
+    service = BlockingService()
+    reloader = IndexReloader(service)
+
+    assert reloader.trigger()
+    assert service.started.wait(5)
+    assert reloader.status()['running']
+    # Trois demandes pendant le rechargement : un seul autre est enchaîné,
+    # avec reconstruction puisque l'une d'elles la demande.
+    assert not reloader.trigger()
+    assert not reloader.trigger(rebuild=True)
+    assert not reloader.trigger()
+    service.proceed.set()
+    wait_idle(reloader)
+
+    assert service.calls == [False, True]
+    status = reloader.status()
+    assert status['reloads'] == 2 and not status['running']
+    assert status['last_error'] is None and status['index_version'] == 'v1'
+
+    assert reloader.trigger()
+    wait_idle(reloader)
+    assert service.calls == [False, True, False]
+
+
+def test_failed_reload_is_reported():
+    service = BlockingService(fail=True)
+    service.proceed.set()
+    reloader = IndexReloader(service)
+
+    with pytest.raises(RuntimeError):
+        reloader.reload()
+    assert reloader.trigger()
+    wait_idle(reloader)
+
+    status = reloader.status()
+    assert status['last_error'] == "index illisible"
+    assert status['reloads'] == 0 and not status['running']
+
+
+# --- RAGService.reload_index ---
+
+@pytest.fixture
+def service(tmp_path, monkeypatch, app):
+    """RAGService à part, sur son propre index : les rechargements ne touchent pas celui des autres tests."""
+    from chatbot_app.rag_service import RAGService
+    monkeypatch.setenv('RAG_INDEX_DIR', str(tmp_path / 'db_faiss'))
+    service = RAGService()
+    yield service
+    service.index.retire()
+
+
+def bump_index_version(service):
+    path = os.path.join(service.DB_FAISS_PATH, INDEX_FILE)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_reload_without_changes_keeps_the_generation(service):
+    generation = service.index
+    service.answer_cache.put("Où payer les frais ?", None, "À la banque.", index_version=generation.version)
+
+    report, swapped = service.reload_index(rebuild=True)
+
+    assert not swapped
+    assert report['added'] == 0 and report['removed'] == 0
+    assert service.index is generation and generation.vector_store is not None
+    assert service.answer_cache.stats()['entries'] == 1
+
+
+def test_swap_frees_held_generation_on_release(service):
+    previous = service.index
+    invalidations = service.answer_cache.invalidations
+    service.answer_cache.put("Où payer les frais ?", None, "À la banque.", index_version=previous.version)
+    held = service._acquire_index()
+    assert held is previous
+    old_store = previous.vector_store
+
+    bump_index_version(service)
+    report, swapped = service.reload_index()
+
+    assert swapped and report is None
+    assert service.index is not previous and service.index.version != previous.version
+    # La recherche en cours garde l'ancien index jusqu'à release().
+    assert previous.vector_store is old_store
+    assert old_store.docstore.search(0) is not None
+    # Nouvelle version : les réponses en cache sont obsolètes.
+    assert service.answer_cache.invalidations == invalidations + 1
+    assert service.answer_cache.stats()['entries'] == 0
+
+    previous.release()
+    assert previous.vector_store is None and old_store.index is None
+    generation = service._acquire_index()
+    assert generation is service.index
+    generation.release()
+    assert service.ask("Qu'est-ce que le TFC ?")
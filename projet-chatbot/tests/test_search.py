@@ -0,0 +1,59 @@
+# Fichier: tests/test_search.py
+from chatbot_app.search import (SEARCH_MAX_RESULTS, _fts5_query, decode_search_cursor, encode_search_cursor,
+                                highlight, search_messages)
+
+
+def test_fts5_query_requires_owner_and_all_terms():
+    assert _fts5_query(7, "Frais d'inscription") == 'owner : u7 AND content : ("frais"* "d"* "inscription"*)'
+    assert _fts5_query(7, ' ?! ') is None
+
+
+def test_search_cursor():
+    assert decode_search_cursor(encode_search_cursor(40)) == 40
+    assert decode_search_cursor(None) == 0
+    assert decode_search_cursor('abc') is None
+    assert decode_search_cursor(encode_search_cursor(SEARCH_MAX_RESULTS)) is None
+
+
+def test_highlight_escapes_content():
+    assert highlight('<b>\x02frais\x03</b>') == '&lt;b&gt;<mark>frais</mark>&lt;/b&gt;'
+
+
+def test_search_is_limited_to_the_user(make_user, make_conversation):
+    user_id = make_user()
+    other_id = make_user('autre@example.com')
+    mine = make_conversation(user_id, ["Quels sont les frais académiques ?", "Les frais sont de 100 dollars."])
+    make_conversation(other_id, ["Les frais de l'autre utilisateur"])
+
+    rows, next_offset = search_messages(user_id, "frais")
+    assert {row.conversation_id for row in rows} == {mine}
+    assert len(rows) == 2 and next_offset is None
+
+    # Préfixe, sans tenir compte des accents.
+    rows, _ = search_messages(user_id, "academ")
+    assert [row.conversation_id for row in rows] == [mine]
+    assert '<mark>académiques</mark>' in highlight(rows[0].snippet)
+
+    assert search_messages(other_id, "dollars") == ([], None)
+
+
+def test_index_follows_deletes(db_session, make_user, make_conversation):
+    from chatbot_app.models import Conversation, Message
+    user_id = make_user()
+    conversation_id = make_conversation(user_id, ["inscription en licence"])
+
+    assert len(search_messages(user_id, "licence")[0]) == 1
+    db_session.query(Message).filter_by(conversation_id=conversation_id).delete()
+    db_session.query(Conversation).filter_by(id=conversation_id).delete()
+    db_session.commit()
+    assert search_messages(user_id, "licence") == ([], None)
+
+
+def test_search_pages(make_user, make_conversation):
+    user_id = make_user()
+    make_conversation(user_id, [f"préinscription numéro {i}" for i in range(5)])
+
+    first, next_offset = search_messages(user_id, "preinscription", limit=3)
+    second, last = search_messages(user_id, "preinscription", offset=next_offset, limit=3)
+    assert (len(first), next_offset, len(second), last) == (3, 3, 2, None)
+    assert not {row.id for row in first} & {row.id for row in second}
@@ -0,0 +1,165 @@
+# Fichier: tests/test_store.py
+import json
+import os
+import sqlite3
+
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from chatbot_app.indexer import MANIFEST_NAME
+from chatbot_app.store import (DOCSTORE_FILE, INDEX_FILE, LEGACY_DOCSTORE_FILE, LEXICAL_TABLE, PositionMap,
+                               lexical_index_exists, legacy_store_exists, load_store, save_store, store_exists)
+
+TEXTS = [
+    "Économie de gestion : les frais académiques sont payés à la banque.",
+    "La préinscription se fait en ligne avant le mois de septembre.",
+    "L'infrastructure comprend une bibliothèque et des laboratoires.",
+]
+
+
+@pytest.fixture
+def saved_store(tmp_path, embeddings):
+    directory = str(tmp_path / 'store')
+    vector_store = FAISS.from_texts(TEXTS, embeddings, metadatas=[{'source': f'doc{i}.txt'} for i in range(3)],
+                                    ids=['a', 'b', 'c'])
+    save_store(vector_store, directory)
+    store = load_store(directory, embeddings)
+    yield directory, store
+    store.docstore.close()
+
+
+# --- Docstore SQLite ---
+
+def test_round_trip(saved_store):
+    directory, store = saved_store
+
+    assert store_exists(directory) and not legacy_store_exists(directory)
+    assert lexical_index_exists(directory)
+    assert store.index.ntotal == len(store.docstore) == 3
+    doc = store.docstore.search(1)
+    assert doc.page_content == TEXTS[1]
+    assert doc.metadata == {'source': 'doc1.txt'}
+    assert store.docstore.search(7) == "ID 7 not found."
+
+
+def test_similarity_search_reads_the_docstore(saved_store):
+    _, store = saved_store
+
+    docs = store.similarity_search(TEXTS[2], k=1)
+
+    assert [doc.page_content for doc in docs] == [TEXTS[2]]
+
+
+def test_lexical_search_ignores_accents(saved_store):
+    _, store = saved_store
+
+    assert [position for position, _ in store.docstore.lexical_search('economie', 5)] == [0]
+    assert [position for position, _ in store.docstore.lexical_search('preinscription', 5)] == [1]
+    assert store.docstore.lexical_search('absent', 5) == []
+    results = store.docstore.lexical_search('frais OR bibliotheque', 5)
+    assert sorted(position for position, _ in results) == [0, 2]
+    assert all(score > 0 for _, score in results)
+
+
+def test_docstore_without_lexical_table(saved_store, embeddings):
+    directory, store = saved_store
+    store.docstore.close()
+    conn = sqlite3.connect(os.path.join(directory, DOCSTORE_FILE))
+    with conn:
+        conn.execute(f"DROP TABLE {LEXICAL_TABLE}")
+    conn.close()
+
+    store = load_store(directory, embeddings)
+
+    assert not lexical_index_exists(directory)
+    assert store.docstore.lexical_search('economie', 5) == []
+    assert store.docstore.search(0).page_content == TEXTS[0]
+    store.docstore.close()
+
+
+def test_reopen_detects_a_replaced_file(saved_store, embeddings):
+    directory, store = saved_store
+    assert store.docstore.reopen()
+
+    save_store(FAISS.from_texts(TEXTS[:1], embeddings), directory)
+
+    assert not store.docstore.reopen()
+    # L'ancienne connexion lit toujours l'ancien fichier.
+    assert store.docstore.search(2).page_content == TEXTS[2]
+
+
+def test_position_map():
+    positions = PositionMap(3)
+
+    assert list(positions) == [0, 1, 2] and len(positions) == 3
+    assert positions[2] == 2
+    with pytest.raises(KeyError):
+        positions[3]
+
+
+# --- Conversion des anciens index et mise à niveau ---
+
+def build_legacy_index(index_dir, knowledge_base, embeddings):
+    """Ancien format (FAISS.save_local : index.faiss + index.pkl), un chunk par paragraphe."""
+    texts, metadatas = [], []
+    sources = {
+        'frais.txt': str(knowledge_base / 'frais.txt'),                                      # chemin exact
+        'inscription.txt': 'C:\\ancien_serveur\\knowledge_base\\inscription.txt',            # autre machine
+        'sous/historique.md': '/srv/chatbot/knowledge_base/sous/historique.md',
+    }
+    for relative_path, source in sources.items():
+        for paragraph in (knowledge_base / relative_path).read_text(encoding='utf-8').split('\n\n'):
+            texts.append(paragraph)
+            metadatas.append({'source': source})
+    texts.append("Chunk d'un fichier supprimé depuis.")
+    metadatas.append({'source': str(knowledge_base / 'supprime.txt')})
+    FAISS.from_texts(texts, embeddings, metadatas=metadatas).save_local(index_dir)
+
+
+def test_legacy_index_is_converted_without_embedding(make_indexer, knowledge_base, embeddings,
+                                                     counting_embeddings):
+    indexer = make_indexer()
+    build_legacy_index(indexer.index_dir, knowledge_base, embeddings)
+    assert legacy_store_exists(indexer.index_dir)
+
+    report = indexer.update()
+
+    assert counting_embeddings.embedded == 0
+    assert (report['added'], report['removed'], report['unchanged']) == (0, 0, 13)
+    assert not os.path.exists(os.path.join(indexer.index_dir, LEGACY_DOCSTORE_FILE))
+    assert store_exists(indexer.index_dir) and lexical_index_exists(indexer.index_dir)
+    with open(os.path.join(indexer.index_dir, MANIFEST_NAME), encoding='utf-8') as f:
+        files = json.load(f)['files']
+    assert {path: len(entry['chunks']) for path, entry in files.items()} == {
+        'frais.txt': 4, 'inscription.txt': 6, 'sous/historique.md': 3}
+
+    store = load_store(indexer.index_dir, embeddings)
+    try:
+        assert store.index.ntotal == len(store.docstore) == 13
+        # Les vecteurs sont ceux de l'ancien index, les sources pointent vers la base actuelle.
+        doc = store.similarity_search(knowledge_base.joinpath('inscription.txt').read_text(
+            encoding='utf-8').split('\n\n')[3], k=1)[0]
+        assert doc.metadata['source'] == str(knowledge_base / 'inscription.txt')
+    finally:
+        store.docstore.close()
+
+    report = indexer.update()
+    assert (report['added'], report['removed']) == (0, 0)
+    assert counting_embeddings.embedded == 0
+
+
+def test_docstore_without_lexical_table_is_upgraded(make_indexer, counting_embeddings):
+    indexer = make_indexer()
+    indexer.update()
+    conn = sqlite3.connect(os.path.join(indexer.index_dir, DOCSTORE_FILE))
+    with conn:
+        conn.execute(f"DROP TABLE {LEXICAL_TABLE}")
+    conn.close()
+    counting_embeddings.embedded = 0
+
+    report = indexer.update()
+
+    assert (report['added'], report['removed']) == (0, 0)
+    assert counting_embeddings.embedded == 0
+    assert lexical_index_exists(indexer.index_dir)
+    assert os.path.exists(os.path.join(indexer.index_dir, INDEX_FILE))